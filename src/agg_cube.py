@@ -0,0 +1,223 @@
+#!/bin/env python
+
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from quantile_sketch import KLLSketch, DEFAULT_K
+from analyze_extracted import test_fexist, read_input
+
+CUBE_NAME = 'aggregated_cube.json'
+DIMENSIONS = ['final_category', 'is_unittested', 'assigned_category', 'bucket']
+MEASURES = ['lines_modified', 'num_revisions', 'num_comments', 'upload_push_timediff']
+FREQS = ['M', 'Q', 'Y']
+STATS = ['count', 'sum', 'mean', 'median', 'q1', 'q3']
+NA_KEY = 'NA'
+
+
+def date_bucket(dates, freq):
+    periods = pd.to_datetime(dates, errors='coerce').dt.to_period(freq)
+    return periods.astype(str).where(periods.notnull(), NA_KEY)
+
+
+class AggCube:
+    """
+    Pre-aggregated counts, sums and quantile sketches per cell of
+    final_category x is_unittested x assigned_category x date bucket
+
+    Cells only ever grow, so new commits are folded in without touching
+    the rows seen before. Hashes already folded in are remembered so the
+    same commit is never counted twice.
+    """
+
+    def __init__(self, freq='Q', k=DEFAULT_K):
+        self.freq = freq
+        self.k = k
+        self.cells = {}
+        self.seen = set()
+
+    def new_cell(self):
+        return {'count': 0,
+                'sums': {m: 0.0 for m in MEASURES},
+                'sketches': {m: KLLSketch(self.k) for m in MEASURES}}
+
+    def fold(self, df):
+        """
+        Add preprocessed rows (see analyze_extracted.preprocess) to the cube
+
+        Returns:
+            number of rows that were new to the cube
+        """
+        df = df[~df['hash'].isin(self.seen)].drop_duplicates('hash')
+        if len(df) == 0:
+            return 0
+        keys = pd.DataFrame({
+            'final_category': df['final_category'].fillna(NA_KEY).astype(str),
+            'is_unittested': df['is_unittested'].fillna(NA_KEY).astype(str),
+            'assigned_category': df['assigned_category'].fillna(NA_KEY).astype(str),
+            'bucket': date_bucket(df['date'], self.freq)}, index=df.index)
+
+        for key, idx in keys.groupby(DIMENSIONS).groups.items():
+            cell = self.cells.setdefault(tuple(key), self.new_cell())
+            part = df.loc[idx]
+            cell['count'] += len(part)
+            for m in MEASURES:
+                values = pd.to_numeric(part[m], errors='coerce').values
+                cell['sums'][m] += float(np.nansum(values))
+                cell['sketches'][m].update(values)
+        self.seen.update(df['hash'].values)
+        return len(df)
+
+    def select(self, **filters):
+        """
+        Cells matching the filters
+
+        Args:
+            filters: dimension=value or dimension=[values]; `bucket_from` and
+                `bucket_to` give an inclusive bucket range
+        """
+        bucket_from = filters.pop('bucket_from', None)
+        bucket_to = filters.pop('bucket_to', None)
+        wanted = {}
+        for dim, value in filters.items():
+            if dim not in DIMENSIONS:
+                raise ValueError('unknown dimension %s' % dim)
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            wanted[DIMENSIONS.index(dim)] = set(str(v) for v in values)
+
+        cells = []
+        for key, cell in self.cells.items():
+            if any(key[pos] not in values for pos, values in wanted.items()):
+                continue
+            if bucket_from is not None and key[3] < bucket_from:
+                continue
+            if bucket_to is not None and key[3] > bucket_to:
+                continue
+            cells.append(cell)
+        return cells
+
+    def query(self, metric, stat, **filters):
+        cells = self.select(**filters)
+        count = sum(c['count'] for c in cells)
+        if stat == 'count':
+            return count
+        if metric not in MEASURES:
+            raise ValueError('metric %s is not aggregated in the cube' % metric)
+        if stat == 'sum':
+            return sum(c['sums'][metric] for c in cells)
+        if stat == 'mean':
+            return sum(c['sums'][metric] for c in cells) / count if count else np.nan
+
+        sketch = KLLSketch(self.k)
+        for c in cells:
+            sketch.merge(c['sketches'][metric])
+        if stat == 'median':
+            return sketch.median()
+        if stat == 'q1':
+            return sketch.quantile(0.25)
+        if stat == 'q3':
+            return sketch.quantile(0.75)
+        raise ValueError('unknown statistic %s' % stat)
+
+    def unittest_ratio(self, **filters):
+        total = self.query(None, 'count', **filters)
+        if total == 0:
+            return np.nan
+        filters['is_unittested'] = True
+        return round(self.query(None, 'count', **filters) / total, 4)
+
+    def to_dict(self):
+        cells = []
+        for key, cell in self.cells.items():
+            cells.append({'key': list(key), 'count': cell['count'], 'sums': cell['sums'],
+                          'sketches': {m: s.to_dict() for m, s in cell['sketches'].items()}})
+        return {'freq': self.freq, 'k': self.k, 'seen': sorted(self.seen), 'cells': cells}
+
+    @classmethod
+    def from_dict(cls, d):
+        cube = cls(d['freq'], d['k'])
+        cube.seen = set(d['seen'])
+        for c in d['cells']:
+            cube.cells[tuple(c['key'])] = {
+                'count': c['count'], 'sums': c['sums'],
+                'sketches': {m: KLLSketch.from_dict(s) for m, s in c['sketches'].items()}}
+        return cube
+
+
+def cube_path(res_dir):
+    return res_dir + '/' + CUBE_NAME
+
+
+def load_cube(res_dir):
+    assert(test_fexist(cube_path(res_dir)))
+    with open(cube_path(res_dir), 'r') as f:
+        return AggCube.from_dict(json.load(f))
+
+
+def save_cube(res_dir, cube):
+    # write to a temporary file first so a crash never leaves a truncated cube
+    tmp_path = cube_path(res_dir) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cube.to_dict(), f)
+    os.replace(tmp_path, cube_path(res_dir))
+
+
+def update_cube(res_dir, df, freq='Q'):
+    if os.path.exists(cube_path(res_dir)):
+        cube = load_cube(res_dir)
+    else:
+        cube = AggCube(freq)
+    num_new = cube.fold(df)
+    save_cube(res_dir, cube)
+    return cube, num_new
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query the aggregate cube')
+    sub = parser.add_subparsers(dest='cmd')
+
+    build = sub.add_parser('build', help='build the cube from scratch')
+    build.add_argument('infile', type=str, help='aggregated_result.csv')
+    build.add_argument('res_dir', type=str, help='result directory the cube is stored in')
+    build.add_argument('--freq', type=str, default='Q', choices=FREQS, help='date bucket size')
+
+    update = sub.add_parser('update', help='fold newly preprocessed commits into the cube')
+    update.add_argument('infile', type=str, help='preprocessed csv with the new commits')
+    update.add_argument('res_dir', type=str, help='result directory the cube is stored in')
+
+    query = sub.add_parser('query', help='query the cube')
+    query.add_argument('res_dir', type=str, help='result directory the cube is stored in')
+    query.add_argument('--metric', type=str, choices=MEASURES)
+    query.add_argument('--stat', type=str, default='count', choices=STATS + ['unittest_ratio'])
+    for dim in DIMENSIONS:
+        query.add_argument('--' + dim, type=str, nargs='+')
+    query.add_argument('--bucket_from', type=str)
+    query.add_argument('--bucket_to', type=str)
+    args = parser.parse_args()
+
+    if args.cmd == 'build':
+        cube = AggCube(args.freq)
+        num_new = cube.fold(read_input(args.infile))
+        save_cube(args.res_dir, cube)
+        print('cube built from %d commits, %d cells' % (num_new, len(cube.cells)))
+    elif args.cmd == 'update':
+        cube, num_new = update_cube(args.res_dir, read_input(args.infile))
+        print('folded %d new commits, %d cells' % (num_new, len(cube.cells)))
+    elif args.cmd == 'query':
+        cube = load_cube(args.res_dir)
+        filters = {}
+        for name in DIMENSIONS + ['bucket_from', 'bucket_to']:
+            value = getattr(args, name)
+            if value is not None:
+                filters[name] = value
+        if args.stat == 'unittest_ratio':
+            print(cube.unittest_ratio(**filters))
+        else:
+            print(cube.query(args.metric, args.stat, **filters))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,13 @@ from pandas.plotting import scatter_matrix
 import numpy as np
 import argparse
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
 import os
 from scipy import stats
-from datetime import datetime
 from issue_report import IssueReport
+from profiling import profile_step
+import profiling
+from sig_tests import spearman_matrix_by, NUMERIC_VARS
 
 # list of columns we want box plot
 BOX_COLUMNS = ['lines_added', 'lines_removed', 'lines_modified', 'num_revisions',
@@ -28,11 +31,28 @@ COL_MAP = {'lines_added': 'Added LOC',
            'num_revisions': 'Revisions',
            'lines_modified': 'Modified LOC',
            'num_comments': 'Code Review Comments',
-           'upload_push_timediff': 'Time in Review'
+           'upload_push_timediff': 'Time in Review',
+           'num_msg': 'Messages',
+           'num_unresolved_comments': 'Unresolved Comments'
            }
 
 UTEST_MAP = {'unittested': 'Unit Tested', 'non_unittested': 'Not Unit Tested'}
 
+# scatter plots switch to density rendering above this many rows
+LARGE_DATA_ROWS = 100000
+# bins per axis for density (2D histogram) rendering
+DENSITY_BINS = 200
+# rows kept when a large frame is downsampled for point plots
+SAMPLE_ROWS = 20000
+SAMPLE_SEED = 11235
+SCATTER_MODES = ['auto', 'points', 'density', 'sample']
+
+# all: preprocess and plot, preprocess: only write aggregated_result.csv,
+# figures: plot from an already preprocessed aggregated_result.csv
+STAGES = ['all', 'preprocess', 'figures']
+# time values get_time_delta skips: the -1 placeholder and NaN as a string
+MISSING_TIMES = ['-1', 'nan', 'NaN', 'NaT', 'None', '']
+
 
 def test_fexist(fpath):
     if os.path.exists(fpath):
@@ -41,6 +61,7 @@ def test_fexist(fpath):
     return False
 
 
+@profile_step
 def read_input(inpath):
     assert (test_fexist(inpath))
     # read input file as pandas dataframe
@@ -49,6 +70,7 @@ def read_input(inpath):
     return df
 
 
+@profile_step
 def get_rater_relibility(df):
     cols = df.columns
     if 'bug' not in cols or 'disagreement' not in cols:
@@ -83,20 +105,21 @@ def get_rater_relibility(df):
 def get_time_delta(series1, series2):
     assert(series1.size == series2.size)
     time_format = "%Y-%m-%d %H:%M:%S"
-    time_diff_list = []
-    for index, time_value_1 in series1.iteritems():
-        if time_value_1 == '-1':
-            print('Warning: time %s not available, skipping' % time_value_1)
-            time_diff_list.append(-1)
-            continue
-        time_obj_1 = datetime.strptime(time_value_1, time_format)
-        time_value_2 = series2.loc[index]
-        time_obj_2 = datetime.strptime(time_value_2, time_format)
-
-        # time difference in days
-        timediff = abs(time_obj_1 - time_obj_2).total_seconds()/60/60/24
-        # round timediff to int
-        time_diff_list.append(round(timediff))
+    # both come from the same frame, rows line up by position
+    text_1 = series1.astype(str).values
+    text_2 = series2.astype(str).values
+    # -1 marks times gerrit did not return, empty fields read back as NaN
+    missing = (np.isin(text_1, MISSING_TIMES) | np.isin(text_2, MISSING_TIMES)
+               | series1.isnull().values | series2.isnull().values)
+    if missing.any():
+        print('Warning: time not available for %d commits, skipping' % missing.sum())
+    time_1 = pd.to_datetime(text_1[~missing], format=time_format)
+    time_2 = pd.to_datetime(text_2[~missing], format=time_format)
+
+    # time difference in days, rounded to int (half to even, like round())
+    timediff = np.abs((time_1 - time_2).values / np.timedelta64(1, 'D'))
+    time_diff_list = np.full(series1.size, -1, dtype=np.int64)
+    time_diff_list[~missing] = np.round(timediff)
     return time_diff_list
 
 
@@ -134,6 +157,7 @@ def to_category_reports(df):
     return reports
 
 
+@profile_step
 def plot_num_revisions(res_dir, reports):
     data = [r.num_revisions() for r in reports.values()]
 
@@ -150,6 +174,7 @@ def plot_num_revisions(res_dir, reports):
     plt.close()
 
 
+@profile_step
 def plot_upload_push_timediff(res_dir, reports):
     data = [r.upush_timediff() for r in reports.values()]
 
@@ -168,6 +193,7 @@ def plot_upload_push_timediff(res_dir, reports):
     plt.close()
 
 
+@profile_step
 def plot_unittest_ratio(res_dir, reports):
     data = [r.unittest_ratio() for r in reports.values()]
     num_tested = [r.num_unittested() for r in reports.values()]
@@ -193,6 +219,7 @@ def plot_unittest_ratio(res_dir, reports):
     plt.close()
 
 
+@profile_step
 def plot_lines_modified(res_dir, reports):
     data = [r.lines_modified() for r in reports.values()]
 
@@ -209,6 +236,7 @@ def plot_lines_modified(res_dir, reports):
     plt.close()
 
 
+@profile_step
 def plot_lines_removed(res_dir, reports):
     data = [r.lines_removed() for r in reports.values()]
 
@@ -225,6 +253,7 @@ def plot_lines_removed(res_dir, reports):
     plt.close()
 
 
+@profile_step
 def plot_lines_added(res_dir, reports):
     data = [r.lines_added() for r in reports.values()]
 
@@ -247,11 +276,79 @@ def clean_null(df):
     return cleandf
 
 
-def pairwise_corr_plot(res_dir, df):
+def pick_scatter_mode(df, mode, threshold):
+    if mode != 'auto':
+        return mode
+    if len(df) > threshold:
+        return 'density'
+    return 'points'
+
+
+def stratified_sample(df, num_rows, strata='final_category', seed=SAMPLE_SEED):
+    if len(df) <= num_rows:
+        return df
+    if strata not in df.columns:
+        return df.sample(n=num_rows, random_state=seed)
+
+    # keep the same fraction of every stratum so small categories survive
+    frac = num_rows / len(df)
+    parts = []
+    for _, group in df.groupby(strata):
+        parts.append(group.sample(frac=frac, random_state=seed))
+    return pd.concat(parts)
+
+
+def density_grid(x, y, bins=DENSITY_BINS):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    counts, xedges, yedges = np.histogram2d(x[finite], y[finite], bins=bins)
+    return counts, xedges, yedges
+
+
+def density_plot(ax, x, y, bins=DENSITY_BINS):
+    counts, xedges, yedges = density_grid(x, y, bins)
+    # empty cells stay blank, counts are log scaled since LOC/time are skewed
+    masked = np.ma.masked_equal(counts.T, 0)
+    if masked.count() == 0:
+        return None
+    return ax.pcolormesh(xedges, yedges, masked, norm=LogNorm(), cmap='viridis', rasterized=True)
+
+
+def density_matrix(df, attrs, bins=DENSITY_BINS):
+    num_attrs = len(attrs)
+    fig, axes = plt.subplots(num_attrs, num_attrs, figsize=FIG_SIZE)
+    for i, row_attr in enumerate(attrs):
+        for j, col_attr in enumerate(attrs):
+            ax = axes[i, j]
+            col = df[col_attr].values.astype(float)
+            if i == j:
+                col = col[np.isfinite(col)]
+                counts, edges = np.histogram(col, bins=bins)
+                ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge')
+            else:
+                density_plot(ax, col, df[row_attr].values, bins)
+            ax.tick_params(labelsize=6)
+            if i == num_attrs - 1:
+                ax.set_xlabel(col_attr)
+            if j == 0:
+                ax.set_ylabel(row_attr)
+    return fig
+
+
+@profile_step
+def pairwise_corr_plot(res_dir, df, mode='auto', threshold=LARGE_DATA_ROWS, sample_rows=SAMPLE_ROWS):
     attrs = ['lines_modified', 'lines_added', 'lines_removed', 'num_comments', 'num_revisions',
              'upload_push_timediff']
 
-    scatter_matrix(df[attrs], figsize=FIG_SIZE)
+    mode = pick_scatter_mode(df, mode, threshold)
+    if mode == 'density':
+        density_matrix(df, attrs)
+    elif mode == 'sample':
+        sampled = stratified_sample(df, sample_rows)
+        scatter_matrix(sampled[attrs], figsize=FIG_SIZE, rasterized=True)
+    else:
+        scatter_matrix(df[attrs], figsize=FIG_SIZE)
     image_name = res_dir + '/' + 'pairwise_scatter.png'
     plt.savefig(image_name)
     plt.close()
@@ -267,9 +364,21 @@ def format_ax_lab(key, unit):
     return "{} ({})".format(key_explain, unit)
 
 
-def scatter_plot(res_dir, key1, unit1, key2, unit2, df):
+@profile_step
+def scatter_plot(res_dir, key1, unit1, key2, unit2, df, mode='auto', threshold=LARGE_DATA_ROWS,
+                 sample_rows=SAMPLE_ROWS):
+    mode = pick_scatter_mode(df, mode, threshold)
     fig, ax = plt.subplots(figsize=FIG_SIZE)
-    ax.scatter(df[key1], df[key2])
+    if mode == 'density':
+        mesh = density_plot(ax, df[key1].values, df[key2].values)
+        if mesh is not None:
+            fig.colorbar(mesh, ax=ax).set_label('Commits', fontsize=YLAB_SIZE)
+    elif mode == 'sample':
+        sampled = stratified_sample(df, sample_rows)
+        ax.scatter(sampled[key1], sampled[key2], rasterized=True)
+    else:
+        # rasterize the point layer once there are too many markers for vector output
+        ax.scatter(df[key1], df[key2], rasterized=len(df) > threshold)
     xlab = format_ax_lab(key1, unit1)
     ylab = format_ax_lab(key2, unit2)
     ax.set_xlabel(xlab, fontsize=XLAB_SIZE)
@@ -281,6 +390,41 @@ def scatter_plot(res_dir, key1, unit1, key2, unit2, df):
     plt.close()
 
 
+@profile_step
+def plot_corr_heatmap(res_dir, corr, pvals, name):
+    labels = [COL_MAP.get(c, c) for c in corr.columns]
+
+    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    im = ax.imshow(corr.values, cmap='RdBu_r', vmin=-1, vmax=1)
+    fig.colorbar(im, ax=ax)
+    ax.set_xticks(np.arange(len(labels)))
+    ax.set_yticks(np.arange(len(labels)))
+    ax.set_xticklabels(labels, rotation=45, ha='right')
+    ax.set_yticklabels(labels)
+
+    # mark correlations significant at 0.05
+    for i in range(len(labels)):
+        for j in range(len(labels)):
+            star = '*' if pvals.values[i, j] < 0.05 else ''
+            ax.text(j, i, '%.2f%s' % (corr.values[i, j], star), ha='center', va='center', fontsize=10)
+    fig.tight_layout()
+
+    image_name = res_dir + '/' + name + '.png'
+    plt.savefig(image_name)
+    plt.close()
+
+
+@profile_step
+def get_corr_heatmaps(res_dir, df, by=None):
+    matrices = spearman_matrix_by(df, NUMERIC_VARS, by)
+    for group, (corr, pvals) in matrices.items():
+        name = 'spearman_heatmap'
+        if group != 'all':
+            name = name + '_' + str(group)
+        plot_corr_heatmap(res_dir, corr, pvals, name)
+    return matrices
+
+
 def get_unittested_vs_non(df):
     unittested = to_reports('is_unittested', True, df)
 
@@ -297,6 +441,7 @@ def get_unittested_vs_non(df):
     return reports
 
 
+@profile_step
 def plot_ifunittested_timediff(res_dir, reports):
     assert(reports is not None and len(reports) != 0)
     data = [r.upush_timediff() for r in reports.values()]
@@ -315,6 +460,7 @@ def plot_ifunittested_timediff(res_dir, reports):
     plt.close()
 
 
+@profile_step
 def plot_ifunittested_num_comments(res_dir, reports):
     assert(reports is not None and len(reports) != 0)
     data = [r.num_comments() for r in reports.values()]
@@ -333,6 +479,7 @@ def plot_ifunittested_num_comments(res_dir, reports):
     plt.close()
 
 
+@profile_step
 def plot_ifunittested_num_revisions(res_dir, reports):
     assert(reports is not None and len(reports) != 0)
     data = [r.num_revisions() for r in reports.values()]
@@ -351,13 +498,19 @@ def plot_ifunittested_num_revisions(res_dir, reports):
     plt.close()
 
 
-def preprocess(res_dir, df):
+@profile_step
+def preprocess(res_dir, df, keep_distinct=False):
     # drop "OTHER", these are all just git merges
     df = df[df['final_category'] != 'OTHER']
 
     # remove issue reports that are not accessible
     df = clean_null(df)
 
+    # cherry-picks and repeats of one change (get_stat.py --dedup) count once;
+    # after clean_null, so a group is not lost when its first commit is unlabeled
+    if 'dup_group' in df.columns and not keep_distinct:
+        df = df.drop_duplicates('dup_group')
+
     df['lines_modified'] = get_lines_modified(df)
 
     # get time difference upload to push
@@ -371,20 +524,23 @@ def preprocess(res_dir, df):
     return df
 
 
-def get_scatter_plots(res_dir, df):
-    pairwise_corr_plot(res_dir, df)
+@profile_step
+def get_scatter_plots(res_dir, df, mode='auto', threshold=LARGE_DATA_ROWS, sample_rows=SAMPLE_ROWS):
+    opts = {'mode': mode, 'threshold': threshold, 'sample_rows': sample_rows}
+    pairwise_corr_plot(res_dir, df, **opts)
 
-    scatter_plot(res_dir, 'lines_modified', 'LOC', 'num_comments', '', df)
-    scatter_plot(res_dir, 'lines_modified', 'LOC', 'num_revisions', '', df)
-    scatter_plot(res_dir, 'lines_modified', 'LOC', 'upload_push_timediff', 'days', df)
-    scatter_plot(res_dir, 'lines_added', 'LOC', 'upload_push_timediff', 'days', df)
-    scatter_plot(res_dir, 'lines_added', 'LOC', 'num_comments', '', df)
-    scatter_plot(res_dir, 'num_revisions', '', 'upload_push_timediff', 'days', df)
-    scatter_plot(res_dir, 'num_comments', '', 'upload_push_timediff', 'days', df)
-    scatter_plot(res_dir, 'num_comments', '', 'num_revisions', '', df)
+    scatter_plot(res_dir, 'lines_modified', 'LOC', 'num_comments', '', df, **opts)
+    scatter_plot(res_dir, 'lines_modified', 'LOC', 'num_revisions', '', df, **opts)
+    scatter_plot(res_dir, 'lines_modified', 'LOC', 'upload_push_timediff', 'days', df, **opts)
+    scatter_plot(res_dir, 'lines_added', 'LOC', 'upload_push_timediff', 'days', df, **opts)
+    scatter_plot(res_dir, 'lines_added', 'LOC', 'num_comments', '', df, **opts)
+    scatter_plot(res_dir, 'num_revisions', '', 'upload_push_timediff', 'days', df, **opts)
+    scatter_plot(res_dir, 'num_comments', '', 'upload_push_timediff', 'days', df, **opts)
+    scatter_plot(res_dir, 'num_comments', '', 'num_revisions', '', df, **opts)
     return
 
 
+@profile_step
 def get_class_plots(res_dir, df):
     reports = to_category_reports(df)
 
@@ -401,6 +557,7 @@ def get_class_plots(res_dir, df):
     return
 
 
+@profile_step
 def get_unit_plots(res_dir, df):
     reports = get_unittested_vs_non(df)
     # upload_push_timediff vs. unittested/non_unittested
@@ -412,6 +569,7 @@ def get_unit_plots(res_dir, df):
     return
 
 
+@profile_step
 def plot_orig_category(res_dir, df):
     assign_cats = df['assigned_category'].value_counts()
     cat_index = assign_cats.index
@@ -441,6 +599,7 @@ def plot_orig_category(res_dir, df):
     return
 
 
+@profile_step
 def plot_misclass_for(cat, right_class, mis_class, res_dir):
     mis_values = mis_class['final_category'].value_counts()
     right_values = right_class['final_category'].value_counts()
@@ -478,6 +637,7 @@ def plot_misclass_for(cat, right_class, mis_class, res_dir):
     plt.close()
 
 
+@profile_step
 def plot_misclassification(res_dir, df):
     assign_cats_index = df['assigned_category'].value_counts().index
     reports = {}
@@ -498,13 +658,42 @@ def main():
     parser = argparse.ArgumentParser(description='Read an extracted csv and analyze it')
     parser.add_argument('infile', type=str, help='input csv containing extracted stats')
     parser.add_argument('res_dir', type=str, help='result directory')
+    parser.add_argument('--scatter-mode', type=str, default='auto', choices=SCATTER_MODES,
+                        help='scatter rendering: points, density (2D histogram) or stratified sample; '
+                             'auto picks density above --large-threshold rows')
+    parser.add_argument('--large-threshold', type=int, default=LARGE_DATA_ROWS,
+                        help='row count above which scatter plots use the large-data mode')
+    parser.add_argument('--sample-rows', type=int, default=SAMPLE_ROWS,
+                        help='rows kept by the stratified sample mode')
+    parser.add_argument('--corr-by', type=str, default=None,
+                        help='also draw a Spearman heatmap for every value of this column')
+    parser.add_argument('--stage', type=str, default='all', choices=STAGES,
+                        help='run only preprocessing, or only the figures on preprocessed input')
+    parser.add_argument('--keep-distinct', action='store_true',
+                        help='keep commits of the same dup_group as separate rows')
+    parser.add_argument('--profile', action='store_true',
+                        help='record time and peak memory per step in res_dir/profile_report.txt')
+    parser.add_argument('--cprofile', action='store_true',
+                        help='with --profile, also dump cProfile stats to res_dir/profile.pstats')
     args = parser.parse_args()
 
+    if args.profile:
+        profiling.enable(use_cprofile=args.cprofile)
+    try:
+        analyze(args)
+    finally:
+        profiling.finish(args.res_dir)
+
+
+def analyze(args):
     # read extracted stats
     df = read_input(args.infile)
 
     # pre-process data
-    df = preprocess(args.res_dir, df)
+    if args.stage != 'figures':
+        df = preprocess(args.res_dir, df, args.keep_distinct)
+    if args.stage == 'preprocess':
+        return
 
     # get unique issue reports and calculate inter-rater reliability
     agree_perc, unique_reports = get_rater_relibility(df)
@@ -518,7 +707,10 @@ def main():
     plot_misclassification(args.res_dir, unique_reports)
 
     # scatter plot
-    get_scatter_plots(args.res_dir, df)
+    get_scatter_plots(args.res_dir, df, args.scatter_mode, args.large_threshold, args.sample_rows)
+
+    # all-pairs Spearman correlation heatmaps
+    get_corr_heatmaps(args.res_dir, df, args.corr_by)
 
     # distribution across manual classification category
     get_class_plots(args.res_dir, df)
@@ -0,0 +1,122 @@
+#!/bin/env python
+
+import argparse
+import os
+import subprocess
+import time
+from datetime import datetime
+import matplotlib
+matplotlib.use('Agg')
+import pandas as pd
+import analyze_extracted
+import sig_tests
+from gen_synthetic import generate, parse_size
+
+HISTORY_NAME = 'bench_history.csv'
+DEFAULT_SIZES = ['10k', '100k']
+
+
+def code_version():
+    # results are tracked per commit of this repo
+    cp = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                        universal_newlines=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if cp.returncode != 0:
+        return 'unknown'
+    return cp.stdout.strip()
+
+
+def timed(results, name, func, *args):
+    start = time.perf_counter()
+    ret = func(*args)
+    results.append((name, time.perf_counter() - start))
+    print('\t%-40s %10.3f s' % (name, results[-1][1]))
+    return ret
+
+
+def report_metrics(reports):
+    # the IssueReport metrics used by the plots and summaries
+    for r in reports.values():
+        r.median_upush_timediff()
+        r.num_revisions().median()
+        r.lines_modified().median()
+        r.num_comments().median()
+
+
+def unittest_metrics(reports):
+    report_metrics(reports)
+    for r in reports.values():
+        r.num_unittested()
+        r.unittest_ratio()
+
+
+def bench_size(work_dir, size, workers, skip_plots):
+    num_rows = parse_size(size)
+    infile = os.path.join(work_dir, 'synthetic_%s.csv' % size)
+    if not os.path.exists(infile):
+        print('generating %d rows into %s' % (num_rows, infile))
+        generate(infile, num_rows)
+    res_dir = os.path.join(work_dir, 'res_%s' % size)
+    os.makedirs(res_dir, exist_ok=True)
+
+    results = []
+    print('%s rows:' % size)
+    df = timed(results, 'read_input', analyze_extracted.read_input, infile)
+    df = timed(results, 'preprocess', analyze_extracted.preprocess, res_dir, df)
+    reports = timed(results, 'to_category_reports', analyze_extracted.to_category_reports, df)
+    timed(results, 'category report metrics', unittest_metrics, reports)
+    ut_reports = timed(results, 'get_unittested_vs_non', analyze_extracted.get_unittested_vs_non, df)
+    timed(results, 'unittest report metrics', report_metrics, ut_reports)
+
+    if not skip_plots:
+        for name in ['plot_num_revisions', 'plot_upload_push_timediff', 'plot_unittest_ratio',
+                     'plot_lines_modified', 'plot_lines_added', 'plot_lines_removed']:
+            timed(results, name, getattr(analyze_extracted, name), res_dir, reports)
+        timed(results, 'plot_ifunittested_timediff', analyze_extracted.plot_ifunittested_timediff,
+              res_dir, ut_reports)
+        timed(results, 'pairwise_corr_plot', analyze_extracted.pairwise_corr_plot, res_dir, df)
+        timed(results, 'scatter_plot', analyze_extracted.scatter_plot, res_dir,
+              'lines_modified', 'LOC', 'num_comments', '', df)
+        timed(results, 'get_corr_heatmaps', analyze_extracted.get_corr_heatmaps, res_dir, df)
+
+    # every sig_tests block on its own, without the result cache
+    spec = sig_tests.TEST_SPEC + [{'tests': ['spearman_matrix'], 'columns': sig_tests.NUMERIC_VARS}]
+    for entry in spec:
+        name = 'sig_tests %s %s' % ('+'.join(entry['tests']), entry.get('i_var', ''))
+        timed(results, name.strip(), sig_tests.run_spec, df, [entry], workers)
+    return [(size, num_rows, name, seconds) for name, seconds in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis on synthetic datasets')
+    parser.add_argument('work_dir', type=str, help='directory for datasets, figures and history')
+    parser.add_argument('--sizes', type=str, nargs='+', default=DEFAULT_SIZES,
+                        help='dataset sizes, e.g. 10k 100k 1M 10M')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for sig_tests')
+    parser.add_argument('--skip-plots', action='store_true', help='do not time the plot functions')
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    version = code_version()
+    stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = []
+    for size in args.sizes:
+        rows.extend(bench_size(args.work_dir, size, args.workers, args.skip_plots))
+
+    df = pd.DataFrame(rows, columns=['size', 'rows', 'step', 'seconds'])
+    df.insert(0, 'version', version)
+    df.insert(1, 'timestamp', stamp)
+    history_path = os.path.join(args.work_dir, HISTORY_NAME)
+    if os.path.exists(history_path):
+        history = pd.concat([pd.read_csv(history_path), df], ignore_index=True)
+    else:
+        history = df
+    history.to_csv(history_path, index=False)
+
+    # compare with the most recent run of every other version
+    last = history.drop_duplicates(['version', 'size', 'step'], keep='last')
+    table = last.pivot_table(index=['size', 'step'], columns='version', values='seconds')
+    print(table.to_string())
+
+
+if __name__ == '__main__':
+    main()
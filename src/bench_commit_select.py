@@ -0,0 +1,95 @@
+#!/bin/env python
+
+import argparse
+import random
+import re
+import time
+import tracemalloc
+from commit_select import parse_commits
+
+LOG_TEMPLATE = '''commit {hash}
+Author:     Some Developer <dev@chromium.org>
+Commit:     Commit Bot <commit-bot@chromium.org>
+Date:   {date}
+
+    component: change number {i}
+
+    Longer description of the change.
+
+    BUG=chromium:{bug}
+    TEST=unit tests
+
+    Change-Id: I{change_id}
+    Reviewed-on: https://chromium-review.googlesource.com/{review}
+    Reviewed-by: Reviewer <reviewer@chromium.org>
+
+'''
+
+
+def synth_log(num_commits, seed=11235):
+    """ Lines of a synthetic `git log --pretty=full` dump """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(num_commits):
+        entry = LOG_TEMPLATE.format(hash='%040x' % rng.getrandbits(160),
+                                    date='2018-%02d-%02d' % (rng.randint(1, 12), rng.randint(1, 28)),
+                                    i=i, bug=rng.randint(700000, 900000),
+                                    change_id='%040x' % rng.getrandbits(160),
+                                    review=rng.randint(600000, 1200000))
+        lines.extend(entry.splitlines(keepends=True))
+    return lines
+
+
+def parse_commits_dicts(lines):
+    """ The previous representation: one dict of strings per commit """
+    commits = []
+    commit = {}
+    for line in lines:
+        if re.match('commit ', line) is not None:
+            if bool(commit) and None not in commit.values():
+                commits.append(commit)
+                commit = {}
+            commit['hash'] = line.split(' ')[1].split()[0]
+            commit['date'] = None
+            commit['bug'] = None
+            commit['review'] = None
+        if re.match(r'Date:\s+', line) is not None:
+            commit['date'] = line.split()[1].split()[0]
+        if re.match(r'\s+BUG=chromium:', line) is not None:
+            commit['bug'] = 'crbug.com/' + line.split('BUG=chromium:')[1].split()[0]
+        if re.match(r'\s+Reviewed-on: ', line) is not None:
+            commit['review'] = line.split('Reviewed-on: ')[1].split()[0]
+    if bool(commit) and None not in commit.values():
+        commits.append(commit)
+    return commits
+
+
+def measure(parse, lines):
+    # time without tracing, tracemalloc slows down every allocation
+    start = time.perf_counter()
+    parse(lines)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    commits = parse(lines)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return commits, seconds, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory per parsed commit in commit_select')
+    parser.add_argument('--num-commits', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    print('%10s %12s %12s %12s %12s' % ('commits', 'dict B/cmit', 'slot B/cmit', 'dict s', 'slot s'))
+    for n in args.num_commits:
+        lines = synth_log(n)
+        dicts, dict_s, dict_bytes = measure(parse_commits_dicts, lines)
+        slots, slot_s, slot_bytes = measure(lambda l: list(parse_commits(l)), lines)
+        assert([list(d.values()) for d in dicts] == [c.row() for c in slots])
+        print('%10d %12.1f %12.1f %12.3f %12.3f' % (n, dict_bytes / n, slot_bytes / n, dict_s, slot_s))
+
+
+if __name__ == '__main__':
+    main()
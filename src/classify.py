@@ -0,0 +1,298 @@
+#!/bin/env python
+
+import argparse
+import os
+import re
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from dedup import RECORD_SEP, run_batched
+from crbug_enrich import LABEL_SEP
+from compare_projects import rename_columns
+
+LABEL_COL = 'final_category'
+# bug tracker fields, used as whole tokens
+META_COLUMNS = ['assigned_category', 'bug_type', 'bug_status']
+NUMERIC_COLUMNS = ['lines_added', 'lines_removed', 'num_revisions', 'num_comments', 'num_msg',
+                   'num_unresolved_comments', 'hunks', 'functions_touched', 'prior_commits']
+BOOL_COLUMNS = ['is_unittested', 'is_unittest_only']
+TOKEN_RE = re.compile(r'[a-z][a-z0-9_]{1,30}')
+DEFAULT_FEATURES = 2 ** 18
+DEFAULT_ALPHA = 1.0
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_CHUNKSIZE = 20000
+DEFAULT_FOLDS = 5
+CV_SEED = 11235
+PRED_COLUMNS = ['predicted_category', 'confidence', 'needs_review']
+
+
+def commit_messages(repo, hashes):
+    """ hash -> commit message, from one batched git log """
+    out = run_batched(repo, ['git', 'log', '--no-walk=unsorted', '--stdin', '--format=%H%n%B%x00'], hashes)
+    if out is None:
+        return {}
+    messages = {}
+    for record in out.split(RECORD_SEP):
+        record = record.lstrip('\n')
+        if len(record) == 0:
+            continue
+        cmit, _, body = record.partition('\n')
+        messages[cmit] = body
+    return messages
+
+
+def feature_index(token, n_features):
+    # crc32 is the same in every process, unlike hash() of a str
+    return zlib.crc32(token.encode()) % n_features
+
+
+def hashed_tokens(values, prefix, n_features, split):
+    """ (row, column) pairs of the hashed tokens of one text column """
+    rows = []
+    cols = []
+    cache = {}
+    for i, text in enumerate(values):
+        if not isinstance(text, str):
+            continue
+        for token in split(text):
+            idx = cache.get(token)
+            if idx is None:
+                idx = cache[token] = feature_index(prefix + token, n_features)
+            rows.append(i)
+            cols.append(idx)
+    return rows, cols
+
+
+def binned_tokens(values, prefix, n_features):
+    """ (row, column) pairs of numeric values binned by powers of two, negative values are skipped """
+    values = pd.to_numeric(values, errors='coerce').values.astype(float)
+    valid = np.flatnonzero(values >= 0)
+    bins = np.floor(np.log2(values[valid] + 1)).astype(np.int64)
+    uniq, inverse = np.unique(bins, return_inverse=True)
+    lookup = np.array([feature_index('%s%d' % (prefix, b), n_features) for b in uniq], dtype=np.int64)
+    return valid, lookup[inverse]
+
+
+def build_features(df, messages=None, n_features=DEFAULT_FEATURES):
+    """
+    Sparse bag of hashed tokens per commit
+
+    Words of the commit message, bug tracker labels and fields, and the
+    numeric stats binned on a log scale all become tokens of one vocabulary.
+    """
+    parts = []
+    if messages is not None:
+        texts = df['hash'].map(messages)
+        parts.append(hashed_tokens(texts.values, 'msg:', n_features, lambda t: TOKEN_RE.findall(t.lower())))
+    if 'bug_labels' in df.columns:
+        parts.append(hashed_tokens(df['bug_labels'].values, 'label:', n_features, lambda t: t.split(LABEL_SEP)))
+    for col in META_COLUMNS:
+        if col in df.columns:
+            parts.append(hashed_tokens(df[col].values, col + ':', n_features, lambda t: [t]))
+    for col in BOOL_COLUMNS:
+        if col in df.columns:
+            parts.append(hashed_tokens(df[col].astype(str).values, col + ':', n_features, lambda t: [t]))
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            parts.append(binned_tokens(df[col], col + ':', n_features))
+
+    rows = np.concatenate([np.asarray(r, dtype=np.int64) for r, _ in parts] + [np.zeros(0, np.int64)])
+    cols = np.concatenate([np.asarray(c, dtype=np.int64) for _, c in parts] + [np.zeros(0, np.int64)])
+    # duplicate (row, column) pairs are summed into counts
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(df), n_features))
+
+
+class NaiveBayes:
+    """ Multinomial naive Bayes on sparse counts """
+
+    def __init__(self, alpha=DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.classes = None
+        self.class_log_prior = None
+        self.feature_log_prob = None
+
+    def fit(self, X, y):
+        self.classes, y_idx = np.unique(np.asarray(y, dtype=str), return_inverse=True)
+        onehot = sparse.csr_matrix((np.ones(len(y_idx)), (y_idx, np.arange(len(y_idx)))),
+                                   shape=(len(self.classes), len(y_idx)))
+        counts = np.asarray((onehot @ X).todense())
+        # smooth over the tokens seen in training, not the whole hashed space: with
+        # 2^18 mostly empty buckets the pseudo-counts would swamp the small classes
+        seen = counts.sum(axis=0) > 0
+        totals = counts.sum(axis=1, keepdims=True) + self.alpha * seen.sum()
+        self.feature_log_prob = np.log(counts + self.alpha) - np.log(totals)
+        # tokens never seen in training say nothing about the class
+        self.feature_log_prob[:, ~seen] = 0
+        self.class_log_prior = np.log(np.bincount(y_idx) / len(y_idx))
+        return self
+
+    def predict_proba(self, X):
+        joint = X @ self.feature_log_prob.T + self.class_log_prior
+        joint -= joint.max(axis=1, keepdims=True)
+        proba = np.exp(joint)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        """ (predicted class, probability of it) per row """
+        proba = self.predict_proba(X)
+        best = proba.argmax(axis=1)
+        return self.classes[best], proba[np.arange(len(best)), best]
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, alpha=self.alpha, classes=self.classes, class_log_prior=self.class_log_prior,
+                                feature_log_prob=self.feature_log_prob)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as d:
+            model = cls(float(d['alpha']))
+            model.classes = d['classes']
+            model.class_log_prior = d['class_log_prior']
+            model.feature_log_prob = d['feature_log_prob']
+        return model
+
+
+def labeled_rows(df):
+    return df[df[LABEL_COL].notnull()]
+
+
+def cross_validate(X, y, folds=DEFAULT_FOLDS, alpha=DEFAULT_ALPHA, threshold=DEFAULT_THRESHOLD, seed=CV_SEED):
+    """
+    Out-of-fold predictions of the labeled rows
+
+    Returns:
+        (accuracy, share of rows at or above `threshold`, accuracy of those rows)
+    """
+    y = np.asarray(y, dtype=str)
+    fold = np.random.RandomState(seed).permutation(len(y)) % folds
+    pred = np.empty(len(y), dtype=object)
+    conf = np.zeros(len(y))
+    for k in range(folds):
+        test = fold == k
+        model = NaiveBayes(alpha).fit(X[~test], y[~test])
+        pred[test], conf[test] = model.predict(X[test])
+    right = pred == y
+    confident = conf >= threshold
+    confident_acc = right[confident].mean() if confident.any() else np.nan
+    return right.mean(), confident.mean(), confident_acc
+
+
+# set in every worker process by init_worker
+_model = None
+_settings = None
+
+
+def init_worker(model, settings):
+    global _model, _settings
+    _model = model
+    _settings = settings
+
+
+def predict_chunk(df):
+    """ PRED_COLUMNS for one chunk of the input, runs in a worker process """
+    df = rename_columns(df)
+    messages = None
+    if _settings['repo'] is not None:
+        messages = commit_messages(_settings['repo'], df['hash'].astype(str).tolist())
+    X = build_features(df, messages, _settings['n_features'])
+    pred, conf = _model.predict(X)
+    out = df.copy()
+    out['predicted_category'] = pred
+    out['confidence'] = conf.round(4)
+    out['needs_review'] = conf < _settings['threshold']
+    return out
+
+
+def predict_file(model, infile, outfile, settings, chunksize=DEFAULT_CHUNKSIZE, workers=None):
+    """
+    Predict every row of `infile` chunk by chunk in worker processes
+
+    Returns:
+        (number of rows, number of rows that need review)
+    """
+    tmp_path = outfile + '.tmp'
+    counts = [0, 0]
+    workers = workers or os.cpu_count()
+
+    def write(out):
+        out.to_csv(tmp_path, mode='a' if counts[0] else 'w', header=counts[0] == 0, index=False)
+        counts[0] += len(out)
+        counts[1] += int(out['needs_review'].sum())
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(model, settings)) as pool:
+        # at most two chunks per worker in flight, written back in input order
+        pending = deque()
+        for chunk in pd.read_csv(infile, chunksize=chunksize):
+            pending.append(pool.submit(predict_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    os.replace(tmp_path, outfile)
+    return counts[0], counts[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train on the manually labeled commits and pre-label the rest')
+    parser.add_argument('infile', type=str, help='csv of the commits to label')
+    parser.add_argument('outfile', type=str, help='infile with %s' % ', '.join(PRED_COLUMNS))
+    parser.add_argument('--labeled', type=str, default=None,
+                        help='csv with %s to train on (default: the labeled rows of infile)' % LABEL_COL)
+    parser.add_argument('--repo', type=str, default=None, help='git repo, adds the commit messages as features')
+    parser.add_argument('--model', type=str, default=None,
+                        help='load the model from this .npz if it exists, otherwise save it there')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='rows with a lower confidence need manual review')
+    parser.add_argument('--review', type=str, default=None,
+                        help='also write the rows that need review here (default: outfile + .review.csv)')
+    parser.add_argument('--features', type=int, default=DEFAULT_FEATURES, help='hashed feature space size')
+    parser.add_argument('--alpha', type=float, default=DEFAULT_ALPHA, help='additive smoothing')
+    parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS, help='cross-validation folds, 0 to skip')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help='rows per prediction chunk')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes')
+    args = parser.parse_args()
+
+    settings = {'repo': args.repo, 'n_features': args.features, 'threshold': args.threshold}
+    if args.model is not None and os.path.exists(args.model):
+        model = NaiveBayes.load(args.model)
+        if model.feature_log_prob.shape[1] != args.features:
+            print('Error: %s was trained with %d features' % (args.model, model.feature_log_prob.shape[1]))
+            return
+    else:
+        train = labeled_rows(rename_columns(pd.read_csv(args.labeled or args.infile)))
+        if len(train) == 0:
+            print('Error: no rows with %s to train on' % LABEL_COL)
+            return
+        messages = None
+        if args.repo is not None:
+            messages = commit_messages(args.repo, train['hash'].astype(str).tolist())
+        X = build_features(train, messages, args.features)
+        y = train[LABEL_COL].values
+        if args.folds > 1:
+            acc, coverage, confident_acc = cross_validate(X, y, args.folds, args.alpha, args.threshold)
+            print('%d-fold accuracy on %d labeled commits: %.3f' % (args.folds, len(train), acc))
+            print('confidence >= %.2f: %.1f%% of commits, accuracy %.3f'
+                  % (args.threshold, coverage * 100, confident_acc))
+        model = NaiveBayes(args.alpha).fit(X, y)
+        if args.model is not None:
+            model.save(args.model)
+
+    num_rows, num_review = predict_file(model, args.infile, args.outfile, settings, args.chunksize, args.workers)
+    print('labeled %d commits, %d need review' % (num_rows, num_review))
+    review_path = args.review or args.outfile + '.review.csv'
+    if num_review > 0:
+        review = []
+        for chunk in pd.read_csv(args.outfile, chunksize=args.chunksize):
+            review.append(chunk[chunk['needs_review'] == True])
+        pd.concat(review).to_csv(review_path, index=False)
+        print('rows to review in %s' % review_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,68 @@ import sys
 # Commits should be grabbed like this and dumped to a file:
 # git log --after="2017-09-01" --until="2018-09-01" --date=short --pretty=full
 
+FIELDS = ['hash', 'date', 'bug', 'review']
+BUG_PREFIX = 'crbug.com/'
+
+COMMIT_RE = re.compile('commit ')
+DATE_RE = re.compile(r'Date:\s+')
+BUG_RE = re.compile(r'\s+BUG=chromium:')
+REVIEW_RE = re.compile(r'\s+Reviewed-on: ')
+
+
+class Commit:
+    """ A parsed commit, kept small since there can be hundreds of thousands
+
+    The hash is kept as git printed it (it may be abbreviated, e.g. with
+    --abbrev-commit), the date is interned (many commits share a day) and
+    only the bug id is kept, not the crbug.com url.
+    """
+    __slots__ = ('sha', 'date', 'bug_id', 'review')
+
+    def __init__(self, cmit_hash):
+        self.sha = cmit_hash
+        self.date = None
+        self.bug_id = None
+        self.review = None
+
+    def complete(self):
+        return self.date is not None and self.bug_id is not None and self.review is not None
+
+    def row(self):
+        return [self.sha, self.date, BUG_PREFIX + self.bug_id, self.review]
+
+
+def parse_commits(lines):
+    """ Parse `git log --pretty=full` output, yields only commits with a date, bug and review """
+    commit = None
+    for line in lines:
+        # a line is at most one of these, cheap substring checks go before the regexes
+        if line.startswith('commit ') and COMMIT_RE.match(line) is not None:
+            if commit is not None and commit.complete():
+                yield commit
+            commit = Commit(line.split(' ')[1].split()[0])
+        elif commit is None:
+            continue
+        elif line.startswith('Date:') and DATE_RE.match(line) is not None:
+            commit.date = sys.intern(line.split()[1].split()[0])
+        elif 'BUG=chromium:' in line and BUG_RE.match(line) is not None:
+            # This is buggy if a commit references more than one issue, just
+            # fix these manually
+            commit.bug_id = line.split('BUG=chromium:')[1].split()[0]
+        elif 'Reviewed-on: ' in line and REVIEW_RE.match(line) is not None:
+            commit.review = line.split('Reviewed-on: ')[1].split()[0]
+    if commit is not None and commit.complete():
+        yield commit
+
+
+def write_commits(output_file, commits):
+    with open(output_file, "w", newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for c in commits:
+            writer.writerow(c.row())
+
+
 def main(argv):
     """ Randomly select a subset of commits.
 
@@ -23,30 +85,9 @@ def main(argv):
     num_commits = int(argv[1])
     commit_file = argv[2]
     output_file = argv[3]
-    commits = []
 
     with open(commit_file, 'r') as f:
-        commit = {}
-        for line in f.readlines():
-            if re.match('commit ', line) is not None:
-                if bool(commit) and None not in commit.values():
-                    commits.append(commit)
-                    commit = {}
-                commit['hash'] = line.split(' ')[1].split()[0]
-                commit['date'] = None
-                commit['bug'] = None
-                commit['review'] = None
-            if re.match('Date:\s+', line) is not None:
-                commit['date'] = line.split()[1].split()[0]
-            if re.match('\s+BUG=chromium:', line) is not None:
-                # This is buggy if a commit references more than one issue, just
-                # fix these manually
-                bug_id = line.split('BUG=chromium:')[1].split()[0]
-                commit['bug'] = 'crbug.com/' + bug_id
-            if re.match('\s+Reviewed-on: ', line) is not None:
-                commit['review'] = line.split('Reviewed-on: ')[1].split()[0]
-        if bool(commit) and None not in commit.values():
-            commits.append(commit)
+        commits = list(parse_commits(f))
 
     # Select all of them if the user wants more than we have
     num_commits = min(num_commits, len(commits))
@@ -56,15 +97,10 @@ def main(argv):
     random.shuffle(commits)
     commits = commits[:num_commits]
 
-    with open(output_file, "w", newline='') as f:
-        writer = csv.DictWriter(f, commits[0].keys())
-        writer.writeheader()
-        for c in commits:
-            writer.writerow(c)
+    write_commits(output_file, commits)
 
 if __name__ == "__main__":
     """
     Main method
     """
     main(sys.argv)
-
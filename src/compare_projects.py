@@ -0,0 +1,244 @@
+#!/bin/env python
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from scipy import stats
+from analyze_extracted import (COL_MAP, FIG_SIZE, XLAB_SIZE, YLAB_SIZE, TICK_SIZE, read_input, preprocess,
+                               to_category_reports, get_unittested_vs_non, get_class_plots, get_unit_plots)
+from quantile_sketch import KLLSketch
+
+METRICS = ['lines_modified', 'num_revisions', 'num_comments', 'upload_push_timediff']
+CATEGORIES = ['RFE', 'BUG', 'REFAC', 'IMPR']
+ALL_GROUP = 'ALL'
+UTEST_GROUPS = ['unittested', 'non_unittested']
+# older extractions name a few columns differently
+COLUMN_ALIASES = {'final category': 'final_category', 'category': 'final_category'}
+STATS_NAME = 'compare_stats.csv'
+TESTS_NAME = 'compare_tests.csv'
+
+
+def rename_columns(df):
+    """ Column names as in the other projects, e.g. platform2's `final category` """
+    df = df.rename(columns={c: COLUMN_ALIASES.get(c, c.strip().replace(' ', '_')) for c in df.columns})
+    # two aliases may land on final_category, keep the first
+    return df.loc[:, ~df.columns.duplicated()]
+
+
+def normalize_columns(df):
+    df = rename_columns(df)
+    if 'assigned_category' not in df.columns:
+        print('Warning: no assigned_category column, keeping all labeled commits')
+        df['assigned_category'] = 'NA'
+    # lines_modified and upload_push_timediff come from preprocess
+    for m in ['num_revisions', 'num_comments']:
+        if m not in df.columns:
+            print('Warning: no %s column' % m)
+            df[m] = np.nan
+    return df
+
+
+def group_summary(df):
+    """ n, unit tested count and per-metric n/mean/variance/median/sketch of one group """
+    summary = {'n': len(df), 'unittested': int((df['is_unittested'] == True).sum()), 'metrics': {}}
+    for m in METRICS:
+        values = pd.to_numeric(df[m], errors='coerce').dropna().values.astype(float)
+        summary['metrics'][m] = {
+            'n': len(values),
+            'mean': values.mean() if len(values) else np.nan,
+            'var': values.var(ddof=1) if len(values) > 1 else np.nan,
+            'median': np.median(values) if len(values) else np.nan,
+            'sketch': KLLSketch().update(values).to_dict(),
+        }
+    return summary
+
+
+def summarize_project(name, inpath, res_dir, plots=False):
+    """
+    Preprocess one project and reduce its category and unit test reports to summaries
+
+    Runs in a worker process, only the small summary goes back to the parent.
+    """
+    proj_dir = os.path.join(res_dir, name)
+    os.makedirs(proj_dir, exist_ok=True)
+    df = normalize_columns(read_input(inpath))
+    df = preprocess(proj_dir, df)
+    if len(df) == 0:
+        print('Warning: %s has no labeled commits' % name)
+    elif plots:
+        try:
+            get_class_plots(proj_dir, df)
+            get_unit_plots(proj_dir, df)
+        except (KeyError, ValueError) as e:
+            # IssueReport needs both unit tested and other commits in every group
+            print('Warning: figures of %s are incomplete: %r' % (name, e))
+
+    groups = {ALL_GROUP: group_summary(df)}
+    for cat, report in to_category_reports(df).items():
+        groups[cat] = group_summary(report.data)
+    for g, report in get_unittested_vs_non(df).items():
+        groups[g] = group_summary(report.data)
+    return {'name': name, 'rows': len(df), 'groups': groups}
+
+
+def stats_table(summaries):
+    rows = []
+    for s in summaries:
+        for group, g in s['groups'].items():
+            row = {'project': s['name'], 'group': group, 'n': g['n'],
+                   'unittest_ratio': round(g['unittested'] / g['n'], 4) if g['n'] else np.nan}
+            for m in METRICS:
+                row['median_' + m] = g['metrics'][m]['median']
+                row['mean_' + m] = g['metrics'][m]['mean']
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def anova_from_summaries(parts):
+    """ One-way ANOVA from (n, mean, variance) per project """
+    parts = [p for p in parts if p['n'] > 1]
+    k = len(parts)
+    total = sum(p['n'] for p in parts)
+    if k < 2 or total <= k:
+        return np.nan, np.nan
+    grand = sum(p['n'] * p['mean'] for p in parts) / total
+    ss_between = sum(p['n'] * (p['mean'] - grand) ** 2 for p in parts)
+    ss_within = sum((p['n'] - 1) * p['var'] for p in parts)
+    if ss_within == 0:
+        return np.nan, np.nan
+    f = (ss_between / (k - 1)) / (ss_within / (total - k))
+    return f, stats.f.sf(f, k - 1, total - k)
+
+
+def mood_from_sketches(parts):
+    """
+    Mood's median test, with the grand median and the counts above it taken from sketches
+
+    The counts are approximate, within the rank error of the sketches.
+    """
+    sketches = [KLLSketch.from_dict(p['sketch']) for p in parts if p['n'] > 0]
+    if len(sketches) < 2:
+        return np.nan, np.nan
+    # a copy, merge() changes the sketch it is called on
+    grand = KLLSketch.from_dict(sketches[0].to_dict())
+    for s in sketches[1:]:
+        grand.merge(s)
+    median = grand.median()
+    below = [s.rank(median) for s in sketches]
+    table = np.array([[s.n - b for s, b in zip(sketches, below)], below])
+    if (table.sum(axis=1) == 0).any():
+        return np.nan, np.nan
+    chi2, p, _, _ = stats.chi2_contingency(table)
+    return chi2, p
+
+
+def unittest_chisquare(groups):
+    """ Unit tested vs not, one column per project """
+    table = np.array([[g['unittested'] for g in groups], [g['n'] - g['unittested'] for g in groups]])
+    if len(groups) < 2 or (table.sum(axis=1) == 0).any() or (table.sum(axis=0) == 0).any():
+        return np.nan, np.nan
+    chi2, p, _, _ = stats.chi2_contingency(table)
+    return chi2, p
+
+
+def cross_project_tests(summaries):
+    rows = []
+    for group in [ALL_GROUP] + CATEGORIES + UTEST_GROUPS:
+        groups = [s['groups'][group] for s in summaries if s['groups'][group]['n'] > 0]
+        if len(groups) < 2:
+            continue
+        for m in METRICS:
+            parts = [g['metrics'][m] for g in groups]
+            f, p = anova_from_summaries(parts)
+            rows.append(['anova', m, group, f, p, len(parts)])
+            chi2, p = mood_from_sketches(parts)
+            rows.append(['mood_median', m, group, chi2, p, len(parts)])
+        if group not in UTEST_GROUPS:
+            chi2, p = unittest_chisquare(groups)
+            rows.append(['chisquare', 'is_unittested', group, chi2, p, len(groups)])
+    return pd.DataFrame(rows, columns=['test', 'd_var', 'group', 'statistic', 'p_value', 'projects'])
+
+
+def plot_compare_box(res_dir, summaries, var):
+    """ Box per project, side by side within every category """
+    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    num = len(summaries)
+    width = 0.8 / num
+    handles = []
+    for i, s in enumerate(summaries):
+        box_stats = []
+        positions = []
+        for j, cat in enumerate(CATEGORIES):
+            g = s['groups'].get(cat)
+            if g is None or g['metrics'][var]['n'] == 0:
+                continue
+            sketch = KLLSketch.from_dict(g['metrics'][var]['sketch'])
+            box_stats.append(sketch.box_stats(cat))
+            positions.append(j + (i - (num - 1) / 2) * width)
+        if len(box_stats) == 0:
+            continue
+        bp = ax.bxp(box_stats, positions=positions, widths=width * 0.9, patch_artist=True, showfliers=False)
+        for box in bp['boxes']:
+            box.set_facecolor('C%d' % i)
+        handles.append((bp['boxes'][0], s['name']))
+    ax.set_xticks(np.arange(len(CATEGORIES)))
+    ax.set_xticklabels(CATEGORIES, fontsize=XLAB_SIZE)
+    ax.set_ylabel(COL_MAP.get(var, var), fontsize=YLAB_SIZE)
+    ax.tick_params(labelsize=TICK_SIZE)
+    if handles:
+        ax.legend([h for h, _ in handles], [n for _, n in handles], fontsize=TICK_SIZE)
+    plt.savefig(res_dir + '/' + 'compare_%s.png' % var)
+    plt.close()
+
+
+def plot_compare_unittest_ratio(res_dir, table):
+    pivot = table[table['group'].isin(CATEGORIES)].pivot(index='group', columns='project', values='unittest_ratio')
+    pivot = pivot.reindex([c for c in CATEGORIES if c in pivot.index])
+    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    pivot.plot.bar(ax=ax, rot=0)
+    ax.set_xlabel('')
+    ax.set_ylabel('Unit Test Ratio', fontsize=YLAB_SIZE)
+    ax.tick_params(labelsize=TICK_SIZE)
+    ax.legend(fontsize=TICK_SIZE)
+    plt.savefig(res_dir + '/' + 'compare_unittest_ratio.png')
+    plt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare several extracted datasets side by side')
+    parser.add_argument('infiles', type=str, nargs='+', help='extracted csvs, one per project')
+    parser.add_argument('res_dir', type=str, help='result directory')
+    parser.add_argument('--names', type=str, nargs='+', default=None,
+                        help='project names (default: file names)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes')
+    parser.add_argument('--project-plots', action='store_true',
+                        help='also draw the analyze_extracted figures of every project')
+    args = parser.parse_args()
+
+    names = args.names or [os.path.splitext(os.path.basename(f))[0] for f in args.infiles]
+    if len(names) != len(args.infiles) or len(set(names)) != len(names):
+        parser.error('need one distinct name per input file')
+    os.makedirs(args.res_dir, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(summarize_project, n, f, args.res_dir, args.project_plots) for n, f in zip(names, args.infiles)]
+        summaries = [f.result() for f in futures]
+
+    table = stats_table(summaries)
+    table.to_csv(os.path.join(args.res_dir, STATS_NAME), index=False)
+    tests = cross_project_tests(summaries)
+    tests.to_csv(os.path.join(args.res_dir, TESTS_NAME), index=False)
+    print(tests.to_string())
+
+    for var in METRICS:
+        plot_compare_box(args.res_dir, summaries, var)
+    plot_compare_unittest_ratio(args.res_dir, table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/bin/env python
+
+import argparse
+import json
+import os
+import threading
+import pandas as pd
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# issue json by id, `{id}` is replaced with the bug number
+DEFAULT_ENDPOINT = 'https://monorail-prod.appspot.com/_ah/api/monorail/v1/projects/chromium/issues/{id}'
+BUG_PREFIX = 'crbug.com/'
+TYPE_PREFIX = 'Type-'
+# responses of the google apis may start with this to prevent json hijacking
+XSSI_PREFIX = ")]}'"
+CACHE_VERSION = 1
+DEFAULT_WORKERS = 16
+TIMEOUT = 30
+# fetched issues between cache saves, so an interrupted run keeps most of its work
+SAVE_EVERY = 500
+BUG_COLUMNS = ['bug_type', 'bug_status', 'bug_labels']
+LABEL_SEP = ';'
+
+
+def bug_ids(df):
+    """ Unique crbug ids of the dataset, commits often share a bug """
+    bugs = df['bug'].dropna().astype(str)
+    bugs = bugs[bugs.str.startswith(BUG_PREFIX)].str[len(BUG_PREFIX):]
+    return sorted(set(bugs[bugs.str.isdigit()]), key=int)
+
+
+def parse_issue(injson):
+    labels = injson.get('labels', [])
+    issue_type = None
+    for label in labels:
+        if label.startswith(TYPE_PREFIX):
+            issue_type = label[len(TYPE_PREFIX):]
+            break
+    return {'type': issue_type, 'status': injson.get('status'), 'labels': labels}
+
+
+def fetch_issue(session, endpoint, bug_id):
+    """
+    Returns:
+        (bug id, issue dict or None, whether the result may be cached)
+    """
+    query = endpoint.format(id=bug_id)
+    try:
+        r = session.get(query, timeout=TIMEOUT)
+    except requests.RequestException as e:
+        print('Warning: query for bug %s failed: %s' % (bug_id, e))
+        return bug_id, None, False
+    if r.status_code == requests.codes.not_found:
+        # restricted or deleted issues, don't ask again
+        return bug_id, None, True
+    if r.status_code != requests.codes.ok:
+        print('Warning: query for bug %s failed with status %d' % (bug_id, r.status_code))
+        return bug_id, None, False
+    text = r.text
+    if text.startswith(XSSI_PREFIX):
+        text = text[len(XSSI_PREFIX):]
+    try:
+        injson = json.loads(text)
+    except ValueError as e:
+        print('Warning: bad response for bug %s: %s' % (bug_id, e))
+        return bug_id, None, False
+    if not isinstance(injson, dict):
+        print('Warning: bad response for bug %s: not an issue object' % bug_id)
+        return bug_id, None, False
+    return bug_id, parse_issue(injson), True
+
+
+class IssueCache:
+    """ Issue metadata by bug id, kept across runs in a json file """
+
+    def __init__(self, path, endpoint):
+        self.path = path
+        self.endpoint = endpoint
+        self.issues = {}
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                stored = json.load(f)
+            # issues from another tracker are not reused
+            if stored.get('version') == CACHE_VERSION and stored.get('endpoint') == endpoint:
+                self.issues = stored['issues']
+
+    def missing(self, ids):
+        return [i for i in ids if i not in self.issues]
+
+    def save(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'endpoint': self.endpoint, 'issues': self.issues}, f)
+        os.replace(tmp_path, self.path)
+
+
+def fetch_issues(cache, ids, workers=DEFAULT_WORKERS):
+    """ Fetch the ids missing from `cache` concurrently, returns the number of failed queries """
+    todo = cache.missing(ids)
+    print('%d unique bugs, %d cached, %d to fetch' % (len(ids), len(ids) - len(todo), len(todo)))
+    if len(todo) == 0:
+        return 0
+
+    # one session per thread, requests.Session is not thread safe
+    local = threading.local()
+
+    def fetch(bug_id):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return fetch_issue(local.session, cache.endpoint, bug_id)
+
+    failed = 0
+    fetched = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(fetch, i) for i in todo]
+            for future in as_completed(futures):
+                bug_id, issue, cacheable = future.result()
+                if cacheable:
+                    cache.issues[bug_id] = issue
+                    fetched += 1
+                    if fetched % SAVE_EVERY == 0:
+                        cache.save()
+                else:
+                    failed += 1
+    finally:
+        # keep what was fetched even if the run is aborted
+        cache.save()
+    return failed
+
+
+def join_issues(df, cache, fill_assigned=False):
+    """ Add BUG_COLUMNS to `df`, NaN where the bug is unknown """
+    ids = df['bug'].astype(str).str.replace(BUG_PREFIX, '', regex=False)
+    issues = ids.map(lambda i: cache.issues.get(i))
+    df['bug_type'] = issues.map(lambda x: x['type'] if x else None)
+    df['bug_status'] = issues.map(lambda x: x['status'] if x else None)
+    df['bug_labels'] = issues.map(lambda x: LABEL_SEP.join(x['labels']) if x else None)
+    if fill_assigned:
+        if 'assigned_category' not in df.columns:
+            df['assigned_category'] = None
+        df['assigned_category'] = df['assigned_category'].fillna(df['bug_type'])
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Add crbug type, status and labels to extracted commits')
+    parser.add_argument('infile', type=str, help='csv with a `bug` column (crbug.com/<id>)')
+    parser.add_argument('outfile', type=str, help='output csv')
+    parser.add_argument('--endpoint', type=str, default=DEFAULT_ENDPOINT,
+                        help='issue json url, {id} is replaced with the bug id')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='issue cache (default: <infile>.crbug.json)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='concurrent queries')
+    parser.add_argument('--fill-assigned', action='store_true',
+                        help='fill empty assigned_category with the issue type')
+    args = parser.parse_args()
+
+    if '{id}' not in args.endpoint:
+        parser.error('--endpoint needs an {id} placeholder')
+    df = pd.read_csv(args.infile)
+    cache = IssueCache(args.cache or args.infile + '.crbug.json', args.endpoint)
+    failed = fetch_issues(cache, bug_ids(df), args.workers)
+    if failed > 0:
+        print('Warning: %d queries failed, run again to retry them' % failed)
+    df = join_issues(df, cache, args.fill_assigned)
+    df.to_csv(args.outfile, index=False)
+
+
+if __name__ == '__main__':
+    main()
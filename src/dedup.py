@@ -0,0 +1,132 @@
+#!/bin/env python
+
+import argparse
+import re
+import subprocess
+import threading
+import pandas as pd
+
+CHANGEID_RE = re.compile(r'^\s*Change-Id:\s*(I[0-9a-f]{40})\s*$', re.MULTILINE)
+# separates the commit messages in the batched log
+RECORD_SEP = '\x00'
+
+
+def run_batched(repo, cmd, hashes):
+    """ Run `cmd` in `repo` with the hashes on stdin, returns stdout or None on failure """
+    cp = subprocess.run(cmd, cwd=repo, input='\n'.join(hashes) + '\n', capture_output=True,
+                        universal_newlines=True, errors='replace')
+    if cp.returncode != 0:
+        print('Warning: %s failed: %s' % (' '.join(cmd[:2]), cp.stderr.strip()))
+        return None
+    return cp.stdout
+
+
+def patch_ids(repo, hashes):
+    """ hash -> stable patch-id, from one diff-tree | patch-id pipeline """
+    diff = subprocess.Popen(['git', 'diff-tree', '--stdin', '--root', '-p'], cwd=repo,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    pid = subprocess.Popen(['git', 'patch-id', '--stable'], cwd=repo, stdin=diff.stdout,
+                           stdout=subprocess.PIPE, universal_newlines=True)
+    # let patch-id see EOF once diff-tree exits
+    diff.stdout.close()
+
+    def feed():
+        diff.stdin.write(('\n'.join(hashes) + '\n').encode())
+        diff.stdin.close()
+
+    # write from a thread, reading the output here keeps the pipes from filling up
+    writer = threading.Thread(target=feed)
+    writer.start()
+    out = pid.communicate()[0]
+    writer.join()
+    if diff.wait() != 0 or pid.returncode != 0:
+        print('Warning: computing patch-ids in %s failed' % repo)
+        return {}
+
+    ids = {}
+    for line in out.splitlines():
+        patch_id, cmit = line.split()
+        ids[cmit] = patch_id
+    return ids
+
+
+def change_ids(repo, hashes):
+    """ hash -> every Change-Id in the commit message, from one batched git log """
+    cmd = ['git', 'log', '--no-walk=unsorted', '--stdin', '--format=%H%n%B%x00']
+    out = run_batched(repo, cmd, hashes)
+    if out is None:
+        return {}
+
+    ids = {}
+    for record in out.split(RECORD_SEP):
+        record = record.lstrip('\n')
+        if len(record) == 0:
+            continue
+        cmit, _, body = record.partition('\n')
+        ids[cmit] = CHANGEID_RE.findall(body)
+    return ids
+
+
+def find(parent, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+def group_commits(hashes, pids, cids):
+    """
+    Group commits that share a patch-id or any Change-Id
+
+    Returns:
+        dict of hash -> group id, the group id is the first member in `hashes`
+    """
+    parent = {h: h for h in hashes}
+    order = {h: i for i, h in enumerate(hashes)}
+    owner = {}
+    for h in hashes:
+        keys = [('patch', pids[h])] if h in pids else []
+        keys += [('change', c) for c in cids.get(h, [])]
+        for key in keys:
+            if key not in owner:
+                owner[key] = h
+                continue
+            a, b = find(parent, owner[key]), find(parent, h)
+            if a == b:
+                continue
+            # keep the earlier commit as the root
+            if order[a] > order[b]:
+                a, b = b, a
+            parent[b] = a
+    return {h: find(parent, h) for h in hashes}
+
+
+def dedup_commits(repo, hashes):
+    """
+    Returns:
+        (hash -> group id, hash -> first Change-Id or None)
+    """
+    hashes = list(dict.fromkeys(hashes))
+    pids = patch_ids(repo, hashes)
+    cids = change_ids(repo, hashes)
+    groups = group_commits(hashes, pids, cids)
+    first_cid = {h: (cids[h][0] if cids.get(h) else None) for h in hashes}
+    return groups, first_cid
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Group selected commits that are the same change')
+    parser.add_argument('infile', type=str, help='csv with a `hash` column')
+    parser.add_argument('repo', type=str, help='path to the git repo')
+    parser.add_argument('outfile', type=str, help='output csv with a `dup_group` column added')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.infile)
+    groups, _ = dedup_commits(args.repo, df['hash'].tolist())
+    df['dup_group'] = df['hash'].map(groups)
+    print('%d commits in %d groups' % (len(df), df['dup_group'].nunique()))
+    df.to_csv(args.outfile, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/bin/env python
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# gerrit reports times in UTC
+SOURCE_TZ = 'UTC'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# gerrit times carry nanoseconds after the seconds
+TIME_LEN = 19
+DEFAULT_WORKDAY = (9, 17)
+DEFAULT_WEEKMASK = 'Mon Tue Wed Thu Fri'
+HOUR = np.timedelta64(1, 'h')
+# (name, start column, end column) of the durations added by main
+DURATIONS = [('review', 'time_uploaded', 'time_pushed'), ('plus2', 'time_uploaded', 'time_plus2')]
+
+
+def parse_times(series):
+    """ datetime64[ns] array, NaT for the -1 placeholders and anything else unparsable """
+    values = series.astype(str).str[:TIME_LEN]
+    return pd.to_datetime(values, format=TIME_FORMAT, errors='coerce').values
+
+
+def to_local(times, tz, default_tz=SOURCE_TZ):
+    """
+    Naive local wall-clock times of UTC `times`
+
+    Args:
+        times: datetime64[ns] array in UTC
+        tz: one timezone name, or an array with one name per row (missing: `default_tz`)
+    """
+    if tz is None or isinstance(tz, str):
+        index = pd.DatetimeIndex(times).tz_localize(SOURCE_TZ).tz_convert(tz or default_tz)
+        return index.tz_localize(None).values
+    tz = pd.Series(tz).fillna(default_tz).astype(str).values
+    local = np.empty(len(times), dtype='datetime64[ns]')
+    # one conversion per distinct zone, there are only a few teams
+    for zone in np.unique(tz):
+        rows = np.flatnonzero(tz == zone)
+        try:
+            local[rows] = to_local(times[rows], zone)
+        except Exception as e:
+            print('Warning: unknown timezone %s (%d rows), using %s: %s' % (zone, len(rows), default_tz, e))
+            local[rows] = to_local(times[rows], default_tz)
+    return local
+
+
+def make_calendar(holidays=(), weekmask=DEFAULT_WEEKMASK):
+    return np.busdaycalendar(weekmask=weekmask, holidays=np.asarray(holidays, dtype='datetime64[D]'))
+
+
+def business_clock(local, calendar, workday=DEFAULT_WORKDAY):
+    """
+    Business hours from a fixed origin up to every local time
+
+    Every business day adds the hours of its working window, so the
+    business time between two moments is the difference of their clocks.
+    """
+    days = local.astype('datetime64[D]')
+    valid = ~np.isnat(local)
+    clock = np.full(len(local), np.nan)
+    origin = np.datetime64('1970-01-01', 'D')
+    length = workday[1] - workday[0]
+    hour_of_day = (local[valid] - days[valid]) / HOUR
+    inside = np.clip(hour_of_day - workday[0], 0, length)
+    full_days = np.busday_count(origin, days[valid], busdaycal=calendar)
+    clock[valid] = full_days * length + np.where(np.is_busday(days[valid], busdaycal=calendar), inside, 0)
+    return clock
+
+
+def business_hours(start, end, tz=None, calendar=None, workday=DEFAULT_WORKDAY):
+    """
+    Working hours between `start` and `end`, per row
+
+    Args:
+        start, end: datetime64[ns] arrays in UTC
+        tz: timezone of the team, one name or one per row
+        calendar: np.busdaycalendar with the weekmask and holidays
+        workday: (first hour, last hour) of a working day in local time
+
+    Returns:
+        float array, NaN where either time is missing; the order of the two
+        times does not matter, like get_time_delta
+    """
+    calendar = calendar if calendar is not None else make_calendar()
+    clock_start = business_clock(to_local(start, tz), calendar, workday)
+    clock_end = business_clock(to_local(end, tz), calendar, workday)
+    return np.abs(clock_end - clock_start)
+
+
+def calendar_hours(start, end):
+    return np.abs((end - start) / HOUR)
+
+
+def read_holidays(path):
+    """ Dates from the first column of a csv, e.g. one per line with a `date` header """
+    df = pd.read_csv(path)
+    return pd.to_datetime(df.iloc[:, 0]).values.astype('datetime64[D]')
+
+
+def add_durations(df, tz=None, tz_col=None, holidays=(), workday=DEFAULT_WORKDAY, weekmask=DEFAULT_WEEKMASK):
+    """ <name>_hours (wall clock) and <name>_business_hours of every DURATIONS entry present in `df` """
+    calendar = make_calendar(holidays, weekmask)
+    zones = df[tz_col].values if tz_col is not None else tz
+    for name, start_col, end_col in DURATIONS:
+        if start_col not in df.columns or end_col not in df.columns:
+            print('Warning: no %s or %s column, skipping %s' % (start_col, end_col, name))
+            continue
+        start = parse_times(df[start_col])
+        end = parse_times(df[end_col])
+        df[name + '_hours'] = calendar_hours(start, end).round(2)
+        df[name + '_business_hours'] = business_hours(start, end, zones, calendar, workday).round(2)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Wall-clock and business-hour review durations')
+    parser.add_argument('infile', type=str, help='extracted or preprocessed csv')
+    parser.add_argument('outfile', type=str, help='infile with the duration columns added')
+    parser.add_argument('--tz', type=str, default=SOURCE_TZ, help='timezone of all reviewers')
+    parser.add_argument('--tz-col', type=str, default=None,
+                        help='column with a timezone name per row (e.g. of the reviewing team)')
+    parser.add_argument('--holidays', type=str, default=None, help='csv with one holiday date per line')
+    parser.add_argument('--workday', type=int, nargs=2, default=list(DEFAULT_WORKDAY),
+                        help='first and last working hour in local time')
+    parser.add_argument('--weekmask', type=str, default=DEFAULT_WEEKMASK, help='working days of the week')
+    args = parser.parse_args()
+
+    if not 0 <= args.workday[0] < args.workday[1] <= 24:
+        parser.error('--workday needs 0 <= first < last <= 24')
+    df = pd.read_csv(args.infile)
+    if args.tz_col is not None and args.tz_col not in df.columns:
+        print('Error: no %s column in %s' % (args.tz_col, args.infile))
+        return
+    holidays = read_holidays(args.holidays) if args.holidays is not None else ()
+    df = add_durations(df, args.tz, args.tz_col, holidays, tuple(args.workday), args.weekmask)
+    tmp_path = args.outfile + '.tmp'
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, args.outfile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/bin/env python
+
+import argparse
+import json
+import os
+import subprocess
+
+INDEX_VERSION = 1
+# marks the header line of every commit in the log dump
+COMMIT_MARK = '\x00'
+LOG_FORMAT = '--format=%x00%H %ct %ae'
+PRIOR_COLUMNS = ['prior_commits', 'prior_churn', 'prior_authors']
+
+
+class FileIndex:
+    """
+    Per-file history of a repo, built in one pass over `git log`
+
+    For every path the index keeps the running number of commits, the churn
+    (lines added + removed), the time of the last change and the authors.
+    While walking the history oldest first, every commit records the state of
+    its files *before* it was applied, so prior-churn metrics of a commit are
+    a single dict lookup afterwards.
+    """
+
+    def __init__(self):
+        self.head = None
+        # path -> [num commits, churn, last commit time, [author, ...]]
+        self.paths = {}
+        # sha -> [prior commits, prior churn, prior authors]
+        self.commits = {}
+
+    def add_commit(self, sha, ctime, author, numstat):
+        """
+        Args:
+            numstat: list of (path, lines added + removed)
+        """
+        prior_commits = 0
+        prior_churn = 0
+        authors = set()
+        for path, loc in numstat:
+            entry = self.paths.get(path)
+            if entry is None:
+                entry = [0, 0, 0, []]
+                self.paths[path] = entry
+            prior_commits += entry[0]
+            prior_churn += entry[1]
+            authors.update(entry[3])
+
+            entry[0] += 1
+            entry[1] += loc
+            entry[2] = max(entry[2], ctime)
+            if author not in entry[3]:
+                entry[3].append(author)
+        self.commits[sha] = [prior_commits, prior_churn, len(authors)]
+        self.head = sha
+
+    def lookup(self, sha):
+        """ (prior commits, prior churn, prior authors) of `sha`, None if not indexed """
+        return self.commits.get(sha)
+
+    def to_dict(self):
+        return {'version': INDEX_VERSION, 'head': self.head, 'paths': self.paths, 'commits': self.commits}
+
+    @classmethod
+    def from_dict(cls, d):
+        index = cls()
+        if d.get('version') != INDEX_VERSION:
+            print('Warning: file index version mismatch, rebuilding')
+            return index
+        index.head = d['head']
+        index.paths = d['paths']
+        index.commits = d['commits']
+        return index
+
+
+def parse_numstat(line):
+    added, deleted, path = line.split('\t', 2)
+    # binary files have no line counts
+    if added == '-' or deleted == '-':
+        return path, 0
+    return path, int(added) + int(deleted)
+
+
+def read_log(repo, since=None):
+    """
+    Stream (sha, commit time, author, numstat) of the repo history, oldest first
+
+    Merges are skipped, their changes are already counted in their parents.
+    """
+    rev = 'HEAD' if since is None else '%s..HEAD' % since
+    cmd = ['git', 'log', '--reverse', '--date-order', '--no-merges', '--no-renames',
+           '--numstat', LOG_FORMAT, rev]
+    proc = subprocess.Popen(cmd, cwd=repo, stdout=subprocess.PIPE, universal_newlines=True,
+                            errors='replace')
+    commit = None
+    for line in proc.stdout:
+        if line.startswith(COMMIT_MARK):
+            if commit is not None:
+                yield commit
+            sha, ctime, author = line[1:].rstrip('\n').split(' ', 2)
+            commit = (sha, int(ctime), author, [])
+        elif line != '\n' and commit is not None:
+            commit[3].append(parse_numstat(line.rstrip('\n')))
+    if commit is not None:
+        yield commit
+    if proc.wait() != 0:
+        print('Error: git log failed in %s' % repo)
+        raise RuntimeError
+
+
+def is_ancestor(repo, sha):
+    cp = subprocess.run(['git', 'merge-base', '--is-ancestor', sha, 'HEAD'], cwd=repo,
+                        capture_output=True)
+    return cp.returncode == 0
+
+
+def update_index(index, repo):
+    """ Fold the commits after `index.head` into the index, returns the number added """
+    since = index.head
+    if since is not None and not is_ancestor(repo, since):
+        # history was rewritten, the running state can't be reused
+        print('Warning: indexed head %s is not in the history anymore, rebuilding' % since)
+        index.__init__()
+        since = None
+    num_added = 0
+    for sha, ctime, author, numstat in read_log(repo, since):
+        index.add_commit(sha, ctime, author, numstat)
+        num_added += 1
+    return num_added
+
+
+def load_index(path):
+    if not os.path.exists(path):
+        return FileIndex()
+    with open(path, 'r') as f:
+        return FileIndex.from_dict(json.load(f))
+
+
+def save_index(path, index):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index.to_dict(), f)
+    os.replace(tmp_path, path)
+
+
+def build_or_update(repo, path):
+    index = load_index(path)
+    num_added = update_index(index, repo)
+    if num_added > 0:
+        save_index(path, index)
+    print('file index %s: %d new commits, %d commits, %d paths'
+          % (path, num_added, len(index.commits), len(index.paths)))
+    return index
+
+
+def prior_stats(index, cmit_list):
+    """ One list per PRIOR_COLUMNS entry, -1 for commits missing from the index """
+    columns = [[] for _ in PRIOR_COLUMNS]
+    for cmit in cmit_list:
+        stats = index.lookup(cmit)
+        if stats is None:
+            print('Warning: commit %s not in the file index' % cmit)
+            stats = [-1] * len(PRIOR_COLUMNS)
+        for col, value in zip(columns, stats):
+            col.append(value)
+    return columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or update the per-file history index of a repo')
+    parser.add_argument('repo', type=str, help='path to the git repo')
+    parser.add_argument('index', type=str, help='index file (json), updated in place')
+    args = parser.parse_args()
+
+    build_or_update(args.repo, args.index)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/bin/env python
+
+import argparse
+import numpy as np
+import pandas as pd
+
+# same columns, in the same order, as data/all_commits_extracted.csv (see table_legend)
+COLUMNS = ['hash', 'date', 'bug', 'review', 'lines_added', 'lines_removed', 'num_revisions',
+           'time_uploaded', 'time_pushed', 'is_unittested', 'is_unittest_only', 'num_msg',
+           'time_plus2', 'num_unresolved_comments', 'assigned_category', 'manual_category',
+           'researcher1', 'researcher2', 'researcher2_category', 'final_category', 'disagreement',
+           'num_comments']
+
+CATEGORIES = ['RFE', 'BUG', 'REFAC', 'IMPR', 'OTHER']
+# roughly the mix of the manually labeled sample
+CATEGORY_P = [0.45, 0.2, 0.15, 0.15, 0.05]
+# assigned category on crbug per final category (RFE -> mostly Feature, ...)
+ASSIGNED = {'RFE': ('Feature', 0.85), 'BUG': ('Bug', 0.8), 'REFAC': ('Feature', 0.6),
+            'IMPR': ('Feature', 0.6), 'OTHER': ('Bug', 0.5)}
+RESEARCHERS = ['Neil', 'colin']
+START = np.datetime64('2017-09-01T00:00:00')
+PERIOD_DAYS = 365
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# gerrit queries that failed are stored as -1
+MISSING_P = 0.005
+CHUNK_ROWS = 500000
+SIZES = {'10k': 10 ** 4, '100k': 10 ** 5, '1M': 10 ** 6, '10M': 10 ** 7}
+
+
+def parse_size(size):
+    if size in SIZES:
+        return SIZES[size]
+    return int(size)
+
+
+def hex_ids(rng, n, num_bytes):
+    raw = rng.integers(0, 256, size=(n, num_bytes), dtype=np.uint8).tobytes().hex()
+    width = 2 * num_bytes
+    return [raw[i:i + width] for i in range(0, len(raw), width)]
+
+
+def fmt_times(times):
+    return pd.Series(times).dt.strftime(TIME_FORMAT).values
+
+
+def synth_chunk(rng, n, offset):
+    """ One chunk of schema-compatible commits with skewed, correlated metrics """
+    final = rng.choice(CATEGORIES, size=n, p=CATEGORY_P)
+
+    # LOC is heavy tailed; IMPR/RFE changes tend to be larger
+    scale = np.select([final == 'IMPR', final == 'RFE'], [3.4, 2.8], 2.2)
+    added = np.floor(rng.lognormal(scale, 1.6)).astype(np.int64)
+    removed = np.floor(rng.lognormal(scale - 1.2, 1.8) * rng.binomial(1, 0.7, n)).astype(np.int64)
+    size = np.log1p(added + removed)
+
+    is_unittested = rng.random(n) < 1 / (1 + np.exp(-(size - 5)))
+    is_unittest_only = ~is_unittested & (rng.random(n) < 0.03)
+    revisions = 1 + rng.negative_binomial(1.5, 1 / (1 + 0.25 * size))
+    comments = rng.negative_binomial(0.6, 1 / (1 + 0.5 * size + 0.8 * revisions))
+    unresolved = rng.binomial(np.minimum(comments, 50), 0.1)
+    num_msg = revisions * 3 + rng.poisson(2 + comments / 2)
+
+    upload = START + (rng.random(n) * PERIOD_DAYS * 86400).astype('timedelta64[s]')
+    # time in review grows with revisions, in seconds
+    review = (rng.lognormal(12.3 + 0.3 * np.log(revisions), 1.4)).astype('timedelta64[s]')
+    push = upload + review
+    plus2 = upload + (review.astype(np.int64) * rng.uniform(0.5, 1.0, n)).astype('timedelta64[s]')
+
+    final_s = pd.Series(final)
+    assigned_right = final_s.map({c: a for c, (a, _) in ASSIGNED.items()}).values
+    assigned_p = final_s.map({c: p for c, (_, p) in ASSIGNED.items()}).values
+    keep = rng.random(n) < assigned_p
+    assigned = np.where(keep, assigned_right, np.where(assigned_right == 'Bug', 'Feature', 'Bug'))
+
+    disagreement = rng.random(n) < 0.1
+    other_cat = rng.choice(CATEGORIES[:4], size=n)
+    researcher = rng.integers(0, 2, n)
+
+    uploaded = fmt_times(upload)
+    pushed = fmt_times(push)
+    plus2_s = fmt_times(plus2)
+    missing = rng.random(n) < MISSING_P
+    uploaded = np.where(missing, '-1', uploaded)
+    pushed = np.where(missing, '-1', pushed)
+    plus2_s = np.where(missing, '-1', plus2_s)
+
+    bug_ids = rng.integers(600000, 900000, n)
+    reviews = np.arange(offset, offset + n) + 600000
+    return pd.DataFrame({
+        'hash': hex_ids(rng, n, 20),
+        'date': pd.Series(upload).dt.strftime('%Y-%m-%d').values,
+        'bug': ['crbug.com/%d' % b for b in bug_ids],
+        'review': ['https://chromium-review.googlesource.com/%d' % r for r in reviews],
+        'lines_added': added,
+        'lines_removed': removed,
+        'num_revisions': revisions,
+        'time_uploaded': uploaded,
+        'time_pushed': pushed,
+        'is_unittested': is_unittested,
+        'is_unittest_only': is_unittest_only,
+        'num_msg': num_msg,
+        'time_plus2': plus2_s,
+        'num_unresolved_comments': unresolved,
+        'assigned_category': assigned,
+        'manual_category': np.where(disagreement, other_cat, final),
+        'researcher1': np.array(RESEARCHERS)[researcher],
+        'researcher2': np.array(RESEARCHERS)[1 - researcher],
+        'researcher2_category': final,
+        'final_category': final,
+        'disagreement': disagreement,
+        'num_comments': comments,
+    }, columns=COLUMNS)
+
+
+def generate(outfile, num_rows, seed=11235, chunk_rows=CHUNK_ROWS):
+    """ Write `num_rows` synthetic commits to `outfile`, chunk by chunk """
+    rng = np.random.default_rng(seed)
+    written = 0
+    while written < num_rows:
+        n = min(chunk_rows, num_rows - written)
+        chunk = synth_chunk(rng, n, written)
+        chunk.to_csv(outfile, mode='w' if written == 0 else 'a', header=(written == 0), index=False)
+        written += n
+    return outfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic extracted-commits csv')
+    parser.add_argument('size', type=str, help='number of rows, or one of %s' % ', '.join(SIZES))
+    parser.add_argument('outfile', type=str, help='output csv')
+    parser.add_argument('--seed', type=int, default=11235)
+    args = parser.parse_args()
+
+    generate(args.outfile, parse_size(args.size), args.seed)
+
+
+if __name__ == '__main__':
+    main()
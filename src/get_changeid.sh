@@ -5,5 +5,5 @@
 hash="$1"
 repo="$2"
 cd "$repo"
-git show "$hash" | grep "Change-Id"
+git show -s "$hash" | grep "Change-Id"
 
@@ -4,13 +4,36 @@ import json
 import pandas as pd
 import subprocess
 import re
+import selectors
+import time
 import requests
-from contextlib import contextmanager
 from urllib.parse import quote
+from file_index import PRIOR_COLUMNS, build_or_update, prior_stats
+from dedup import dedup_commits
+from review_events import events_frame, message_events
+from hunk_stats import HUNK_COLUMNS, hunk_columns
 
 UP_ENG_FOLDER = 'aosp/platform/system/update_engine'
 PLATFORM2_FOLDER = 'chromiumos/platform/system_api'
 URL_PREFIX = 'https://chromium-review.googlesource.com/changes'
+PLUS2_RE = re.compile(r'Code-Review\+2')
+# output column -> key in the gerrit stats
+GERRIT_COLUMNS = [('num_msg', 'num_msg'), ('time_uploaded', 'submit_time'), ('time_pushed', 'push_time'),
+                  ('time_plus2', 'plus_2'), ('num_revisions', 'num_revision'),
+                  ('num_unresolved_comments', 'unresolved'), ('num_comments', 'num_comments')]
+# same order as before extract_commit existed
+OUTPUT_COLUMNS = ['lines_added', 'lines_removed', 'num_msg', 'time_uploaded', 'time_pushed', 'time_plus2',
+                  'num_revisions', 'num_unresolved_comments', 'is_unittested', 'is_unittest_only', 'num_comments']
+# budgets and diff options for the git calls of one commit
+MERGE_POLICIES = ['first-parent', 'skip', 'combined']
+DEFAULT_LIMITS = {'timeout': 60, 'max_output': 64 * 2 ** 20, 'merges': 'first-parent',
+                  'renames': True, 'rename_limit': 1000}
+GERRIT_TIMEOUT = 60
+READ_SIZE = 1 << 16
+QUARANTINE_COLUMNS = ['hash', 'reason']
+# reasons a commit is quarantined for when it runs out of its budget
+BUDGET_REASONS = ['timeout', 'output_size']
+CHANGEID_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'get_changeid.sh')
 
 def test_fexist(fpath):
     if os.path.exists(fpath):
@@ -30,52 +53,119 @@ def parse_cmit_list(inpath):
     return cmit_list, df
 
 
-@contextmanager
-def cd(newdir):
-    prevdir = os.getcwd()
-    os.chdir(os.path.expanduser(newdir))
-    try:
-        yield
-    finally:
-        os.chdir(prevdir)
-
-
-def do_git_show(repo, cmit_hash):
-    with cd(repo):
-        cmd = ['git', 'show', '--pretty=tformat:', '--numstat', cmit_hash]
-        cp = subprocess.run(cmd, capture_output=True, universal_newlines=True)
-        if cp.returncode != 0:
-            print('Warning: extract stat from commit %s failed' % cmit_hash)
-            return
-        outline = cp.stdout.rstrip('\n').replace('\n', '\t').split('\t')
-        return outline
-
-
-def get_changed_fnames(repo, cmit_hash):
-    with cd(repo):
-        cmd = ['git', 'show', '--pretty=format:', '--name-only', cmit_hash]
-        cp = subprocess.run(cmd, capture_output=True, universal_newlines=True)
-        if cp.returncode != 0:
-            print('Warning: extract unit test from commit %s failed' % cmit_hash)
-            return
-        outline = cp.stdout.rstrip('\n').split('\n')
-        return outline
-
-
-def get_change_id(repo, cmit_hash):
-    cmd = ['bash', 'get_changeid.sh', cmit_hash, repo]
-    cp = subprocess.run(cmd, capture_output=True, universal_newlines=True)
-    if cp.returncode != 0:
-        print('Warning: extract changeid from commit %s failed' % cmit_hash)
-        print(cp)
+def new_budget(limits):
+    """ Deadline and output bytes left, shared by all the calls made for one commit """
+    return {'deadline': time.monotonic() + limits['timeout'], 'output_left': limits['max_output']}
+
+
+def run_limited(repo, cmd, budget):
+    """
+    Run a command in `repo` within what is left of a commit's budget, reading its output as it comes
+
+    The output read is taken off budget['output_left'].
+
+    Returns:
+        (stdout, None) or (None, reason) with reason one of timeout, output_size, git_error
+    """
+    if time.monotonic() >= budget['deadline']:
+        return None, 'timeout'
+    proc = subprocess.Popen(cmd, cwd=os.path.expanduser(repo), stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+    sel = selectors.DefaultSelector()
+    sel.register(proc.stdout, selectors.EVENT_READ)
+    deadline = budget['deadline']
+    chunks = []
+    size = 0
+    reason = None
+    while True:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            reason = 'timeout'
+            break
+        if not sel.select(left):
+            continue
+        data = os.read(proc.stdout.fileno(), READ_SIZE)
+        if not data:
+            break
+        size += len(data)
+        if size > budget['output_left']:
+            reason = 'output_size'
+            break
+        chunks.append(data)
+    sel.close()
+    budget['output_left'] -= size
+    if reason is not None:
+        proc.kill()
+    proc.stdout.close()
+    if proc.wait() != 0 and reason is None:
+        reason = 'git_error'
+    if reason is not None:
+        return None, reason
+    return b''.join(chunks).decode(errors='replace'), None
+
+
+def is_merge(repo, cmit_hash, budget):
+    # over the budget, the next call of the commit quarantines it
+    out, _ = run_limited(repo, ['git', 'rev-list', '--no-walk', '--min-parents=2', cmit_hash], budget)
+    return out is not None and out.strip() != ''
+
+
+def diff_options(limits):
+    """ git show options for the merge policy and the rename detection limits """
+    opts = []
+    if limits['merges'] == 'first-parent':
+        opts += ['-m', '--first-parent']
+    elif limits['merges'] == 'combined':
+        opts += ['--cc']
+    if limits['renames']:
+        opts += ['-M', '-l%d' % limits['rename_limit']]
+    else:
+        opts += ['--no-renames']
+    return opts
+
+
+def do_git_show(repo, cmit_hash, limits=DEFAULT_LIMITS, quarantine=None, budget=None):
+    cmd = ['git', 'show', '--pretty=tformat:', '--numstat'] + diff_options(limits) + [cmit_hash]
+    out, reason = run_limited(repo, cmd, budget or new_budget(limits))
+    if reason is not None:
+        print('Warning: extract stat from commit %s failed (%s)' % (cmit_hash, reason))
+        if quarantine is not None:
+            quarantine.append((cmit_hash, reason))
         return
+    outline = out.rstrip('\n').replace('\n', '\t').split('\t')
+    return outline
+
+
+def get_changed_fnames(repo, cmit_hash, limits=DEFAULT_LIMITS, quarantine=None, budget=None):
+    cmd = ['git', 'show', '--pretty=format:', '--name-only'] + diff_options(limits) + [cmit_hash]
+    out, reason = run_limited(repo, cmd, budget or new_budget(limits))
+    if reason is not None:
+        print('Warning: extract unit test from commit %s failed (%s)' % (cmit_hash, reason))
+        if quarantine is not None:
+            quarantine.append((cmit_hash, reason))
+        return
+    outline = out.rstrip('\n').split('\n')
+    return outline
+
+
+def get_change_id(repo, cmit_hash, budget=None):
+    """
+    Returns:
+        (change id, None), or (None, reason) if the lookup failed
+    """
+    # the script runs in the repo already
+    cmd = ['bash', CHANGEID_SCRIPT, cmit_hash, '.']
+    out, reason = run_limited(repo, cmd, budget or new_budget(DEFAULT_LIMITS))
+    if reason is not None:
+        print('Warning: extract changeid from commit %s failed (%s)' % (cmit_hash, reason))
+        return None, reason
 
     # may have multiple change id
-    changeid_toks = cp.stdout.rstrip('\n').split('\n')
+    changeid_toks = out.rstrip('\n').split('\n')
     # only take the first one
     changeid = changeid_toks[0].split(':')[1].replace(' ', '')
     #print('--- changeid = ', changeid)
-    return changeid
+    return changeid, None
 
 
 def calc_stat(stat_list):
@@ -109,7 +199,12 @@ def build_query(repo, changeid, target):
 
 
 def proc_query(query):
-    r = requests.get(query)
+    try:
+        r = requests.get(query, timeout=GERRIT_TIMEOUT)
+    except requests.RequestException as e:
+        print('Error: query failed: %s' % e)
+        print('Please inspect query: [%s]' % query)
+        return None
     if r.status_code != requests.codes.ok:
         print('Error: query failed with status %d' %r.status_code)
         print('Please inspect query: [%s]' % query)
@@ -139,7 +234,7 @@ def extract_from_messages(injson):
     # get the time to plus2
     for msg in injson:
         # possible to have multiple Code-Review+2, only take the last one
-        if re.search('.*Code-Review\+2.*', msg['message']):
+        if PLUS2_RE.search(msg['message']):
             stats['plus_2'] = msg['date']
     return stats
 
@@ -199,7 +294,7 @@ def extract_stats(injson, target):
         return extract_from_comments(injson)
 
 
-def get_gerrit_stat(repo, cmit, changeid):
+def get_gerrit_stat(repo, cmit, changeid, events=None):
     targets = ['messages', 'comments']
     gerrit_stats = {}
     for t in targets:
@@ -212,6 +307,8 @@ def get_gerrit_stat(repo, cmit, changeid):
 
         # extract num_revision, num_comments, time_to_plus2, time_submitted, time_pushed
         stats = extract_stats(res_json, t)
+        if t == 'messages' and events is not None:
+            events.extend(message_events(changeid, res_json))
 
         # will override if key overlaps, but no overlap expected
         gerrit_stats.update(stats)
@@ -250,75 +347,146 @@ def get_unit_test(fnames):
     return is_unittested, is_unittest
 
 
+def extract_commit(repo, cmit, changeid=None, events=None, limits=DEFAULT_LIMITS, quarantine=None):
+    """
+    Git and Gerrit stats of one commit, review events are appended to `events` if given
+
+    All the git calls of the commit, and the change id lookup, share one
+    time and output budget (`limits`).
+
+    Returns:
+        dict of output column -> value, gerrit columns are -1 if the queries failed;
+        None if the commit went over its budget or is a skipped merge, the commit
+        and the reason are then appended to `quarantine`
+    """
+    if quarantine is None:
+        quarantine = []
+    budget = new_budget(limits)
+    if limits['merges'] == 'skip' and is_merge(repo, cmit, budget):
+        quarantine.append((cmit, 'merge'))
+        return None
+
+    stats = {}
+    stat_list = do_git_show(repo, cmit, limits, quarantine, budget)
+    if stat_list is None:
+        return None
+    stats['lines_added'], stats['lines_removed'] = calc_stat(stat_list)
+
+    # unit test related
+    files_changed = get_changed_fnames(repo, cmit, limits, quarantine, budget)
+    if files_changed is None:
+        return None
+    stats['is_unittested'], stats['is_unittest_only'] = get_unit_test(files_changed)
+
+    # get changeid from commit
+    if changeid is None:
+        changeid, reason = get_change_id(repo, cmit, budget)
+        if reason in BUDGET_REASONS:
+            quarantine.append((cmit, reason))
+            return None
+
+    # extract gerrit related stats
+    gerrit_stats = get_gerrit_stat(repo, cmit, changeid, events)
+    for col, key in GERRIT_COLUMNS:
+        # query to gerrit failed, fill -1 for placeholder
+        stats[col] = gerrit_stats[key] if len(gerrit_stats) != 0 else -1
+    return stats
+
+
+def placeholder_stats():
+    """
+    Stats of a quarantined commit
+
+    The unit test flags stay empty, a -1 in a bool column would turn it into
+    strings and break every `== True` filter of the analysis.
+    """
+    stats = {col: -1 for col in OUTPUT_COLUMNS}
+    stats['is_unittested'] = None
+    stats['is_unittest_only'] = None
+    return stats
+
+
+def add_limit_args(parser):
+    parser.add_argument('--timeout', type=int, default=DEFAULT_LIMITS['timeout'],
+                        help='seconds all git calls of one commit may take together')
+    parser.add_argument('--max-output', type=int, default=DEFAULT_LIMITS['max_output'],
+                        help='bytes of git output allowed per commit')
+    parser.add_argument('--merges', type=str, default=DEFAULT_LIMITS['merges'], choices=MERGE_POLICIES,
+                        help='diff merges against the first parent, skip them or use the combined diff')
+    parser.add_argument('--no-renames', action='store_true', help='turn off rename detection')
+    parser.add_argument('--rename-limit', type=int, default=DEFAULT_LIMITS['rename_limit'],
+                        help='files considered for rename detection')
+
+
+def limits_from_args(args):
+    return {'timeout': args.timeout, 'max_output': args.max_output, 'merges': args.merges,
+            'renames': not args.no_renames, 'rename_limit': args.rename_limit}
+
+
+def write_quarantine(path, quarantine):
+    df = pd.DataFrame(quarantine, columns=QUARANTINE_COLUMNS).drop_duplicates('hash')
+    df.to_csv(path, index=False)
+    print('%d commits quarantined, see %s' % (len(df), path))
+
+
 def main():
     parser = argparse.ArgumentParser(description='Take input commits and get related stats')
     parser.add_argument('infile', type=str, help='input file path containing the list of commits sha')
     parser.add_argument('repo', type=str, help='path to the git repo')
     parser.add_argument('outfile', type=str, help='output filename')
+    parser.add_argument('--file-index', type=str, default=None,
+                        help='per-file history index (built or updated as needed), adds prior churn columns')
+    parser.add_argument('--dedup', action='store_true',
+                        help='extract commits with the same patch-id or Change-Id once, adds a dup_group column')
+    parser.add_argument('--hunks', action='store_true',
+                        help='add hunk-level diff metrics from one streaming git log -p pass')
+    parser.add_argument('--events', type=str, default=None,
+                        help='also write the review event table (see review_events.py) to this csv')
+    parser.add_argument('--quarantine', type=str, default=None,
+                        help='csv of commits over a budget (default: <outfile>.quarantine.csv)')
+    add_limit_args(parser)
     args = parser.parse_args()
 
     cmit_list, df = parse_cmit_list(args.infile)
+    if args.file_index is not None:
+        file_idx = build_or_update(args.repo, args.file_index)
 
-    added_loc_list = []
-    del_loc_list = []
-    num_msg_list = []
-    t_submit_list = []
-    t_push_list = []
-    num_revision_list = []
-    t_plus2_list = []
-    num_unresolved_list = []
-    is_unittested_list = []
-    is_unittest_list = []
-    num_comments_list = []
-    for index, cmit in enumerate(cmit_list):
-        stat_list = do_git_show(args.repo, cmit)
-        added_loc, del_loc = calc_stat(stat_list)
-        added_loc_list.append(added_loc)
-        del_loc_list.append(del_loc)
-
-        # unit test related
-        files_changed = get_changed_fnames(args.repo, cmit)
-        is_unittested, is_unittest = get_unit_test(files_changed)
-        is_unittested_list.append(is_unittested)
-        is_unittest_list.append(is_unittest)
-
-        # get changeid from commit
-        changeid = get_change_id(args.repo, cmit)
-
-        # extract gerrit related stats
-        gerrit_stats = get_gerrit_stat(args.repo, cmit, changeid)
-        if len(gerrit_stats) == 0:
-            # query to gerrit failed, fill -1 for placeholder
-            num_msg_list.append(-1)
-            t_submit_list.append(-1)
-            t_push_list.append(-1)
-            num_revision_list.append(-1)
-            t_plus2_list.append(-1)
-            num_unresolved_list.append(-1)
-            num_comments_list.append(-1)
-        else:
-            num_msg_list.append(gerrit_stats['num_msg'])
-            t_submit_list.append(gerrit_stats['submit_time'])
-            t_push_list.append(gerrit_stats['push_time'])
-            num_revision_list.append(gerrit_stats['num_revision'])
-            t_plus2_list.append(gerrit_stats['plus_2'])
-            num_unresolved_list.append(gerrit_stats['unresolved'])
-            num_comments_list.append(gerrit_stats['num_comments'])
-
-    df['lines_added'] = added_loc_list
-    df['lines_removed'] = del_loc_list
-    df['num_msg'] = num_msg_list
-    df['time_uploaded'] = t_submit_list
-    df['time_pushed'] = t_push_list
-    df['time_plus2'] = t_plus2_list
-    df['num_revisions'] = num_revision_list
-    df['num_unresolved_comments'] = num_unresolved_list
-    df['is_unittested'] = is_unittested_list
-    df['is_unittest_only'] = is_unittest_list
-    df['num_comments'] = num_comments_list
+    if args.dedup:
+        groups, changeids = dedup_commits(args.repo, cmit_list)
+    else:
+        groups = {cmit: cmit for cmit in cmit_list}
+        changeids = {}
+
+    # one extraction per group, fanned out to all members below
+    group_stats = {}
+    events = [] if args.events is not None else None
+    limits = limits_from_args(args)
+    quarantine = []
+    for cmit in cmit_list:
+        group = groups[cmit]
+        if group not in group_stats:
+            stats = extract_commit(args.repo, group, changeids.get(group), events, limits, quarantine)
+            group_stats[group] = stats if stats is not None else placeholder_stats()
+    if args.dedup:
+        print('extracted %d groups for %d commits' % (len(group_stats), len(cmit_list)))
+
+    for col in OUTPUT_COLUMNS:
+        df[col] = [group_stats[groups[cmit]][col] for cmit in cmit_list]
+    if args.file_index is not None:
+        for col, values in zip(PRIOR_COLUMNS, prior_stats(file_idx, cmit_list)):
+            df[col] = values
+    if args.hunks:
+        for col, values in zip(HUNK_COLUMNS, hunk_columns(args.repo, cmit_list)):
+            df[col] = values
+    if args.dedup:
+        df['dup_group'] = [groups[cmit] for cmit in cmit_list]
 
     # finished getting added LOC and removed LOC
     df.to_csv(args.outfile)
+    if args.events is not None:
+        events_frame(events).to_csv(args.events, index=False)
+    if len(quarantine) > 0:
+        write_quarantine(args.quarantine or args.outfile + '.quarantine.csv', quarantine)
 
 
 if __name__ == '__main__':
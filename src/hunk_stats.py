@@ -0,0 +1,180 @@
+#!/bin/env python
+
+import argparse
+import re
+import subprocess
+import pandas as pd
+
+COMMIT_MARK = b'\x00'
+HUNK_RE = re.compile(rb'^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@ ?(.*)$')
+HUNK_COLUMNS = ['hunks', 'functions_touched', 'substantive_lines', 'whitespace_lines', 'largest_hunk',
+                'binary_files']
+
+
+class HunkStats:
+    """
+    Hunk statistics of one commit, folded line by line
+
+    Only counters are kept, plus the removed lines of the current block of
+    changes, so memory does not grow with the size of the diff.
+
+    A changed line is whitespace when it is blank, or when a removed and an
+    added line of one block only differ in whitespace (e.g. re-indented code);
+    both lines of such a pair count.
+    """
+
+    __slots__ = ['hunks', 'functions', 'substantive', 'whitespace', 'largest', 'binary', 'file',
+                 'hunk_size', 'removed']
+
+    def __init__(self):
+        self.hunks = 0
+        # (file, function context of the hunk header)
+        self.functions = set()
+        self.substantive = 0
+        self.whitespace = 0
+        self.largest = 0
+        self.binary = 0
+        self.file = None
+        self.hunk_size = 0
+        # whitespace-free content -> count, of the removed lines not paired yet
+        self.removed = {}
+
+    def start_hunk(self, context):
+        self.end_hunk()
+        self.hunks += 1
+        if context:
+            self.functions.add((self.file, context))
+
+    def end_hunk(self):
+        self.end_block()
+        self.largest = max(self.largest, self.hunk_size)
+        self.hunk_size = 0
+
+    def end_block(self):
+        # removed lines no added line matched
+        self.substantive += sum(self.removed.values())
+        self.removed = {}
+
+    def changed_line(self, content, removed):
+        self.hunk_size += 1
+        key = b''.join(content.split())
+        if not key:
+            self.whitespace += 1
+        elif removed:
+            # a diff lists the removed lines of a block before the added ones
+            self.removed[key] = self.removed.get(key, 0) + 1
+        elif self.removed.get(key, 0) > 0:
+            self.removed[key] -= 1
+            self.whitespace += 2
+        else:
+            self.substantive += 1
+
+    def row(self):
+        self.end_hunk()
+        return [self.hunks, len(self.functions), self.substantive, self.whitespace, self.largest,
+                self.binary]
+
+
+def parse_diff_stream(lines):
+    """
+    Fold a `git log -p --format=%x00%H` byte stream into per-commit stats
+
+    The line counts of every hunk header tell where the hunk ends, so removed
+    lines starting with "--" are not taken for file headers.
+
+    Yields:
+        (hash, HunkStats)
+    """
+    cmit = None
+    stats = None
+    old_left = new_left = 0
+    for line in lines:
+        if old_left > 0 or new_left > 0:
+            tag = line[:1]
+            if tag == b'-':
+                old_left -= 1
+                stats.changed_line(line[1:], True)
+                continue
+            if tag == b'+':
+                new_left -= 1
+                stats.changed_line(line[1:], False)
+                continue
+            if tag == b' ' or line == b'\n':
+                old_left -= 1
+                new_left -= 1
+                stats.end_block()
+                continue
+            if tag == b'\\':
+                # "\ No newline at end of file"
+                continue
+            # malformed hunk, resync on the headers below
+            old_left = new_left = 0
+
+        if line.startswith(COMMIT_MARK):
+            if cmit is not None:
+                yield cmit, stats
+            cmit = line[1:].strip().decode()
+            stats = HunkStats()
+        elif stats is None:
+            continue
+        elif line.startswith(b'diff --git '):
+            stats.end_hunk()
+            stats.file = line[len(b'diff --git '):].rstrip(b'\n')
+        elif line.startswith(b'@@ '):
+            m = HUNK_RE.match(line.rstrip(b'\n'))
+            if m is None:
+                continue
+            old_left = 1 if m.group(1) is None else int(m.group(1))
+            new_left = 1 if m.group(2) is None else int(m.group(2))
+            stats.start_hunk(m.group(3).strip())
+        elif line.startswith(b'Binary files ') or line.startswith(b'GIT binary patch'):
+            stats.binary += 1
+    if cmit is not None:
+        yield cmit, stats
+
+
+def hunk_stats(repo, hashes):
+    """ hash -> HUNK_COLUMNS values, from one `git log -p --stdin` stream """
+    cmd = ['git', 'log', '--no-walk=unsorted', '--stdin', '-p', '--no-color', '--no-ext-diff',
+           '--format=%x00%H']
+    proc = subprocess.Popen(cmd, cwd=repo, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    # git reads all of stdin before it writes anything, so this can't deadlock
+    proc.stdin.write(('\n'.join(hashes) + '\n').encode())
+    proc.stdin.close()
+    result = {}
+    for cmit, stats in parse_diff_stream(proc.stdout):
+        result[cmit] = stats.row()
+    if proc.wait() != 0:
+        print('Warning: git log -p failed in %s' % repo)
+    return result
+
+
+def hunk_columns(repo, cmit_list):
+    """ One list per HUNK_COLUMNS entry, -1 for commits git did not return """
+    result = hunk_stats(repo, list(dict.fromkeys(cmit_list)))
+    columns = [[] for _ in HUNK_COLUMNS]
+    for cmit in cmit_list:
+        row = result.get(cmit)
+        if row is None:
+            print('Warning: no diff for commit %s' % cmit)
+            row = [-1] * len(HUNK_COLUMNS)
+        for col, value in zip(columns, row):
+            col.append(value)
+    return columns
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hunk-level diff metrics of the selected commits')
+    parser.add_argument('infile', type=str, help='csv with a `hash` column')
+    parser.add_argument('repo', type=str, help='path to the git repo')
+    parser.add_argument('outfile', type=str, help='output csv')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.infile)
+    for col, values in zip(HUNK_COLUMNS, hunk_columns(args.repo, df['hash'].tolist())):
+        df[col] = values
+    df.to_csv(args.outfile, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+#!/bin/env python
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_NAME = '.pipeline_state.json'
+TIMINGS_NAME = 'pipeline_timings.csv'
+# columns copied from the manually labeled csv onto freshly extracted commits
+LABEL_COLUMNS = ['assigned_category', 'manual_category', 'researcher1', 'researcher2',
+                 'researcher2_category', 'final_category', 'disagreement']
+
+
+class Stage:
+    """
+    One step of the pipeline
+
+    A stage is re-run only if its command, the content of its input files or
+    the content of its code files changed since the last successful run, or
+    if one of its outputs is missing.
+    """
+
+    def __init__(self, name, cmd, inputs, outputs, code, deps=()):
+        self.name = name
+        self.cmd = cmd
+        self.inputs = inputs
+        self.outputs = outputs
+        self.code = [os.path.join(SRC_DIR, c) for c in code]
+        self.deps = list(deps)
+
+    def signature(self):
+        h = hashlib.sha1()
+        h.update(json.dumps(self.cmd).encode())
+        for path in self.inputs + self.code:
+            h.update(path.encode())
+            h.update(file_digest(path).encode())
+        return h.hexdigest()
+
+
+def file_digest(path):
+    if not os.path.exists(path):
+        return 'missing'
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def merge_labels(extracted, labels, outfile):
+    """ Join the manual labels (by commit hash) onto freshly extracted stats """
+    df = pd.read_csv(extracted, index_col=0)
+    label_df = pd.read_csv(labels)
+    cols = ['hash'] + [c for c in LABEL_COLUMNS if c in label_df.columns]
+    df = df.drop(columns=[c for c in cols[1:] if c in df.columns])
+    df = df.merge(label_df[cols].drop_duplicates('hash'), on='hash', how='left')
+    df.to_csv(outfile, index=False)
+
+
+def build_stages(args):
+    work = args.work_dir
+    res = args.res_dir
+    py = sys.executable
+    stages = []
+
+    aggregated = os.path.join(res, 'aggregated_result.csv')
+    if args.commit_log is not None:
+        selected = os.path.join(work, 'selected_commits.csv')
+        extracted = os.path.join(work, 'extracted.csv')
+        labeled = os.path.join(work, 'labeled.csv')
+        stages.append(Stage('select', [py, 'commit_select.py', str(args.num_commits), args.commit_log, selected],
+                            [args.commit_log], [selected], ['commit_select.py']))
+        file_index = os.path.join(work, 'file_index.json')
+        stages.append(Stage('extract', [py, 'get_stat.py', selected, args.repo, extracted,
+                                        '--file-index', file_index],
+                            [selected], [extracted], ['get_stat.py', 'get_changeid.sh', 'file_index.py'],
+                            ['select']))
+        stages.append(Stage('label', [py, 'pipeline.py', 'merge-labels', extracted, args.labels, labeled],
+                            [extracted, args.labels], [labeled], ['pipeline.py'], ['extract']))
+        analysis_input = labeled
+        analysis_deps = ['label']
+    else:
+        analysis_input = args.extracted
+        analysis_deps = []
+
+    stages.append(Stage('preprocess', [py, 'analyze_extracted.py', analysis_input, res, '--stage', 'preprocess'],
+                        [analysis_input], [aggregated], ['analyze_extracted.py'], analysis_deps))
+    stages.append(Stage('figures', [py, 'analyze_extracted.py', aggregated, res, '--stage', 'figures'],
+                        [aggregated], [os.path.join(res, 'timediff_vs_class.png')],
+                        ['analyze_extracted.py', 'issue_report.py', 'sig_tests.py', 'sig_cache.py', 'resampling.py'],
+                        ['preprocess']))
+    sig_out = os.path.join(res, 'sig_tests.csv')
+    stages.append(Stage('sig_tests', [py, 'sig_tests.py', aggregated, '--out', sig_out],
+                        [aggregated], [sig_out], ['sig_tests.py', 'sig_cache.py', 'resampling.py'],
+                        ['preprocess']))
+    return stages
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def run_stage(stage, state, force):
+    """ Returns (status, seconds, signature) """
+    start = time.time()
+    sig = stage.signature()
+    outputs_exist = all(os.path.exists(o) for o in stage.outputs)
+    if not force and outputs_exist and state.get(stage.name) == sig:
+        return 'skipped', time.time() - start, sig
+
+    print('[%s] %s' % (stage.name, ' '.join(stage.cmd)))
+    cp = subprocess.run(stage.cmd, cwd=SRC_DIR, capture_output=True, universal_newlines=True)
+    if cp.returncode != 0:
+        print('Error: stage %s failed' % stage.name)
+        print(cp.stderr)
+        return 'failed', time.time() - start, None
+    return 'ran', time.time() - start, sig
+
+
+def run_pipeline(stages, state_path, workers=2, force=()):
+    """
+    Run the stages in dependency order, independent stages concurrently
+
+    Returns:
+        list of (stage name, status, seconds)
+    """
+    state = load_state(state_path)
+    by_name = {s.name: s for s in stages}
+    done = {}
+    timings = []
+    pending = list(stages)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if any(d not in done for d in stage.deps):
+                    continue
+                pending.remove(stage)
+                if any(done[d] == 'failed' for d in stage.deps):
+                    done[stage.name] = 'failed'
+                    timings.append((stage.name, 'blocked', 0.0))
+                    continue
+                future = pool.submit(run_stage, stage, state, stage.name in force)
+                running[future] = stage
+            if not running:
+                continue
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                status, seconds, sig = future.result()
+                done[stage.name] = status
+                timings.append((stage.name, status, seconds))
+                if sig is not None:
+                    state[stage.name] = sig
+                    save_state(state_path, state)
+
+    missing = [n for n in by_name if n not in done]
+    assert(len(missing) == 0)
+    return timings
+
+
+def report_timings(res_dir, timings):
+    print('%-12s %-8s %10s' % ('stage', 'status', 'seconds'))
+    for name, status, seconds in timings:
+        print('%-12s %-8s %10.2f' % (name, status, seconds))
+    df = pd.DataFrame(timings, columns=['stage', 'status', 'seconds'])
+    df.to_csv(os.path.join(res_dir, TIMINGS_NAME), index=False)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge-labels':
+        if len(sys.argv) != 5:
+            print('usage: pipeline merge-labels <extracted csv> <labels csv> <output csv>')
+            raise ValueError
+        merge_labels(sys.argv[2], sys.argv[3], sys.argv[4])
+        return
+
+    parser = argparse.ArgumentParser(description='Run the mining pipeline, skipping up-to-date stages')
+    parser.add_argument('res_dir', type=str, help='result directory')
+    parser.add_argument('--extracted', type=str, help='start from this extracted and labeled csv')
+    parser.add_argument('--commit-log', type=str, help='start from a `git log --pretty=full` dump')
+    parser.add_argument('--num-commits', type=int, default=300, help='commits to select')
+    parser.add_argument('--repo', type=str, help='path to the git repo (with --commit-log)')
+    parser.add_argument('--labels', type=str, help='csv with manual labels by hash (with --commit-log)')
+    parser.add_argument('--work-dir', type=str, default=None,
+                        help='directory for intermediate files (default: res_dir)')
+    parser.add_argument('--workers', type=int, default=2, help='stages run at the same time')
+    parser.add_argument('--force', type=str, nargs='*', default=[], help='stages to re-run regardless')
+    args = parser.parse_args()
+
+    if (args.commit_log is None) == (args.extracted is None):
+        parser.error('give exactly one of --commit-log or --extracted')
+    if args.commit_log is not None and (args.repo is None or args.labels is None):
+        parser.error('--commit-log needs --repo and --labels')
+
+    # stages run from the source directory, so work with absolute paths
+    for name in ['res_dir', 'extracted', 'commit_log', 'repo', 'labels', 'work_dir']:
+        value = getattr(args, name)
+        if value is not None:
+            setattr(args, name, os.path.abspath(value))
+    args.work_dir = args.work_dir or args.res_dir
+    os.makedirs(args.res_dir, exist_ok=True)
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    stages = build_stages(args)
+    timings = run_pipeline(stages, os.path.join(args.work_dir, STATE_NAME), args.workers, args.force)
+    report_timings(args.res_dir, timings)
+    if any(status in ('failed', 'blocked') for _, status, _ in timings):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
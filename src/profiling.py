@@ -0,0 +1,150 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+REPORT_NAME = 'profile_report.txt'
+PSTATS_NAME = 'profile.pstats'
+# allocation sites listed per step
+TOP_ALLOCS = 5
+TOP_FUNCS = 25
+
+# profiler of the current run, None unless enable() was called
+_active = None
+
+
+class Profiler:
+    """
+    Wall time, peak traced memory and allocation hot spots per analysis step
+
+    Steps may nest (e.g. get_class_plots -> plot_num_revisions); the peak of
+    a step includes the peaks of the steps inside it.
+    """
+
+    def __init__(self, trace_alloc=True, use_cprofile=False):
+        self.trace_alloc = trace_alloc
+        self.steps = []
+        self.stack = []
+        self.cprof = cProfile.Profile() if use_cprofile else None
+
+    def start(self):
+        if self.trace_alloc:
+            tracemalloc.start()
+        if self.cprof is not None:
+            self.cprof.enable()
+
+    def stop(self):
+        if self.cprof is not None:
+            self.cprof.disable()
+        if self.trace_alloc:
+            tracemalloc.stop()
+
+    def snapshot(self):
+        # leave out the profiler's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__)])
+
+    @contextmanager
+    def step(self, name):
+        frame = {'children_peak': 0}
+        # reserve the slot now so steps are listed in start order
+        idx = len(self.steps)
+        self.steps.append(None)
+        if self.trace_alloc and self.stack:
+            # resetting the peak below would lose the parent's peak so far
+            parent = self.stack[-1]
+            parent['children_peak'] = max(parent['children_peak'], tracemalloc.get_traced_memory()[1])
+        self.stack.append(frame)
+        if self.trace_alloc:
+            before = self.snapshot()
+            start_mem = tracemalloc.get_traced_memory()[0]
+            # without reset_peak (python < 3.9) the peak is the peak since start
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.stack.pop()
+            peak = 0
+            top = []
+            if self.trace_alloc:
+                abs_peak = max(tracemalloc.get_traced_memory()[1], frame['children_peak'])
+                peak = abs_peak - start_mem
+                diff = self.snapshot().compare_to(before, 'lineno')
+                top = [str(d) for d in diff[:TOP_ALLOCS]]
+                if self.stack:
+                    parent = self.stack[-1]
+                    parent['children_peak'] = max(parent['children_peak'], abs_peak)
+            self.steps[idx] = (len(self.stack), name, seconds, peak, top)
+
+    def report(self):
+        out = io.StringIO()
+        out.write('%-50s %10s %14s\n' % ('step', 'seconds', 'peak MiB'))
+        for depth, name, seconds, peak, _ in self.steps:
+            label = '  ' * depth + name
+            out.write('%-50s %10.3f %14.2f\n' % (label, seconds, peak / 2 ** 20))
+        if self.trace_alloc:
+            out.write('\nallocation hot spots (net growth per step):\n')
+            for _, name, _, _, top in self.steps:
+                out.write('%s:\n' % name)
+                for line in top:
+                    out.write('\t%s\n' % line)
+        if self.cprof is not None:
+            out.write('\ncProfile (top %d by cumulative time):\n' % TOP_FUNCS)
+            stats = pstats.Stats(self.cprof, stream=out)
+            stats.sort_stats('cumulative').print_stats(TOP_FUNCS)
+        return out.getvalue()
+
+    def write(self, out_dir):
+        report_path = os.path.join(out_dir, REPORT_NAME)
+        with open(report_path, 'w') as f:
+            f.write(self.report())
+        if self.cprof is not None:
+            self.cprof.dump_stats(os.path.join(out_dir, PSTATS_NAME))
+        return report_path
+
+
+def enable(trace_alloc=True, use_cprofile=False):
+    global _active
+    _active = Profiler(trace_alloc, use_cprofile)
+    _active.start()
+    return _active
+
+
+def finish(out_dir):
+    """ Stop profiling and write the report, returns the report path """
+    global _active
+    if _active is None:
+        return None
+    _active.stop()
+    path = _active.write(out_dir)
+    _active = None
+    print('profile report written to %s' % path)
+    return path
+
+
+@contextmanager
+def step(name):
+    if _active is None:
+        yield
+        return
+    with _active.step(name):
+        yield
+
+
+def profile_step(func):
+    """ Record every call of `func` as a step when profiling is enabled """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _active is None:
+            return func(*args, **kwargs)
+        with _active.step(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,295 @@
+#!/bin/env python
+
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from analyze_extracted import FIG_SIZE, XLAB_SIZE, YLAB_SIZE, TICK_SIZE, UTEST_MAP, test_fexist
+
+# accuracy parameter of the sketch, rank error is roughly 1.7/K
+DEFAULT_K = 200
+# rows read per chunk in streaming mode
+CHUNK_ROWS = 100000
+SKETCH_SEED = 11235
+
+CATEGORIES = ['RFE', 'BUG', 'REFAC', 'IMPR']
+METRICS = ['lines_added', 'lines_removed', 'lines_modified', 'num_revisions', 'num_comments',
+           'upload_push_timediff']
+
+# metric -> (figure name, y label) for the per-category box plots of analyze_extracted
+CLASS_PLOTS = {'num_revisions': ('revisions_vs_class.png', 'Revisions'),
+               'upload_push_timediff': ('timediff_vs_class.png', 'Time in Review (days)'),
+               'lines_modified': ('locmod_vs_class.png', 'Modified LOC'),
+               'lines_removed': ('locrm_vs_class.png', 'Removed LOC'),
+               'lines_added': ('locadd_vs_class.png', 'Added LOC')}
+UTEST_PLOTS = {'upload_push_timediff': ('timediff_vs_utest.png', 'Time in Review (days)'),
+               'num_comments': ('comments_vs_utest.png', 'Code Review Comments'),
+               'num_revisions': ('revisions_vs_utest.png', 'Revisions')}
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (Karnin, Lang, Liberty 2016)
+
+    Values are kept in a stack of compactors; level h items carry weight 2^h.
+    A full compactor is sorted and every other item is promoted to the next
+    level, so memory stays O(K log(n/K)) no matter how many values are added.
+    Two sketches built on different shards can be merged into one.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=SKETCH_SEED):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self.rng = np.random.RandomState(seed)
+
+    def capacity(self, height):
+        depth = len(self.levels) - height - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return self
+        self.n += values.size
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+        return self
+
+    def compress(self):
+        height = 0
+        while height < len(self.levels):
+            level = self.levels[height]
+            if level.size >= self.capacity(height):
+                if height + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                level = np.sort(level)
+                # an odd item out stays behind so no weight is lost
+                keep = level[-1:] if level.size % 2 else level[:0]
+                pairs = level[:level.size - keep.size]
+                promoted = pairs[self.rng.randint(2)::2]
+                self.levels[height] = keep
+                self.levels[height + 1] = np.concatenate([self.levels[height + 1], promoted])
+            height += 1
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for height, level in enumerate(other.levels):
+            self.levels[height] = np.concatenate([self.levels[height], level])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+        return self
+
+    def weighted_items(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.size, 2 ** h, dtype=float)
+                                  for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='mergesort')
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        if self.n == 0:
+            return np.nan
+        items, cum_weights = self.weighted_items()
+        targets = np.asarray(q, dtype=float) * cum_weights[-1]
+        idx = np.searchsorted(cum_weights, targets, side='left')
+        res = items[np.minimum(idx, items.size - 1)]
+        # the exact extremes are tracked separately
+        res = np.where(np.asarray(q) <= 0, self.min, res)
+        res = np.where(np.asarray(q) >= 1, self.max, res)
+        return res if res.ndim else float(res)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def rank(self, value):
+        """ Approximate number of values <= `value` """
+        if self.n == 0:
+            return 0
+        items, cum_weights = self.weighted_items()
+        idx = np.searchsorted(items, value, side='right')
+        if idx == 0:
+            return 0
+        # stored weights only approximate n, rescale to the exact count
+        return cum_weights[idx - 1] / cum_weights[-1] * self.n
+
+    def box_stats(self, label, whis=1.5):
+        """
+        Box plot statistics in the format of matplotlib `Axes.bxp`
+
+        Whiskers are clipped to the most extreme retained value within
+        `whis` IQRs, retained values outside of them are reported as fliers.
+        """
+        q1, med, q3 = self.quantile([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        items = np.concatenate(self.levels + [np.array([self.min, self.max])])
+        inside = items[(items >= q1 - whis * iqr) & (items <= q3 + whis * iqr)]
+        whislo = inside.min() if inside.size else q1
+        whishi = inside.max() if inside.size else q3
+        fliers = np.unique(items[(items < whislo) | (items > whishi)])
+        return {'label': label, 'med': med, 'q1': q1, 'q3': q3,
+                'whislo': whislo, 'whishi': whishi, 'fliers': fliers}
+
+    def to_dict(self):
+        return {'k': self.k, 'n': int(self.n), 'min': float(self.min), 'max': float(self.max),
+                'levels': [level.tolist() for level in self.levels]}
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls(d['k'])
+        sketch.n = d['n']
+        sketch.min = d['min']
+        sketch.max = d['max']
+        sketch.levels = [np.asarray(level, dtype=float) for level in d['levels']]
+        return sketch
+
+
+def update_group_sketches(sketches, df, group_col, metrics, k=DEFAULT_K):
+    for group, part in df.groupby(group_col):
+        metric_sketches = sketches.setdefault(group, {})
+        for m in metrics:
+            if m not in metric_sketches:
+                metric_sketches[m] = KLLSketch(k)
+            metric_sketches[m].update(part[m].values)
+    return sketches
+
+
+def unittest_groups(df):
+    # same split as get_unittested_vs_non: unit-test-only changes are not "non_unittested"
+    df = df[(df['is_unittested'] == True) | (df['is_unittest_only'] == False)]
+    groups = np.where(df['is_unittested'] == True, 'unittested', 'non_unittested')
+    return df.assign(utest_group=groups)
+
+
+def stream_sketches(inpath, metrics=METRICS, chunksize=CHUNK_ROWS, k=DEFAULT_K):
+    """
+    Build per-category and per unit-test-group sketches from a csv in chunks
+
+    Args:
+        inpath: aggregated_result.csv (output of analyze_extracted preprocess)
+        metrics: numeric columns to sketch
+        chunksize: rows held in memory at once
+        k: sketch accuracy parameter
+
+    Returns:
+        dict of grouping name -> group value -> metric -> KLLSketch
+    """
+    assert(test_fexist(inpath))
+    usecols = metrics + ['final_category', 'is_unittested', 'is_unittest_only']
+    sketches = {'final_category': {}, 'utest_group': {}}
+    for chunk in pd.read_csv(inpath, usecols=usecols, chunksize=chunksize):
+        update_group_sketches(sketches['final_category'], chunk, 'final_category', metrics, k)
+        update_group_sketches(sketches['utest_group'], unittest_groups(chunk), 'utest_group', metrics, k)
+    return sketches
+
+
+def merge_sketches(dst, src):
+    for grouping, groups in src.items():
+        for group, metric_sketches in groups.items():
+            dst_metrics = dst.setdefault(grouping, {}).setdefault(group, {})
+            for m, sketch in metric_sketches.items():
+                if m in dst_metrics:
+                    dst_metrics[m].merge(sketch)
+                else:
+                    dst_metrics[m] = sketch
+    return dst
+
+
+def save_sketches(outpath, sketches):
+    out = {grouping: {str(group): {m: s.to_dict() for m, s in metric_sketches.items()}
+                      for group, metric_sketches in groups.items()}
+           for grouping, groups in sketches.items()}
+    with open(outpath, 'w') as f:
+        json.dump(out, f)
+
+
+def load_sketches(inpath):
+    assert(test_fexist(inpath))
+    with open(inpath, 'r') as f:
+        raw = json.load(f)
+    return {grouping: {group: {m: KLLSketch.from_dict(d) for m, d in metric_sketches.items()}
+                       for group, metric_sketches in groups.items()}
+            for grouping, groups in raw.items()}
+
+
+def sketch_medians(groups, var, categories):
+    """ Same output as sig_tests.get_medians, but read from sketches """
+    medians = []
+    for c in categories:
+        if c not in groups:
+            medians.append((c, np.nan))
+            continue
+        medians.append((c, groups[c][var].median()))
+    return medians
+
+
+def plot_sketch_box(res_dir, groups, var, labels, image, ylabel):
+    present = [g for g in labels if g in groups]
+    if len(present) == 0:
+        print('Warning: no data for %s, skipping %s' % (var, image))
+        return
+    box_stats = [groups[g][var].box_stats(labels[g]) for g in present]
+
+    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    ax.bxp(box_stats)
+    ax.set_xticklabels([labels[g] for g in present], fontsize=XLAB_SIZE)
+    ax.set_ylabel(ylabel, fontsize=YLAB_SIZE)
+    ax.tick_params(labelsize=TICK_SIZE)
+
+    plt.savefig(res_dir + '/' + image)
+    plt.close()
+
+
+def plot_sketches(res_dir, sketches):
+    cat_labels = {c: c for c in CATEGORIES}
+    for var, (image, ylabel) in CLASS_PLOTS.items():
+        plot_sketch_box(res_dir, sketches['final_category'], var, cat_labels, image, ylabel)
+    for var, (image, ylabel) in UTEST_PLOTS.items():
+        plot_sketch_box(res_dir, sketches['utest_group'], var, UTEST_MAP, image, ylabel)
+
+
+def print_summary(sketches):
+    for grouping, groups in sketches.items():
+        print('grouped by %s:' % grouping)
+        for group, metric_sketches in sorted(groups.items()):
+            for m, s in metric_sketches.items():
+                q1, med, q3 = s.quantile([0.25, 0.5, 0.75])
+                print('\t%s %s: n=%d q1=%s median=%s q3=%s' % (group, m, s.n, q1, med, q3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream aggregated results into quantile sketches')
+    parser.add_argument('infiles', type=str, nargs='+',
+                        help='aggregated_result.csv files, or sketch json files with --merge')
+    parser.add_argument('res_dir', type=str, help='result directory')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS, help='rows read per chunk')
+    parser.add_argument('-k', type=int, default=DEFAULT_K, help='sketch accuracy parameter')
+    parser.add_argument('--merge', action='store_true', help='inputs are sketch files from shards')
+    parser.add_argument('--no-plots', action='store_true', help='only write the sketches')
+    args = parser.parse_args()
+
+    sketches = {}
+    for inpath in args.infiles:
+        if args.merge:
+            part = load_sketches(inpath)
+        else:
+            part = stream_sketches(inpath, chunksize=args.chunksize, k=args.k)
+        merge_sketches(sketches, part)
+
+    save_sketches(args.res_dir + '/' + 'sketches.json', sketches)
+    print_summary(sketches)
+    if not args.no_plots:
+        plot_sketches(args.res_dir, sketches)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+#!/bin/env python
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import optimize, sparse, special, stats
+from sig_tests import ISSUE_TYPES
+
+OUTCOMES = ['upload_push_timediff', 'num_revisions', 'num_comments']
+MODELS = ['loglinear', 'negbin']
+CATEGORY_COL = 'final_category'
+PROJECT_COL = 'project'
+MAX_ITER = 100
+TOL = 1e-8
+# keeps exp() of the linear predictor finite while IRLS is far from the optimum
+MAX_ETA = 50
+# search range of log(alpha), the negative binomial dispersion
+LOG_ALPHA_BOUNDS = (-12, 6)
+COEF_COLUMNS = ['outcome', 'model', 'term', 'coef', 'std_err', 'z', 'p_value', 'conf_low', 'conf_high',
+                'exp_coef']
+FIT_COLUMNS = ['outcome', 'model', 'n', 'params', 'loglik', 'aic', 'alpha', 'r2', 'iterations', 'converged']
+COEF_NAME = 'regression_coefs.csv'
+FIT_NAME = 'regression_fits.csv'
+
+
+def as_flags(series):
+    return series.astype(str).isin(['True', '1', '1.0']).values.astype(float)
+
+
+def dummies(values, levels, name):
+    """ Sparse one-hot columns of every level but the first, which is the reference """
+    codes = pd.Categorical(values, categories=levels).codes
+    rows = np.flatnonzero(codes > 0)
+    matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, codes[rows] - 1)),
+                               shape=(len(values), len(levels) - 1))
+    return matrix, ['%s[%s]' % (name, level) for level in levels[1:]]
+
+
+def build_design(df, project_col=PROJECT_COL):
+    """
+    Sparse design matrix: intercept, log LOC, unit tested, category and project fixed effects
+
+    Rows of categories outside ISSUE_TYPES are expected to be dropped
+    beforehand; BUG and the first project are the reference levels.
+
+    Returns:
+        (csr matrix, list of term names)
+    """
+    n = len(df)
+    dense = np.column_stack([np.ones(n), np.log1p(df['lines_modified'].values.astype(float)),
+                             as_flags(df['is_unittested'])])
+    blocks = [sparse.csr_matrix(dense)]
+    terms = ['intercept', 'log_lines_modified', 'is_unittested']
+    matrix, names = dummies(df[CATEGORY_COL].values, ISSUE_TYPES, 'category')
+    blocks.append(matrix)
+    terms += names
+    if project_col in df.columns:
+        levels = sorted(df[project_col].astype(str).unique())
+        matrix, names = dummies(df[project_col].astype(str).values, levels, 'project')
+        blocks.append(matrix)
+        terms += names
+    return sparse.hstack(blocks, format='csr'), terms
+
+
+def solve(gram, rhs):
+    try:
+        return np.linalg.solve(gram, rhs)
+    except np.linalg.LinAlgError:
+        return np.linalg.lstsq(gram, rhs, rcond=None)[0]
+
+
+def fit_loglinear(X, y):
+    """ OLS of log(1 + y), for durations and counts alike; the log likelihood is on the scale of y """
+    z = np.log1p(y)
+    gram = (X.T @ X).toarray()
+    beta = solve(gram, X.T @ z)
+    resid = z - X @ beta
+    n, p = X.shape
+    sigma2 = resid @ resid / max(n - p, 1)
+    cov = sigma2 * np.linalg.pinv(gram)
+    # the normal likelihood of z, times the Jacobian dz/dy = 1 / (1 + y), is the
+    # likelihood of y itself, so the AIC can be compared with the negbin model's
+    loglik = -n / 2 * (np.log(2 * np.pi * resid @ resid / n) + 1) - z.sum()
+    r2 = 1 - resid @ resid / ((z - z.mean()) @ (z - z.mean()))
+    return {'beta': beta, 'cov': cov, 'loglik': loglik, 'alpha': np.nan, 'r2': r2, 'iterations': 1,
+            'converged': True}
+
+
+def negbin_loglik(y, mu, alpha):
+    inv = 1 / alpha
+    return np.sum(special.gammaln(y + inv) - special.gammaln(inv) - special.gammaln(y + 1)
+                  - inv * np.log1p(alpha * mu) + y * (np.log(alpha * mu) - np.log1p(alpha * mu)))
+
+
+def fit_negbin(X, y, max_iter=MAX_ITER, tol=TOL):
+    """
+    NB2 regression with a log link
+
+    Alternates a Fisher scoring (IRLS) step for the coefficients with a
+    one-dimensional maximum likelihood update of the dispersion alpha.
+    """
+    # the log-linear fit is a close enough start
+    beta = solve((X.T @ X).toarray(), X.T @ np.log1p(y))
+    log_alpha = 0.0
+    converged = False
+    for it in range(1, max_iter + 1):
+        alpha = np.exp(log_alpha)
+        eta = np.clip(X @ beta, -MAX_ETA, MAX_ETA)
+        mu = np.exp(eta)
+        w = mu / (1 + alpha * mu)
+        z = eta + (y - mu) / mu
+        gram = (X.T @ X.multiply(w[:, None])).toarray()
+        new_beta = solve(gram, X.T @ (w * z))
+
+        mu = np.exp(np.clip(X @ new_beta, -MAX_ETA, MAX_ETA))
+        res = optimize.minimize_scalar(lambda a: -negbin_loglik(y, mu, np.exp(a)), bounds=LOG_ALPHA_BOUNDS,
+                                       method='bounded')
+        step = max(np.abs(new_beta - beta).max(), abs(res.x - log_alpha))
+        beta, log_alpha = new_beta, res.x
+        if step < tol:
+            converged = True
+            break
+
+    alpha = np.exp(log_alpha)
+    mu = np.exp(np.clip(X @ beta, -MAX_ETA, MAX_ETA))
+    w = mu / (1 + alpha * mu)
+    cov = np.linalg.pinv((X.T @ X.multiply(w[:, None])).toarray())
+    return {'beta': beta, 'cov': cov, 'loglik': negbin_loglik(y, mu, alpha), 'alpha': alpha, 'r2': np.nan,
+            'iterations': it, 'converged': converged}
+
+
+FITTERS = {'loglinear': fit_loglinear, 'negbin': fit_negbin}
+
+
+def fit_model(outcome, model, X, y, terms, alpha=0.05):
+    """
+    Fit one model of one outcome, runs in a worker process
+
+    Columns without any nonzero value in the rows of this outcome (e.g. a
+    category no commit has) are dropped rather than left unidentified.
+
+    Returns:
+        (coefficient rows, fit row)
+    """
+    keep = np.flatnonzero(X.getnnz(axis=0) > 0)
+    X = X[:, keep]
+    terms = [terms[i] for i in keep]
+    fit = FITTERS[model](X, y)
+    if not fit['converged']:
+        print('Warning: %s model of %s did not converge' % (model, outcome))
+
+    se = np.sqrt(np.clip(np.diag(fit['cov']), 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = fit['beta'] / se
+    p_value = 2 * stats.norm.sf(np.abs(z))
+    crit = stats.norm.ppf(1 - alpha / 2)
+    coefs = []
+    for i, term in enumerate(terms):
+        b = fit['beta'][i]
+        coefs.append([outcome, model, term, b, se[i], z[i], p_value[i], b - crit * se[i], b + crit * se[i],
+                      np.exp(b)])
+    # plus the error variance of the log-linear model or the dispersion of the negbin model
+    params = len(terms) + 1
+    fit_row = [outcome, model, len(y), params, fit['loglik'], 2 * params - 2 * fit['loglik'], fit['alpha'],
+               fit['r2'], fit['iterations'], fit['converged']]
+    return coefs, fit_row
+
+
+def project_name(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    # compare_projects.py leaves <res_dir>/<project>/aggregated_result.csv
+    if name == 'aggregated_result':
+        name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return name
+
+
+def load_datasets(infiles, names):
+    """ Concatenate preprocessed datasets, with a project column if there is more than one """
+    frames = []
+    for path, name in zip(infiles, names):
+        df = pd.read_csv(path)
+        if len(infiles) > 1:
+            df[PROJECT_COL] = name
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def run_models(df, outcomes=OUTCOMES, models=MODELS, project_col=PROJECT_COL, workers=None):
+    """
+    Fit every model of every outcome, in parallel
+
+    Returns:
+        (coefficient table, fit table)
+    """
+    df = df[df[CATEGORY_COL].isin(ISSUE_TYPES)]
+    df = df[pd.to_numeric(df['lines_modified'], errors='coerce') >= 0]
+    X, terms = build_design(df, project_col)
+
+    jobs = []
+    for outcome in outcomes:
+        if outcome not in df.columns:
+            print('Warning: no %s column, skipping' % outcome)
+            continue
+        y = pd.to_numeric(df[outcome], errors='coerce').values.astype(float)
+        # -1 marks values that could not be extracted
+        rows = np.flatnonzero(np.isfinite(y) & (y >= 0))
+        if len(rows) <= len(terms):
+            print('Warning: too few rows to model %s' % outcome)
+            continue
+        for model in models:
+            jobs.append((outcome, model, X[rows], y[rows], terms))
+
+    coefs = []
+    fits = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for c, f in pool.map(fit_model, *zip(*jobs)) if jobs else []:
+            coefs += c
+            fits.append(f)
+    return pd.DataFrame(coefs, columns=COEF_COLUMNS), pd.DataFrame(fits, columns=FIT_COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Regress review effort on size, unit testing and category')
+    parser.add_argument('infiles', type=str, nargs='+', help='preprocessed csvs (aggregated_result.csv)')
+    parser.add_argument('res_dir', type=str, help='result directory')
+    parser.add_argument('--names', type=str, nargs='+', default=None,
+                        help='project names of the input files (default: file or directory names)')
+    parser.add_argument('--project-col', type=str, default=PROJECT_COL,
+                        help='column with the project of every row, gets fixed effects')
+    parser.add_argument('--outcomes', type=str, nargs='+', default=OUTCOMES, help='dependent variables')
+    parser.add_argument('--models', type=str, nargs='+', default=MODELS, choices=MODELS)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes')
+    args = parser.parse_args()
+
+    names = args.names or [project_name(f) for f in args.infiles]
+    if len(names) != len(args.infiles) or len(set(names)) != len(names):
+        parser.error('need one distinct name per input file')
+    df = load_datasets(args.infiles, names)
+    project_col = PROJECT_COL if len(args.infiles) > 1 else args.project_col
+    coefs, fits = run_models(df, args.outcomes, args.models, project_col, args.workers)
+
+    os.makedirs(args.res_dir, exist_ok=True)
+    coefs.to_csv(os.path.join(args.res_dir, COEF_NAME), index=False)
+    fits.to_csv(os.path.join(args.res_dir, FIT_NAME), index=False)
+    shown = coefs[~coefs['term'].str.startswith('project[')]
+    print(shown.round(4).to_string(index=False))
+    print(fits.round(4).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/bin/env python
+
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy import special, stats
+
+DEFAULT_RESAMPLES = 10000
+RESAMPLE_SEED = 11235
+# resamples per shard; every shard gets its own child seed, so results do not
+# depend on how shards are spread over worker processes
+SHARD_SIZE = 1000
+# upper bound on cells of a resample matrix built in one vectorized call
+MAX_BATCH_CELLS = 10 ** 7
+
+
+def clean(values):
+    values = np.asarray(values, dtype=float)
+    return values[np.isfinite(values)]
+
+
+def batches(num_resamples, cells_per_resample):
+    batch = max(1, MAX_BATCH_CELLS // max(1, cells_per_resample))
+    while num_resamples > 0:
+        yield min(batch, num_resamples)
+        num_resamples -= batch
+
+
+def order_stat_from_counts(uniq, counts, k):
+    """ k-th smallest value (0 based) of each row of multiplicities `counts` """
+    cum = np.cumsum(counts, axis=1)
+    return uniq[(cum <= k).sum(axis=1)]
+
+
+def bootstrap_medians(values, num_resamples, seed):
+    """
+    Medians of `num_resamples` bootstrap resamples of `values`
+
+    A resample only changes how often each distinct value is drawn, so the
+    resamples are drawn as multinomial counts over the distinct values.
+    For integer metrics (LOC, revisions, days) there are far fewer distinct
+    values than rows, which keeps each batch small.
+    """
+    rng = np.random.default_rng(seed)
+    n = values.size
+    uniq, freq = np.unique(values, return_counts=True)
+    lo_k, hi_k = (n - 1) // 2, n // 2
+    medians = []
+    for b in batches(num_resamples, uniq.size):
+        counts = rng.multinomial(n, freq / n, size=b)
+        lo = order_stat_from_counts(uniq, counts, lo_k)
+        hi = order_stat_from_counts(uniq, counts, hi_k)
+        medians.append((lo + hi) / 2)
+    return np.concatenate(medians)
+
+
+def bootstrap_median_diffs(a, b, num_resamples, seed):
+    # a and b are resampled independently, each with its own child seed
+    seed_a, seed_b = seed.spawn(2)
+    return bootstrap_medians(a, num_resamples, seed_a) - bootstrap_medians(b, num_resamples, seed_b)
+
+
+def permuted_rank_sums(ranks, n_a, num_resamples, seed):
+    """
+    Rank sums of random size-`n_a` subsets of the pooled ranks
+
+    Tied values share a rank, so a random subset is fully described by how
+    many members of each tie group it takes, which is a multivariate
+    hypergeometric draw over the tie groups.
+    """
+    rng = np.random.default_rng(seed)
+    uniq, counts = np.unique(ranks, return_counts=True)
+    sums = []
+    for b in batches(num_resamples, uniq.size):
+        draws = rng.multivariate_hypergeometric(counts, n_a, size=b, method='marginals')
+        sums.append(draws @ uniq)
+    return np.concatenate(sums)
+
+
+def run_sharded(func, args, num_resamples, seed, workers=1):
+    """
+    Split `num_resamples` into shards with reproducible child seeds
+
+    Args:
+        func: func(*args, num_resamples, seed) returning an array of statistics
+        args: leading arguments of func, must be picklable
+        num_resamples: total number of resamples
+        seed: base seed
+        workers: number of worker processes
+
+    Returns:
+        concatenated array of the statistics of all shards
+    """
+    sizes = [SHARD_SIZE] * (num_resamples // SHARD_SIZE)
+    if num_resamples % SHARD_SIZE:
+        sizes.append(num_resamples % SHARD_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [tuple(args) + (size, s) for size, s in zip(sizes, seeds)]
+    if workers <= 1 or len(jobs) == 1:
+        parts = [func(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(func, *zip(*jobs)))
+    return np.concatenate(parts)
+
+
+def percentile_ci(estimates, alpha):
+    return tuple(np.percentile(estimates, [100 * alpha / 2, 100 * (1 - alpha / 2)]))
+
+
+def bootstrap_median_ci(values, num_resamples=DEFAULT_RESAMPLES, alpha=0.05, seed=RESAMPLE_SEED, workers=1):
+    """
+    Percentile bootstrap confidence interval of the median
+
+    Returns:
+        tuple of median, lower bound, upper bound
+    """
+    values = clean(values)
+    if values.size == 0:
+        return np.nan, np.nan, np.nan
+    medians = run_sharded(bootstrap_medians, (values,), num_resamples, seed, workers)
+    low, high = percentile_ci(medians, alpha)
+    return np.median(values), low, high
+
+
+def bootstrap_proportions(num_true, n, num_resamples, seed):
+    # a resample of 0/1 values is a binomial draw of how many are 1
+    rng = np.random.default_rng(seed)
+    return rng.binomial(n, num_true / n, size=num_resamples) / n
+
+
+def bootstrap_proportion_ci(flags, num_resamples=DEFAULT_RESAMPLES, alpha=0.05, seed=RESAMPLE_SEED, workers=1):
+    """
+    Percentile bootstrap confidence interval of the share of true values (e.g. the unit test ratio)
+
+    Returns:
+        tuple of share, lower bound, upper bound
+    """
+    flags = np.asarray(flags, dtype=bool)
+    if flags.size == 0:
+        return np.nan, np.nan, np.nan
+    num_true = int(flags.sum())
+    shares = run_sharded(bootstrap_proportions, (num_true, flags.size), num_resamples, seed, workers)
+    low, high = percentile_ci(shares, alpha)
+    return num_true / flags.size, low, high
+
+
+def bootstrap_median_diff_ci(a, b, num_resamples=DEFAULT_RESAMPLES, alpha=0.05, seed=RESAMPLE_SEED, workers=1):
+    """
+    Percentile bootstrap confidence interval of median(a) - median(b), the effect size
+
+    Returns:
+        tuple of difference, lower bound, upper bound
+    """
+    a = clean(a)
+    b = clean(b)
+    if a.size == 0 or b.size == 0:
+        return np.nan, np.nan, np.nan
+    diffs = run_sharded(bootstrap_median_diffs, (a, b), num_resamples, seed, workers)
+    low, high = percentile_ci(diffs, alpha)
+    return np.median(a) - np.median(b), low, high
+
+
+def permutation_test(a, b, num_resamples=DEFAULT_RESAMPLES, seed=RESAMPLE_SEED, workers=1):
+    """
+    Two-sided permutation test on the Mann-Whitney U statistic
+
+    The pooled data is ranked once, every permutation only sums the ranks of
+    a random subset. If there are no more distinct splits than
+    `num_resamples`, all of them are enumerated and the p value is exact.
+
+    Returns:
+        tuple of U value, p value
+    """
+    a = clean(a)
+    b = clean(b)
+    n_a, n_b = a.size, b.size
+    if n_a == 0 or n_b == 0:
+        return np.nan, np.nan
+    ranks = stats.rankdata(np.concatenate([a, b]))
+    offset = n_a * (n_a + 1) / 2
+    u_obs = ranks[:n_a].sum() - offset
+    center = n_a * n_b / 2
+
+    if special.comb(n_a + n_b, n_a) <= num_resamples:
+        rank_sums = np.array([ranks[list(c)].sum()
+                              for c in itertools.combinations(range(n_a + n_b), n_a)])
+        extreme = np.abs(rank_sums - offset - center) >= abs(u_obs - center) - 1e-9
+        return u_obs, extreme.mean()
+
+    rank_sums = run_sharded(permuted_rank_sums, (ranks, n_a), num_resamples, seed, workers)
+    extreme = np.abs(rank_sums - offset - center) >= abs(u_obs - center) - 1e-9
+    # add the observed split so the p value is never 0
+    return u_obs, (extreme.sum() + 1) / (rank_sums.size + 1)
@@ -0,0 +1,176 @@
+#!/bin/env python
+
+import argparse
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# Gerrit message text, e.g. "Uploaded patch set 3." or "Patch Set 2: Code-Review+2 Commit-Queue+2"
+UPLOAD_RE = re.compile(r'Uploaded patch set \d+')
+VOTE_RE = re.compile(r'\b(Code-Review|Verified|Commit-Queue)([+-]\d)\b')
+COMMENTS_RE = re.compile(r'\((\d+) comments?\)')
+MERGE_RE = re.compile(r'Change has been successfully (merged|pushed|cherry-picked)')
+# automated accounts are not reviewers
+BOT_RE = re.compile(r'bot|gerrit|service|\bCQ\b', re.IGNORECASE)
+GERRIT_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+KINDS = ['upload', 'vote', 'comment', 'message', 'merge']
+LABELS = ['', 'Code-Review', 'Verified', 'Commit-Queue']
+EVENT_COLUMNS = ['change', 'revision', 'author', 'kind', 'label', 'vote', 'timestamp']
+LATENCY_NAME = 'reviewer_latency.csv'
+CHANGE_SUMMARY_NAME = 'review_summary.csv'
+NO_AUTHOR = -1
+
+
+def author_of(msg):
+    """ Gerrit account id of the message author, NO_AUTHOR for bots and system messages """
+    author = msg.get('author')
+    if author is None:
+        return NO_AUTHOR
+    if BOT_RE.search(author.get('name', '')) or BOT_RE.search(author.get('email', '')):
+        return NO_AUTHOR
+    return author.get('_account_id', NO_AUTHOR)
+
+
+def message_events(change, injson):
+    """
+    Walk the messages of one change once
+
+    Returns:
+        list of event tuples in EVENT_COLUMNS order, the timestamp still a string
+    """
+    events = []
+    for msg in injson:
+        text = msg.get('message', '')
+        rev = msg.get('_revision_number', 0)
+        author = author_of(msg)
+        date = msg['date'][:19]
+        votes = VOTE_RE.findall(text)
+        for label, vote in votes:
+            events.append((change, rev, author, 'vote', label, int(vote), date))
+
+        if UPLOAD_RE.search(text):
+            kind = 'upload'
+        elif MERGE_RE.search(text):
+            kind = 'merge'
+        elif COMMENTS_RE.search(text):
+            kind = 'comment'
+        elif votes:
+            # the votes above already stand for this message
+            continue
+        else:
+            kind = 'message'
+        events.append((change, rev, author, kind, '', 0, date))
+    return events
+
+
+def events_frame(events):
+    """ Compact event table: categorical change/kind/label, int64 seconds since epoch """
+    df = pd.DataFrame(events, columns=EVENT_COLUMNS)
+    return compact(df)
+
+
+def compact(df):
+    df['change'] = df['change'].astype('category')
+    df['revision'] = df['revision'].astype(np.int32)
+    df['author'] = df['author'].astype(np.int64)
+    df['kind'] = pd.Categorical(df['kind'], categories=KINDS)
+    df['label'] = pd.Categorical(df['label'].fillna(''), categories=LABELS)
+    df['vote'] = df['vote'].astype(np.int8)
+    if not pd.api.types.is_integer_dtype(df['timestamp']):
+        ts = pd.to_datetime(df['timestamp'], format=GERRIT_TIME_FORMAT)
+        df['timestamp'] = ts.values.astype('datetime64[s]').astype(np.int64)
+    return df.sort_values(['change', 'timestamp'], kind='mergesort').reset_index(drop=True)
+
+
+def read_events(path):
+    # keep the empty labels as ''
+    return compact(pd.read_csv(path, keep_default_na=False))
+
+
+def owners(events):
+    """ change -> author of the first upload """
+    uploads = events[events['kind'] == 'upload']
+    return uploads.groupby('change', observed=True)['author'].first()
+
+
+def responses(events):
+    """
+    First response of every reviewer to every uploaded patch set
+
+    Returns:
+        DataFrame with change, round, author, latency (seconds from the upload)
+    """
+    ev = events.copy()
+    is_upload = ev['kind'] == 'upload'
+    # round n starts at the n-th upload of the change
+    ev['round'] = is_upload.astype(np.int32).groupby(ev['change'], observed=True).cumsum()
+    ev['upload_time'] = ev['timestamp'].where(is_upload)
+    ev['upload_time'] = ev.groupby('change', observed=True)['upload_time'].ffill()
+
+    owner = ev['change'].map(owners(events)).astype(np.float64)
+    reviewer = (~is_upload & (ev['author'] != NO_AUTHOR) & (ev['author'] != owner)
+                & (ev['kind'] != 'merge') & ev['upload_time'].notna())
+    ev = ev[reviewer]
+    first = ev.groupby(['change', 'round', 'author'], observed=True).agg(
+            {'timestamp': 'min', 'upload_time': 'first'}).reset_index()
+    first['latency'] = first['timestamp'] - first['upload_time']
+    return first[['change', 'round', 'author', 'latency']]
+
+
+def reviewer_latency(events):
+    """ Per reviewer: responses, changes reviewed and median/mean response latency in hours """
+    resp = responses(events)
+    resp['latency'] = resp['latency'] / 3600
+    grouped = resp.groupby('author')
+    out = grouped['latency'].agg(['count', 'median', 'mean'])
+    out.columns = ['responses', 'median_latency_hours', 'mean_latency_hours']
+    out.insert(1, 'changes', grouped['change'].nunique())
+    return out.sort_values('responses', ascending=False)
+
+
+def vote_timeline(events, label='Code-Review'):
+    """ Votes of one label in time order, with the time since the first upload of the change """
+    votes = events[(events['kind'] == 'vote') & (events['label'] == label)]
+    start = events[events['kind'] == 'upload'].groupby('change', observed=True)['timestamp'].min()
+    votes = votes[['change', 'revision', 'author', 'vote', 'timestamp']].copy()
+    votes['since_upload'] = votes['timestamp'] - votes['change'].map(start).astype(np.float64)
+    return votes
+
+
+def change_summary(events):
+    """ Per change: review rounds, reviewers, first response and +2 times (seconds after upload) """
+    resp = responses(events)
+    by_change = resp.groupby('change', observed=True)
+    uploads = events[events['kind'] == 'upload'].groupby('change', observed=True)
+    votes = vote_timeline(events)
+    plus2 = votes[votes['vote'] == 2].groupby('change', observed=True)['since_upload']
+
+    out = pd.DataFrame({'rounds': uploads.size()})
+    out['reviewers'] = by_change['author'].nunique()
+    out['first_response'] = resp[resp['round'] == 1].groupby('change', observed=True)['latency'].min()
+    out['median_response'] = by_change['latency'].median()
+    out['first_plus2'] = plus2.min()
+    out['last_plus2'] = plus2.max()
+    out['reviewers'] = out['reviewers'].fillna(0).astype(np.int64)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reviewer latency and participation from review events')
+    parser.add_argument('events', type=str, help='event table written by get_stat.py --events')
+    parser.add_argument('res_dir', type=str, help='result directory')
+    args = parser.parse_args()
+
+    events = read_events(args.events)
+    latency = reviewer_latency(events)
+    latency.to_csv(os.path.join(args.res_dir, LATENCY_NAME))
+    summary = change_summary(events)
+    summary.to_csv(os.path.join(args.res_dir, CHANGE_SUMMARY_NAME))
+    print('%d events, %d changes, %d reviewers' % (len(events), len(summary), len(latency)))
+    print(latency.head(10).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+#!/bin/env python
+
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from get_stat import (OUTPUT_COLUMNS, QUARANTINE_COLUMNS, add_limit_args, extract_commit, limits_from_args,
+                      placeholder_stats)
+from analyze_extracted import get_lines_modified, get_time_delta
+from watch import TIME_COLUMNS, TIME_LEN, append_csv
+import resampling
+
+MEDIAN_METRICS = ['lines_modified', 'num_revisions', 'upload_push_timediff']
+RATIO_METRIC = 'unittest_ratio'
+DEFAULT_BATCH = 50
+DEFAULT_MIN_COUNT = 30
+# half width of a median interval, relative to max(|median|, 1)
+DEFAULT_REL_WIDTH = 0.25
+# half width of the unit test ratio interval
+DEFAULT_RATIO_WIDTH = 0.05
+DEFAULT_RESAMPLES = 2000
+SAMPLE_SEED = 11235
+BATCH_COL = 'batch'
+PROGRESS_COLUMNS = ['batch', 'commits', 'group', 'metric', 'n', 'estimate', 'low', 'high', 'converged']
+
+
+def stratum_queues(pool, strata, done, seed=SAMPLE_SEED):
+    """
+    Hashes of every stratum in one seeded random order, without those already extracted
+
+    The order only depends on the pool and the seed, so a resumed run draws
+    the same commits as an uninterrupted one.
+    """
+    order = np.random.RandomState(seed).permutation(len(pool))
+    shuffled = pool.iloc[order]
+    if strata is None:
+        keys = pd.Series('ALL', index=shuffled.index)
+    else:
+        keys = shuffled[strata].fillna('NA').astype(str)
+    queues = {}
+    for key, hashes in shuffled['hash'].groupby(keys, sort=True):
+        queues[key] = [h for h in hashes if h not in done]
+    return queues
+
+
+def allocate(queues, active, batch_size):
+    """ Split one batch over the active strata in proportion to what is left of them """
+    left = {s: len(queues[s]) for s in sorted(active) if len(queues[s]) > 0}
+    total = sum(left.values())
+    if total == 0:
+        return {}
+    share = {s: batch_size * n / total for s, n in left.items()}
+    alloc = {s: min(int(share[s]), left[s]) for s in left}
+    # largest remainders get the rest of the batch
+    for s in sorted(left, key=lambda s: share[s] - int(share[s]), reverse=True):
+        if sum(alloc.values()) >= min(batch_size, total):
+            break
+        if alloc[s] < left[s]:
+            alloc[s] += 1
+    return alloc
+
+
+def extract_batch(repo, hashes, limits, workers=1):
+    """ Returns (rows of hash + OUTPUT_COLUMNS, quarantined commits) """
+    quarantine = []
+
+    def one(cmit):
+        stats = extract_commit(repo, cmit, limits=limits, quarantine=quarantine)
+        if stats is None:
+            stats = placeholder_stats()
+        return [cmit] + [stats[col] for col in OUTPUT_COLUMNS]
+
+    # extraction waits on git and gerrit, threads are enough
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(one, hashes))
+    return rows, quarantine
+
+
+def add_metrics(df):
+    df = df.copy()
+    df['lines_modified'] = get_lines_modified(df)
+    df['upload_push_timediff'] = get_time_delta(df['time_uploaded'].astype(str), df['time_pushed'].astype(str))
+    return df
+
+
+def interval_rows(df, group_col, settings, batch):
+    """ Bootstrap intervals of the target metrics per group, with whether each is precise enough """
+    rows = []
+    if group_col is None:
+        groups = [('ALL', df)]
+    else:
+        # same NA key as stratum_queues, groupby would drop missing values
+        groups = df.groupby(df[group_col].fillna('NA').astype(str))
+    for group, part in groups:
+        for m in MEDIAN_METRICS:
+            values = pd.to_numeric(part[m], errors='coerce').values.astype(float)
+            # -1 marks values that could not be extracted
+            values = values[values >= 0]
+            est, low, high = resampling.bootstrap_median_ci(values, settings['resamples'], settings['alpha'])
+            precise = (high - low) / 2 <= settings['rel_width'] * max(abs(est), 1)
+            enough = len(values) >= settings['min_count']
+            rows.append([batch, len(df), group, m, len(values), est, low, high, bool(enough and precise)])
+        flags = part['is_unittested'].astype(str).isin(['True', '1', '1.0'])
+        # quarantined commits have no flags (-1 in files written before they were left empty)
+        valid = part['is_unittested'].notnull() & (part['is_unittested'].astype(str) != '-1')
+        est, low, high = resampling.bootstrap_proportion_ci(flags[valid], settings['resamples'], settings['alpha'])
+        precise = (high - low) / 2 <= settings['ratio_width']
+        enough = valid.sum() >= settings['min_count']
+        rows.append([batch, len(df), group, RATIO_METRIC, int(valid.sum()), est, low, high,
+                     bool(enough and precise)])
+    return pd.DataFrame(rows, columns=PROGRESS_COLUMNS)
+
+
+def converged_groups(progress):
+    done = progress.groupby('group')['converged'].all()
+    return set(done[done].index.astype(str))
+
+
+def run_sequential(pool, repo, outfile, settings, limits, labels=None):
+    """
+    Extract stratified batches until every group's intervals are narrow enough
+
+    Extracted rows are appended to `outfile` after every batch, a rerun with
+    the same settings picks up where the last one stopped.
+
+    Returns:
+        progress table of every batch
+    """
+    strata = settings['strata']
+    group_col = settings['group_by']
+    extracted = pd.read_csv(outfile) if os.path.exists(outfile) else None
+    done = set() if extracted is None else set(extracted['hash'])
+    batch = 0 if extracted is None else int(extracted[BATCH_COL].max()) + 1
+    queues = stratum_queues(pool, strata, done, settings['seed'])
+    pool_cols = [c for c in pool.columns if c not in OUTPUT_COLUMNS]
+    # with the same column for strata and groups, converged strata stop being sampled
+    retire = strata is not None and strata == group_col
+
+    progress = []
+    active = set(queues)
+    while True:
+        num_extracted = 0 if extracted is None else len(extracted)
+        if num_extracted > 0:
+            table = interval_rows(add_metrics(extracted), group_col, settings, batch)
+            progress.append(table)
+            converged = converged_groups(table)
+            print('after %d commits: %d of %d groups converged'
+                  % (len(extracted), len(converged), table['group'].nunique()))
+            if retire:
+                active -= converged
+            elif len(converged) == table['group'].nunique():
+                break
+        if num_extracted >= settings['max_commits']:
+            print('Warning: stopping at the limit of %d commits' % settings['max_commits'])
+            break
+        alloc = allocate(queues, active, min(settings['batch'], settings['max_commits'] - num_extracted))
+        if len(alloc) == 0:
+            if retire and len(active) == 0:
+                print('all strata converged')
+            else:
+                print('Warning: the pool is exhausted before every group converged')
+            break
+
+        hashes = []
+        for s, num in alloc.items():
+            hashes += queues[s][:num]
+            queues[s] = queues[s][num:]
+        rows, quarantine = extract_batch(repo, hashes, limits, settings['workers'])
+        new = pd.DataFrame(rows, columns=['hash'] + OUTPUT_COLUMNS)
+        new = pool[pool_cols].drop_duplicates('hash').merge(new, on='hash', how='right')
+        if labels is not None:
+            new = new.drop(columns=[c for c in labels.columns if c != 'hash' and c in new.columns])
+            new = new.merge(labels, on='hash', how='left')
+        for col in TIME_COLUMNS:
+            new[col] = new[col].astype(str).str[:TIME_LEN]
+        new[BATCH_COL] = batch
+        append_csv(outfile, new)
+        if len(quarantine) > 0:
+            append_csv(outfile + '.quarantine.csv', pd.DataFrame(quarantine, columns=QUARANTINE_COLUMNS))
+        extracted = pd.read_csv(outfile)
+        batch += 1
+
+    if len(progress) == 0:
+        return pd.DataFrame(columns=PROGRESS_COLUMNS)
+    return pd.concat(progress, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract commits in stratified batches until the estimates converge')
+    parser.add_argument('infile', type=str,
+                        help='candidate commits, commit_select.py output run through crbug_enrich.py --fill-assigned')
+    parser.add_argument('repo', type=str, help='path to the git repo')
+    parser.add_argument('outfile', type=str, help='extracted commits, appended after every batch')
+    parser.add_argument('--strata', type=str, default='assigned_category',
+                        help='column of infile to stratify the batches by (assigned_category: see crbug_enrich.py)')
+    parser.add_argument('--group-by', type=str, default='assigned_category',
+                        help='column the intervals are computed per (from infile or --labels)')
+    parser.add_argument('--labels', type=str, default=None, help='csv with manual labels by hash')
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH, help='commits per batch')
+    parser.add_argument('--min-count', type=int, default=DEFAULT_MIN_COUNT,
+                        help='commits a group needs before it can converge')
+    parser.add_argument('--rel-width', type=float, default=DEFAULT_REL_WIDTH,
+                        help='target half width of median intervals, relative to the median')
+    parser.add_argument('--ratio-width', type=float, default=DEFAULT_RATIO_WIDTH,
+                        help='target half width of the unit test ratio interval')
+    parser.add_argument('--alpha', type=float, default=0.05, help='1 - confidence level')
+    parser.add_argument('--resamples', type=int, default=DEFAULT_RESAMPLES, help='bootstrap resamples')
+    parser.add_argument('--max-commits', type=int, default=None, help='stop after this many commits')
+    parser.add_argument('--seed', type=int, default=SAMPLE_SEED, help='seed of the sampling order')
+    parser.add_argument('--workers', type=int, default=4, help='commits extracted concurrently')
+    add_limit_args(parser)
+    args = parser.parse_args()
+
+    pool = pd.read_csv(args.infile)
+    labels = None
+    if args.labels is not None:
+        labels = pd.read_csv(args.labels).drop_duplicates('hash')
+    strata = args.strata if args.strata in pool.columns else None
+    if strata is None:
+        print('Warning: no %s column in %s, sampling without strata (run crbug_enrich.py --fill-assigned'
+              ' on the candidates for assigned_category)' % (args.strata, args.infile))
+    label_cols = labels.columns if labels is not None else []
+    group_by = args.group_by
+    if group_by not in pool.columns and group_by not in label_cols:
+        print('Warning: no %s column, computing one interval per metric for all commits' % group_by)
+        group_by = None
+
+    settings = {'strata': strata, 'group_by': group_by, 'batch': args.batch, 'min_count': args.min_count,
+                'rel_width': args.rel_width, 'ratio_width': args.ratio_width, 'alpha': args.alpha,
+                'resamples': args.resamples, 'max_commits': args.max_commits or len(pool),
+                'seed': args.seed, 'workers': args.workers}
+    progress = run_sequential(pool, args.repo, args.outfile, settings, limits_from_args(args), labels)
+    progress.to_csv(args.outfile + '.progress.csv', index=False)
+    if len(progress) > 0:
+        last = progress[progress['batch'] == progress['batch'].max()]
+        print(last.to_string(index=False))
+        print('extracted %d of %d candidate commits' % (last['commits'].iloc[0], len(pool)))
+
+
+if __name__ == '__main__':
+    main()
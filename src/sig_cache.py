@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas
+
+# bump when the way a test is computed changes, so old results are not reused
+CACHE_VERSION = 1
+
+
+def to_builtin(value):
+    """ numpy scalars are not json serializable """
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ResultCache:
+    """
+    Persistent memo of significance test results
+
+    A result is keyed by the test, its parameters and a fingerprint of only
+    the columns the test reads, so changing one column of the input file only
+    invalidates the tests that use it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+        self.fingerprints = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.results = json.load(f)
+
+    def column_fingerprint(self, data, column):
+        # each column is hashed once per run, however many tests read it
+        if column not in self.fingerprints:
+            hashed = pandas.util.hash_pandas_object(data[column], index=False).values
+            self.fingerprints[column] = hashlib.sha1(hashed.tobytes()).hexdigest()
+        return self.fingerprints[column]
+
+    def key(self, data, test, meta):
+        params = {k: v for k, v in meta.items() if k != 'columns'}
+        columns = {c: self.column_fingerprint(data, c) for c in sorted(set(meta['columns']))}
+        desc = json.dumps([CACHE_VERSION, test, params, columns], sort_keys=True, default=str)
+        return hashlib.sha1(desc.encode()).hexdigest()
+
+    def get(self, key):
+        row = self.results.get(key)
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    def put(self, key, row):
+        self.results[key] = {k: to_builtin(v) for k, v in row.items()}
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.results, f)
+        os.replace(tmp_path, self.path)
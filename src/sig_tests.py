@@ -1,12 +1,68 @@
 #!/bin/env python
 
 import argparse
+import itertools
+import numpy
+import os
 import pandas
 import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from scipy import stats
+import resampling
+from sig_cache import ResultCache
+import profiling
 
 ISSUE_TYPES = ['BUG', 'RFE', 'IMPR', 'REFAC']
 
+CATEGORY_VARS = ['lines_modified', 'lines_added', 'lines_removed', 'num_revisions',
+                 'num_comments', 'upload_push_timediff']
+UNITTEST_VARS = ['upload_push_timediff', 'num_comments', 'num_revisions', 'lines_modified',
+                 'lines_added', 'lines_removed']
+CORRELATE_PAIRS = [('lines_modified', 'num_comments'),
+                   ('lines_added', 'num_comments'),
+                   ('lines_removed', 'num_comments'),
+                   ('lines_modified', 'num_revisions'),
+                   ('lines_added', 'num_revisions'),
+                   ('lines_removed', 'num_revisions'),
+                   ('lines_modified', 'upload_push_timediff'),
+                   ('lines_added', 'upload_push_timediff'),
+                   ('lines_removed', 'upload_push_timediff'),
+                   ('num_comments', 'upload_push_timediff'),
+                   ('num_revisions', 'upload_push_timediff'),
+                   ('num_revisions', 'num_comments')]
+
+# numeric metrics correlated with each other by the correlation matrix mode
+NUMERIC_VARS = ['lines_added', 'lines_removed', 'lines_modified', 'num_revisions', 'num_msg',
+                'num_unresolved_comments', 'num_comments', 'upload_push_timediff']
+
+# Declarative description of every test main runs. Each entry lists the tests,
+# the dependent variables and the grouping; `exclude` drops rows where the given
+# column has the given value or none before grouping (unit-test-only changes).
+TEST_SPEC = [
+    {'tests': ['anova', 'pairwise'], 'd_vars': CATEGORY_VARS,
+     'i_var': 'final_category', 'groups': ISSUE_TYPES},
+    {'tests': ['spearman'], 'pairs': CORRELATE_PAIRS},
+    {'tests': ['mannwhitney'], 'd_vars': UNITTEST_VARS,
+     'i_var': 'is_unittested', 'groups': [True, False], 'exclude': ('is_unittest_only', True)},
+    {'tests': ['chisquare'], 'd_vars': ['is_unittested'],
+     'i_var': 'final_category', 'groups': ISSUE_TYPES, 'exclude': ('is_unittest_only', True)},
+    {'tests': ['median'], 'd_vars': ['lines_removed', 'num_revisions'],
+     'i_var': 'final_category', 'groups': ISSUE_TYPES},
+]
+
+# resampling based tests, added to the spec with --resamples
+RESAMPLE_SPEC = [
+    {'tests': ['bootstrap', 'permutation'], 'd_vars': CATEGORY_VARS,
+     'i_var': 'final_category', 'groups': ISSUE_TYPES},
+    {'tests': ['bootstrap', 'permutation'], 'd_vars': UNITTEST_VARS,
+     'i_var': 'is_unittested', 'groups': [True, False], 'exclude': ('is_unittest_only', True)},
+]
+RESAMPLE_TESTS = ['bootstrap', 'permutation']
+
+RESULT_COLUMNS = ['test', 'd_var', 'i_var', 'group_a', 'group_b', 'statistic', 'p_value',
+                  'median_a', 'median_b', 'n_a', 'n_b', 'ci_low', 'ci_high']
+
 
 def get_medians(data, var, categories):
     medians = []
@@ -48,12 +104,11 @@ def pairwise(data, d_var, i_var, categories):
     Returns:
         List of tuples of category, category, U value, p value
     """
+    samples = [data[data[i_var] == c][d_var] for c in categories]
     results = []
     for i in range(len(categories) - 1):
         for j in range(i+1, len(categories)):
-            u_val, p_val = stats.mannwhitneyu(
-                    data[data[i_var] == categories[i]][d_var],
-                    data[data[i_var] == categories[j]][d_var])
+            u_val, p_val = stats.mannwhitneyu(samples[i], samples[j])
             results.append((categories[i], categories[j], u_val, p_val))
     return results
 
@@ -75,268 +130,401 @@ def correlate(data, x_var, y_var):
     return stats.spearmanr(x, y)
 
 
+def spearman_matrix(data, columns=NUMERIC_VARS):
+    """
+    Spearman correlation of every pair of columns from a single rank transform
+
+    Every column is ranked once, the correlation matrix is then one matrix
+    product of the standardized ranks. Rows with a missing value in any of
+    the columns are dropped.
+
+    Args:
+        data: data frame
+        columns: numeric columns to correlate
+
+    Returns:
+        tuple of data frames (correlation coefficients, p values)
+    """
+    columns = [c for c in columns if c in data.columns]
+    values = data[columns].apply(pandas.to_numeric, errors='coerce').dropna()
+    n = len(values)
+    ranks = values.rank().values
+    std = ranks.std(axis=0, ddof=1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        z = (ranks - ranks.mean(axis=0)) / std
+        r = numpy.clip(z.T @ z / (n - 1), -1, 1)
+        # same t approximation as stats.spearmanr
+        t = r * numpy.sqrt((n - 2) / ((1 - r) * (1 + r)))
+    p = 2 * stats.t.sf(numpy.abs(t), n - 2)
+    numpy.fill_diagonal(p, 0)
+    return (pandas.DataFrame(r, index=columns, columns=columns),
+            pandas.DataFrame(p, index=columns, columns=columns))
+
+
+def spearman_matrix_by(data, columns=NUMERIC_VARS, by=None):
+    """
+    Spearman matrices for the whole data and, if `by` is given, for each of its values
+
+    Returns:
+        dict of group ('all' for the whole data) -> (correlations, p values)
+    """
+    matrices = {'all': spearman_matrix(data, columns)}
+    if by is not None:
+        for group, part in data.groupby(by):
+            if len(part) > 2:
+                matrices[group] = spearman_matrix(part, columns)
+    return matrices
+
+
+def matrix_rows(data, entry):
+    """ One result row per pair of columns and group of a spearman_matrix spec entry """
+    rows = []
+    by = entry.get('by')
+    for group, (r, p) in spearman_matrix_by(data, entry['columns'], by).items():
+        columns = list(r.columns)
+        for i in range(len(columns) - 1):
+            for j in range(i+1, len(columns)):
+                rows.append(result_row('spearman_matrix', columns[j], columns[i], group, None,
+                                       r.iloc[i, j], p.iloc[i, j]))
+    return rows
+
+
+def partition(data, i_var, groups, d_vars):
+    """
+    Split the dependent variables by group with a single pass over the data
+
+    Args:
+        data: data frame
+        i_var: independent (grouping) variable
+        groups: group values to keep, in order
+        d_vars: dependent variables
+
+    Returns:
+        dict of group -> dict of dependent variable -> numpy array
+    """
+    positions = data.groupby(i_var).indices
+    columns = {v: data[v].values for v in d_vars}
+    parts = {}
+    for g in groups:
+        pos = positions.get(g, [])
+        parts[g] = {v: columns[v][pos] for v in d_vars}
+    return parts
+
+
+def result_row(test, d_var, i_var, group_a, group_b, statistic, p_value,
+               median_a=None, median_b=None, n_a=None, n_b=None, ci_low=None, ci_high=None):
+    return dict(zip(RESULT_COLUMNS, [test, d_var, i_var, group_a, group_b, statistic, p_value,
+                                     median_a, median_b, n_a, n_b, ci_low, ci_high]))
+
+
+def task_seed(meta):
+    # every resampling task gets a stable seed of its own
+    key = '|'.join(str(meta.get(k)) for k in ['d_var', 'i_var', 'group_a', 'group_b'])
+    return [meta['seed'], zlib.crc32(key.encode())]
+
+
+def run_resample_task(task, workers=1):
+    """ Run one bootstrap or permutation task, resamples are spread over `workers` processes """
+    test, meta, samples = task
+    num_resamples = meta['resamples']
+    seed = task_seed(meta)
+    if test == 'bootstrap':
+        sample = samples[0]
+        median, low, high = resampling.bootstrap_median_ci(
+                sample, num_resamples, meta['alpha'], seed, workers)
+        return result_row(test, meta['d_var'], meta['i_var'], meta['group_a'], None, median, None,
+                          n_a=len(sample), ci_low=low, ci_high=high)
+    if test == 'permutation':
+        a, b = samples
+        u_value, p_value = resampling.permutation_test(a, b, num_resamples, seed, workers)
+        # effect size: difference of the medians with its bootstrap interval
+        diff, low, high = resampling.bootstrap_median_diff_ci(
+                a, b, num_resamples, meta['alpha'], seed, workers)
+        return result_row(test, meta['d_var'], meta['i_var'], meta['group_a'], meta['group_b'],
+                          u_value, p_value, pandas.Series(a).median(), pandas.Series(b).median(),
+                          len(a), len(b), low, high)
+    raise ValueError('unknown test %s' % test)
+
+
+def run_task(task):
+    """ Run one test on already partitioned samples, returns a result row """
+    test, meta, samples = task
+    if test == 'anova':
+        f_value, p_value = stats.f_oneway(*samples)
+        return result_row(test, meta['d_var'], meta['i_var'], 'all', None, f_value, p_value)
+    if test in ('pairwise', 'mannwhitney'):
+        a, b = samples
+        u_value, p_value = stats.mannwhitneyu(a, b)
+        return result_row(test, meta['d_var'], meta['i_var'], meta['group_a'], meta['group_b'],
+                          u_value, p_value, pandas.Series(a).median(), pandas.Series(b).median(),
+                          len(a), len(b))
+    if test == 'spearman':
+        r_value, p_value = stats.spearmanr(*samples)
+        return result_row(test, meta['d_var'], meta['i_var'], None, None, r_value, p_value,
+                          n_a=len(samples[0]))
+    if test == 'chisquare':
+        # observed vs. expected number of unit tested changes per group
+        ratio = meta['ratio']
+        observed = numpy.array([s.sum() for s in samples], dtype=float)
+        expected = numpy.array([len(s) * ratio for s in samples])
+        # the groups need not cover every row the ratio is taken over, and
+        # chisquare wants both totals to agree
+        expected *= observed.sum() / expected.sum()
+        chi_sqr, p_value = stats.chisquare(observed, expected)
+        return result_row(test, meta['d_var'], meta['i_var'], 'all', None, chi_sqr, p_value)
+    if test == 'median':
+        sample = samples[0]
+        return result_row(test, meta['d_var'], meta['i_var'], meta['group_a'], None,
+                          pandas.Series(sample).median(), None, n_a=len(sample))
+    raise ValueError('unknown test %s' % test)
+
+
+def run_safely(func, task, *args):
+    """ func(task, *args), or None with a warning if the test fails """
+    try:
+        return func(task, *args)
+    except Exception as e:
+        test, meta, _ = task
+        print('Warning: %s of %s by %s failed: %s' % (test, meta['d_var'], meta['i_var'], e))
+        return None
+
+
+def failed_row(task):
+    test, meta, _ = task
+    return result_row(test, meta['d_var'], meta['i_var'], meta.get('group_a'), meta.get('group_b'),
+                      numpy.nan, numpy.nan)
+
+
+def build_tasks(data, spec, resamples=resampling.DEFAULT_RESAMPLES, seed=resampling.RESAMPLE_SEED,
+                alpha=0.05):
+    """
+    Turn a test spec into independent tasks; the data is partitioned once per grouping
+
+    Returns:
+        list of (test, meta, samples) tuples
+    """
+    tasks = []
+    for entry in spec:
+        if 'spearman_matrix' in entry['tests']:
+            # computed in one shot by run_spec
+            continue
+        if 'pairs' in entry:
+            for x_var, y_var in entry['pairs']:
+                meta = {'d_var': y_var, 'i_var': x_var, 'columns': [x_var, y_var]}
+                tasks.append(('spearman', meta, (data[x_var].values, data[y_var].values)))
+            continue
+
+        i_var = entry['i_var']
+        groups = entry['groups']
+        part_data = data
+        if 'exclude' in entry:
+            column, value = entry['exclude']
+            # rows without a value (quarantined commits) are dropped as well,
+            # like the `== False` filter this replaced
+            part_data = data[data[column].notnull() & (data[column] != value)]
+        parts = partition(part_data, i_var, groups, entry['d_vars'])
+        for d_var in entry['d_vars']:
+            samples = [parts[g][d_var] for g in groups]
+            for test in entry['tests']:
+                # `columns` lists everything the test reads, used to key the result cache
+                meta = {'d_var': d_var, 'i_var': i_var, 'groups': list(groups),
+                        'exclude': entry.get('exclude'), 'columns': [d_var, i_var]}
+                if 'exclude' in entry:
+                    meta['columns'].append(entry['exclude'][0])
+                if test in RESAMPLE_TESTS:
+                    meta.update(resamples=resamples, seed=seed, alpha=alpha)
+                if test == 'anova':
+                    tasks.append((test, meta, samples))
+                elif test == 'chisquare':
+                    # expected counts use the ratio over all remaining rows
+                    meta['ratio'] = part_data[d_var].sum() / len(part_data)
+                    tasks.append((test, meta, samples))
+                elif test in ('pairwise', 'mannwhitney', 'permutation'):
+                    for i in range(len(groups) - 1):
+                        for j in range(i+1, len(groups)):
+                            pair_meta = dict(meta, group_a=groups[i], group_b=groups[j])
+                            tasks.append((test, pair_meta, (samples[i], samples[j])))
+                elif test in ('median', 'bootstrap'):
+                    for g, sample in zip(groups, samples):
+                        tasks.append((test, dict(meta, group_a=g), (sample,)))
+                else:
+                    raise ValueError('unknown test %s' % test)
+    return tasks
+
+
+def run_spec(data, spec=TEST_SPEC, workers=None, resamples=resampling.DEFAULT_RESAMPLES,
+             seed=resampling.RESAMPLE_SEED, cache=None):
+    """
+    Run every test of a spec and collect the results
+
+    Args:
+        data: data frame
+        spec: list of test spec entries, see TEST_SPEC and RESAMPLE_SPEC
+        workers: number of worker processes, 1 runs everything in this process
+        resamples: number of resamples of the bootstrap and permutation tests
+        seed: base seed of the resampling tests
+        cache: optional ResultCache, only tasks without a cached result are run
+
+    Returns:
+        data frame with one row per test, columns RESULT_COLUMNS
+    """
+    with profiling.step('partition'):
+        tasks = build_tasks(data, spec, resamples, seed)
+    rows = [None] * len(tasks)
+    keys = [None] * len(tasks)
+    if cache is not None:
+        with profiling.step('cache lookup'):
+            for i, (test, meta, _) in enumerate(tasks):
+                keys[i] = cache.key(data, test, meta)
+                rows[i] = cache.get(keys[i])
+
+    workers = workers or os.cpu_count() or 1
+    # one block per test type, so a profile shows where the time goes; tasks
+    # are spread over the pool and resampling tasks run their shards serially,
+    # so there is only ever one level of worker processes
+    blocks = {}
+    for i, t in enumerate(tasks):
+        if rows[i] is None:
+            blocks.setdefault(t[0], []).append(i)
+    pool = None
+    if workers > 1 and sum(len(b) for b in blocks.values()) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for test, block in blocks.items():
+            func = run_resample_task if test in RESAMPLE_TESTS else run_task
+            with profiling.step('%s (%d tests)' % (test, len(block))):
+                block_tasks = [tasks[i] for i in block]
+                if pool is None:
+                    block_rows = [run_safely(func, t) for t in block_tasks]
+                else:
+                    block_rows = list(pool.map(run_safely, itertools.repeat(func), block_tasks,
+                                               chunksize=max(1, len(block) // (4 * workers))))
+            for i, row in zip(block, block_rows):
+                rows[i] = row
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # failed tests are reported with NaN results and are not cached
+    failed = [i for i, row in enumerate(rows) if row is None]
+    if cache is not None:
+        for key, row in zip(keys, rows):
+            if row is not None:
+                cache.put(key, row)
+        cache.save()
+    for i in failed:
+        rows[i] = failed_row(tasks[i])
+
+    # correlation matrices are a single matrix product, cheaper than a task each
+    for entry in spec:
+        if 'spearman_matrix' in entry['tests']:
+            with profiling.step('spearman_matrix'):
+                rows.extend(matrix_rows(data, entry))
+    return pandas.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def print_results(results):
+    for (test, i_var, d_var), rows in results.groupby(['test', 'i_var', 'd_var'], sort=False):
+        if test == 'anova':
+            print("{} -> {}".format(i_var, d_var))
+            print("\tANOVA:")
+            print("\t\tF={}, p={}".format(rows['statistic'].iloc[0], rows['p_value'].iloc[0]))
+        elif test == 'pairwise':
+            print("\tPairwise Comparisons:")
+            for _, r in rows.iterrows():
+                print("\t\t{} {} U={}, p={}".format(r['group_a'], r['group_b'], r['statistic'], r['p_value']))
+            print()
+        elif test == 'spearman':
+            print("correlate {} w/ {}".format(i_var, d_var))
+            print("\tr={}, p={}".format(rows['statistic'].iloc[0], rows['p_value'].iloc[0]))
+            print()
+        elif test == 'mannwhitney':
+            r = rows.iloc[0]
+            print("{} based on whether a change is unit tested".format(d_var))
+            print("\tU={}, p={}".format(r['statistic'], r['p_value']))
+            print("\ttested: {} not tested: {}".format(r['median_a'], r['median_b']))
+            print()
+        elif test == 'chisquare':
+            print("{} based on {}".format(d_var, i_var))
+            print("\tchisqr={}, p={}".format(rows['statistic'].iloc[0], rows['p_value'].iloc[0]))
+            print()
+        elif test == 'median':
+            print("{} medians:".format(d_var))
+            for _, r in rows.iterrows():
+                print("{}: {}".format(r['group_a'], r['statistic']))
+            print()
+        elif test == 'spearman_matrix':
+            for _, r in rows.iterrows():
+                print("correlate {} w/ {} ({})".format(i_var, d_var, r['group_a']))
+                print("\tr={}, p={}".format(r['statistic'], r['p_value']))
+            print()
+        elif test == 'bootstrap':
+            print("{} medians by {} (bootstrap CI):".format(d_var, i_var))
+            for _, r in rows.iterrows():
+                print("\t{}: {} [{}, {}]".format(r['group_a'], r['statistic'], r['ci_low'], r['ci_high']))
+            print()
+        elif test == 'permutation':
+            print("{} by {} (permutation tests):".format(d_var, i_var))
+            for _, r in rows.iterrows():
+                print("\t{} {} U={}, p={}, median diff CI [{}, {}]".format(
+                        r['group_a'], r['group_b'], r['statistic'], r['p_value'], r['ci_low'], r['ci_high']))
+            print()
+
+
 def main(argv):
     """
     Args:
-        argv: preprocessed data file
+        argv: preprocessed data file, optional output csv for the results table
     """
+    parser = argparse.ArgumentParser(prog='sig_tests', description='Run significance tests')
+    parser.add_argument('infile', type=str, help='preprocessed data file')
+    parser.add_argument('--out', type=str, help='write the results table to this csv')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: number of cpus)')
+    parser.add_argument('--resamples', type=int, default=0,
+                        help='also run bootstrap CIs and permutation tests with this many resamples')
+    parser.add_argument('--seed', type=int, default=resampling.RESAMPLE_SEED, help='resampling seed')
+    parser.add_argument('--corr-matrix', action='store_true',
+                        help='correlate every pair of numeric metrics')
+    parser.add_argument('--corr-by', type=str, default=None,
+                        help='also compute the correlation matrix for every value of this column')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='result cache file (default: <infile>.sigcache.json)')
+    parser.add_argument('--no-cache', action='store_true', help='recompute every test')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='write a time / peak memory report per test block to this directory')
+    parser.add_argument('--cprofile', action='store_true', help='with --profile, also dump cProfile stats')
+    args = parser.parse_args(argv[1:])
+
+    if args.profile is not None:
+        profiling.enable(use_cprofile=args.cprofile)
+    try:
+        run_main(args)
+    finally:
+        if args.profile is not None:
+            profiling.finish(args.profile)
+
+
+def run_main(args):
+    with profiling.step('read input'):
+        data = pandas.read_csv(args.infile)
+
+    spec = TEST_SPEC
+    if args.resamples > 0:
+        spec = TEST_SPEC + RESAMPLE_SPEC
+    if args.corr_matrix or args.corr_by is not None:
+        spec = spec + [{'tests': ['spearman_matrix'], 'columns': NUMERIC_VARS, 'by': args.corr_by}]
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache or args.infile + '.sigcache.json')
+    results = run_spec(data, spec, args.workers, args.resamples, args.seed, cache)
+    if cache is not None:
+        print("cached results: {} reused, {} computed".format(cache.hits, cache.misses))
+    with profiling.step('report'):
+        print_results(results)
+    if args.out is not None:
+        results.to_csv(args.out, index=False)
 
-    if len(argv) < 2:
-        print("usage: sig_tests <input file>")
-        raise ValueError
-    input_file = argv[1]
-
-    data = pandas.read_csv(input_file)
-
-    # ANOVA issue type -> lines changed
-    print("issue type -> lines changed")
-    f_value, p_value = anova(
-            data, 'lines_modified', 'final_category', ISSUE_TYPES)
-    results = pairwise(
-            data, 'lines_modified', 'final_category', ISSUE_TYPES)
-    print("\tANOVA:")
-    print("\t\tF={}, p={}".format(f_value, p_value))
-    print("\tPairwise Comparisons:")
-    for r in results:
-        print("\t\t{} {} U={}, p={}".format(r[0], r[1], r[2], r[3]))
-    print()
-
-    # ANOVA issue type -> lines added
-    print("issue type -> lines added")
-    f_value, p_value = anova(
-            data, 'lines_added', 'final_category', ISSUE_TYPES)
-    results = pairwise(
-            data, 'lines_added', 'final_category', ISSUE_TYPES)
-    print("\tANOVA:")
-    print("\t\tF={}, p={}".format(f_value, p_value))
-    print("\tPairwise Comparisons:")
-    for r in results:
-        print("\t\t{} {} U={}, p={}".format(r[0], r[1], r[2], r[3]))
-    print()
-
-    # ANOVA issue type -> lines removed
-    print("issue type -> lines removed")
-    f_value, p_value = anova(
-            data, 'lines_removed', 'final_category', ISSUE_TYPES)
-    results = pairwise(
-            data, 'lines_removed', 'final_category', ISSUE_TYPES)
-    print("\tANOVA:")
-    print("\t\tF={}, p={}".format(f_value, p_value))
-    print("\tPairwise Comparisons:")
-    for r in results:
-        print("\t\t{} {} U={}, p={}".format(r[0], r[1], r[2], r[3]))
-    print()
-
-    # ANOVA issue type -> number of revisions
-    print("issue type -> number of revisions")
-    f_value, p_value = anova(
-            data, 'num_revisions', 'final_category', ISSUE_TYPES)
-    results = pairwise(
-            data, 'num_revisions', 'final_category', ISSUE_TYPES)
-    print("\tANOVA:")
-    print("\t\tF={}, p={}".format(f_value, p_value))
-    print("\tPairwise Comparisons:")
-    for r in results:
-        print("\t\t{} {} U={}, p={}".format(r[0], r[1], r[2], r[3]))
-    print()
-
-    # ANOVA issue type -> number of comments
-    print("issue type -> number of comments")
-    f_value, p_value = anova(
-            data, 'num_comments', 'final_category', ISSUE_TYPES)
-    results = pairwise(
-            data, 'num_comments', 'final_category', ISSUE_TYPES)
-    print("\tANOVA:")
-    print("\t\tF={}, p={}".format(f_value, p_value))
-    print("\tPairwise Comparisons:")
-    for r in results:
-        print("\t\t{} {} U={}, p={}".format(r[0], r[1], r[2], r[3]))
-    print()
-
-    # ANOVA issue type -> time in review
-    print("issue type -> time in review")
-    f_value, p_value = anova(
-            data, 'upload_push_timediff', 'final_category', ISSUE_TYPES)
-    results = pairwise(
-            data, 'upload_push_timediff', 'final_category', ISSUE_TYPES)
-    print("\tANOVA:")
-    print("\t\tF={}, p={}".format(f_value, p_value))
-    print("\tPairwise Comparisons:")
-    for r in results:
-        print("\t\t{} {} U={}, p={}".format(r[0], r[1], r[2], r[3]))
-    print()
-
-    # Correlate lines modified with number of comments
-    print("correlate lines modified w/ number of comments")
-    r_value, p_value = correlate(data, 'lines_modified', 'num_comments')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate lines added with number of comments
-    print("correlate lines added w/ number of comments")
-    r_value, p_value = correlate(data, 'lines_added', 'num_comments')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate lines removed with number of comments
-    print("correlate lines removed w/ number of comments")
-    r_value, p_value = correlate(data, 'lines_removed', 'num_comments')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate lines modified with number of revisions
-    print("correlate lines modified w/ number of revisions")
-    r_value, p_value = correlate(data, 'lines_modified', 'num_revisions')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate lines added with number of revisions
-    print("correlate lines added w/ number of revisions")
-    r_value, p_value = correlate(data, 'lines_added', 'num_revisions')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate lines removed with number of revisions
-    print("correlate lines removed w/ number of revisions")
-    r_value, p_value = correlate(data, 'lines_removed', 'num_revisions')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate lines modified with time to submit
-    print("correlate lines modified w/ time to submit")
-    r_value, p_value = correlate(data, 'lines_modified', 'upload_push_timediff')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate lines added with time to submit
-    print("correlate lines added w/ number of time to submit")
-    r_value, p_value = correlate(data, 'lines_added', 'upload_push_timediff')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate lines removed with time to submit
-    print("correlate lines removed w/ number of time to submit")
-    r_value, p_value = correlate(data, 'lines_removed', 'upload_push_timediff')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate number of comments with time to submit
-    print("correlate number of comments w/ time to submit")
-    r_value, p_value = correlate(data, 'num_comments', 'upload_push_timediff')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate number of revisions with time to submit
-    print("correlate number of revisions w/ time to submit")
-    r_value, p_value = correlate(data, 'num_revisions', 'upload_push_timediff')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Correlate number of revisions with number of comments
-    print("correlate number of comments w/ number of revisions")
-    r_value, p_value = correlate(data, 'num_revisions', 'num_comments')
-    print("\tr={}, p={}".format(r_value, p_value))
-    print()
-
-    # Time to submit based on whether a change is unit tested
-    print("time to submit based on whether a change is unit tested")
-    ut_data = data[data['is_unittest_only'] == False]
-    u_value, p_value = stats.mannwhitneyu(
-            ut_data[ut_data['is_unittested'] == True]['upload_push_timediff'],
-            ut_data[ut_data['is_unittested'] == False]['upload_push_timediff'])
-    print("\tU={}, p={}".format(u_value, p_value))
-    print("\ttested: {} not tested: {}".format(
-            ut_data[ut_data['is_unittested'] == True]['upload_push_timediff'].median(),
-            ut_data[ut_data['is_unittested'] == False]['upload_push_timediff'].median()))
-    print()
-
-    # Number of comments based on whether a change is unit tested
-    print("number of comments based on whether a change is unit tested")
-    ut_data = data[data['is_unittest_only'] == False]
-    u_value, p_value = stats.mannwhitneyu(
-            ut_data[ut_data['is_unittested'] == True]['num_comments'],
-            ut_data[ut_data['is_unittested'] == False]['num_comments'])
-    print("\tU={}, p={}".format(u_value, p_value))
-    print("\ttested: {} not tested: {}".format(
-            ut_data[ut_data['is_unittested'] == True]['num_comments'].median(),
-            ut_data[ut_data['is_unittested'] == False]['num_comments'].median()))
-    print()
-
-    # Remove changes that are only unit tests
-    ut_data = data[data['is_unittest_only'] == False]
-
-    # Time to submit based on whether a change is unit tested
-    print("number of revisions based on whether a change is unit tested")
-    u_value, p_value = stats.mannwhitneyu(
-            ut_data[ut_data['is_unittested'] == True]['num_revisions'],
-            ut_data[ut_data['is_unittested'] == False]['num_revisions'])
-    print("\tU={}, p={}".format(u_value, p_value))
-    print("\ttested: {} not tested: {}".format(
-            ut_data[ut_data['is_unittested'] == True]['num_revisions'].median(),
-            ut_data[ut_data['is_unittested'] == False]['num_revisions'].median()))
-    print()
-
-    # Lines modified based on whether a change is unit tested
-    print("number of lines modified based on whether a change is unit tested")
-    u_value, p_value = stats.mannwhitneyu(
-            ut_data[ut_data['is_unittested'] == True]['lines_modified'],
-            ut_data[ut_data['is_unittested'] == False]['lines_modified'])
-    print("\tU={}, p={}".format(u_value, p_value))
-    print("\ttested: {} not tested: {}".format(
-            ut_data[ut_data['is_unittested'] == True]['lines_modified'].median(),
-            ut_data[ut_data['is_unittested'] == False]['lines_modified'].median()))
-    print()
-
-    # Lines added based on whether a change is unit tested
-    print("number of lines added based on whether a change is unit tested")
-    u_value, p_value = stats.mannwhitneyu(
-            ut_data[ut_data['is_unittested'] == True]['lines_added'],
-            ut_data[ut_data['is_unittested'] == False]['lines_added'])
-    print("\tU={}, p={}".format(u_value, p_value))
-    print("\ttested: {} not tested: {}".format(
-            ut_data[ut_data['is_unittested'] == True]['lines_added'].median(),
-            ut_data[ut_data['is_unittested'] == False]['lines_added'].median()))
-    print()
-
-    # Lines removed based on whether a change is unit tested
-    print("number of lines removed based on whether a change is unit tested")
-    u_value, p_value = stats.mannwhitneyu(
-            ut_data[ut_data['is_unittested'] == True]['lines_removed'],
-            ut_data[ut_data['is_unittested'] == False]['lines_removed'])
-    print("\tU={}, p={}".format(u_value, p_value))
-    print("\ttested: {} not tested: {}".format(
-            ut_data[ut_data['is_unittested'] == True]['lines_removed'].median(),
-            ut_data[ut_data['is_unittested'] == False]['lines_removed'].median()))
-    print()
-
-    # Unit tested based on issue type
-    print("unit tested based on issue type")
-    unittest_cats = []
-    unittest_expt = []
-
-    total_unittested = ut_data['is_unittested'].sum()
-    ut_ratio = total_unittested / len(ut_data)
-
-    for c in ISSUE_TYPES:
-        cat_data = ut_data[ut_data['final_category'] == c]['is_unittested']
-        unittest_cats.append(cat_data.sum())
-        unittest_expt.append(int(len(cat_data) * ut_ratio)) 
-
-    chi_sqr, p_value = stats.chisquare(unittest_cats, unittest_expt)
-    print("\tchisqr={}, p={}".format(chi_sqr, p_value))
-    print()
-
-    lines_median = get_medians(data, 'lines_removed', ISSUE_TYPES)
-    print("lines removed medians:")
-    for m in lines_median:
-        print("{}: {}".format(m[0], m[1]))
-    print()
-
-    print("revisions medians:")
-    revisions_median = get_medians(data, 'num_revisions', ISSUE_TYPES)
-    for m in revisions_median:
-        print("{}: {}".format(m[0], m[1]))
-    print()
 
 if __name__ == "__main__":
     """
@@ -0,0 +1,223 @@
+#!/bin/env python
+
+import argparse
+import heapq
+import os
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from analyze_extracted import COL_MAP, FIG_SIZE, XLAB_SIZE, YLAB_SIZE, TICK_SIZE
+
+TIME_COLUMNS = ['date', 'time_pushed']
+DEFAULT_METRICS = ['upload_push_timediff', 'num_revisions', 'lines_modified']
+DEFAULT_WINDOW = 90
+ALL_GROUP = 'ALL'
+# windows with fewer commits are left empty in the table and plots
+DEFAULT_MIN_COUNT = 5
+TREND_NAME = 'trend.csv'
+
+
+class SlidingMedian:
+    """
+    Median of a multiset with add and remove in O(log n)
+
+    The lower half is a max-heap (stored negated) and the upper half a
+    min-heap; removed values are only dropped once they reach a heap top.
+    """
+
+    def __init__(self):
+        self.low = []
+        self.high = []
+        self.low_size = 0
+        self.high_size = 0
+        self.delayed = defaultdict(int)
+
+    def __len__(self):
+        return self.low_size + self.high_size
+
+    def _prune(self, heap, sign):
+        while heap and self.delayed[sign * heap[0]] > 0:
+            self.delayed[sign * heap[0]] -= 1
+            heapq.heappop(heap)
+
+    def _balance(self):
+        if self.low_size > self.high_size + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+            self.low_size -= 1
+            self.high_size += 1
+            self._prune(self.low, -1)
+        elif self.low_size < self.high_size:
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+            self.high_size -= 1
+            self.low_size += 1
+            self._prune(self.high, 1)
+
+    def add(self, x):
+        if not self.low or x <= -self.low[0]:
+            heapq.heappush(self.low, -x)
+            self.low_size += 1
+        else:
+            heapq.heappush(self.high, x)
+            self.high_size += 1
+        self._balance()
+
+    def remove(self, x):
+        self.delayed[x] += 1
+        if x <= -self.low[0]:
+            self.low_size -= 1
+            if x == -self.low[0]:
+                self._prune(self.low, -1)
+        else:
+            self.high_size -= 1
+            if x == self.high[0]:
+                self._prune(self.high, 1)
+        self._balance()
+
+    def median(self):
+        if len(self) == 0:
+            return np.nan
+        if self.low_size > self.high_size:
+            return -self.low[0]
+        return (-self.low[0] + self.high[0]) / 2
+
+
+def to_days(series):
+    """ Days since the epoch, NaN for unparsable values such as the -1 placeholders """
+    times = pd.to_datetime(series.where(series.astype(str) != '-1'), errors='coerce')
+    days = times.values.astype('datetime64[D]').astype(np.float64)
+    days[times.isna().values] = np.nan
+    return days
+
+
+def slide(days, values, unittested, window, start, end, step=1):
+    """
+    Slide a `window`-day window ending on every `step`-th day from `start` to `end`
+
+    Commits enter the window on their day and leave it `window` days later;
+    every window is updated from the previous one.
+
+    Args:
+        days: sorted int array of commit days
+        values: dict of metric -> float array aligned with `days`, NaN is ignored
+        unittested: bool array aligned with `days`
+
+    Returns:
+        list of (day, count, unittest ratio, [median per metric])
+    """
+    medians = {m: SlidingMedian() for m in values}
+    valid = {m: ~np.isnan(v) for m, v in values.items()}
+    head = 0
+    tail = 0
+    num_unittested = 0
+    rows = []
+    n = len(days)
+    for day in range(start, end + 1, step):
+        while head < n and days[head] <= day:
+            for m, v in values.items():
+                if valid[m][head]:
+                    medians[m].add(v[head])
+            num_unittested += unittested[head]
+            head += 1
+        while tail < head and days[tail] <= day - window:
+            for m, v in values.items():
+                if valid[m][tail]:
+                    medians[m].remove(v[tail])
+            num_unittested -= unittested[tail]
+            tail += 1
+        count = head - tail
+        ratio = num_unittested / count if count > 0 else np.nan
+        rows.append((day, count, ratio, [medians[m].median() for m in values]))
+    return rows
+
+
+def compute_trend(df, time_col='date', metrics=DEFAULT_METRICS, window=DEFAULT_WINDOW, step=1,
+                  min_count=DEFAULT_MIN_COUNT):
+    """ Rolling-window counts, unit test ratio and medians per final_category and overall """
+    days = to_days(df[time_col])
+    keep = ~np.isnan(days)
+    df = df[keep]
+    days = days[keep].astype(np.int64)
+    # sort once, every group below is a sorted slice of it
+    order = np.argsort(days, kind='mergesort')
+    days = days[order]
+    df = df.iloc[order]
+    values = {}
+    for m in metrics:
+        v = pd.to_numeric(df[m], errors='coerce').values.astype(np.float64)
+        # -1 marks values that could not be extracted
+        v[v < 0] = np.nan
+        values[m] = v
+    unittested = (df['is_unittested'].astype(str) == 'True').values
+
+    start, end = days[0], days[-1]
+    groups = {ALL_GROUP: np.arange(len(days))}
+    groups.update(df.groupby('final_category').indices)
+    out = []
+    for name, idx in groups.items():
+        rows = slide(days[idx], {m: v[idx] for m, v in values.items()}, unittested[idx], window,
+                     start, end, step)
+        for day, count, ratio, meds in rows:
+            out.append([day, name, count, ratio] + meds)
+
+    columns = ['day', 'final_category', 'count', 'unittest_ratio'] + ['median_' + m for m in metrics]
+    trend = pd.DataFrame(out, columns=columns)
+    trend.insert(0, 'date', pd.to_datetime(trend.pop('day'), unit='D'))
+    sparse = trend['count'] < min_count
+    trend.loc[sparse, columns[3:]] = np.nan
+    return trend
+
+
+def plot_trend(res_dir, trend, col, ylabel, image):
+    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    for name, group in trend.groupby('final_category'):
+        width = 3 if name == ALL_GROUP else 1.5
+        ax.plot(group['date'].values, group[col].values, label=name, linewidth=width)
+    ax.set_ylabel(ylabel, fontsize=YLAB_SIZE)
+    ax.set_xlabel('Window End', fontsize=XLAB_SIZE)
+    ax.tick_params(labelsize=TICK_SIZE)
+    ax.legend(fontsize=TICK_SIZE)
+    fig.autofmt_xdate()
+    plt.savefig(res_dir + '/' + image)
+    plt.close()
+
+
+def plot_trends(res_dir, trend, metrics, window):
+    suffix = ' (%d-day window)' % window
+    plot_trend(res_dir, trend, 'count', 'Commits' + suffix, 'trend_count.png')
+    plot_trend(res_dir, trend, 'unittest_ratio', 'Unit Test Ratio' + suffix, 'trend_unittest_ratio.png')
+    for m in metrics:
+        plot_trend(res_dir, trend, 'median_' + m, 'Median ' + COL_MAP.get(m, m) + suffix,
+                   'trend_%s.png' % m)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rolling-window trends per final category')
+    parser.add_argument('infile', type=str, help='preprocessed csv (aggregated_result.csv)')
+    parser.add_argument('res_dir', type=str, help='result directory')
+    parser.add_argument('--time-col', type=str, default='date', choices=TIME_COLUMNS,
+                        help='column that orders the commits')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='window length in days')
+    parser.add_argument('--step', type=int, default=1, help='days between window ends')
+    parser.add_argument('--metrics', type=str, nargs='+', default=DEFAULT_METRICS,
+                        help='columns to take rolling medians of')
+    parser.add_argument('--min-count', type=int, default=DEFAULT_MIN_COUNT,
+                        help='leave windows with fewer commits empty')
+    parser.add_argument('--no-plots', action='store_true', help='only write the table')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.infile)
+    missing = [m for m in args.metrics if m not in df.columns]
+    if len(missing) > 0:
+        print('Error: columns %s not in data' % ', '.join(missing))
+        return
+    trend = compute_trend(df, args.time_col, args.metrics, args.window, args.step, args.min_count)
+    trend.to_csv(os.path.join(args.res_dir, TREND_NAME), index=False)
+    if not args.no_plots:
+        plot_trends(args.res_dir, trend, args.metrics, args.window)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+#!/bin/env python
+
+import argparse
+import json
+import os
+import subprocess
+import time
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+from commit_select import parse_commits, FIELDS
+from get_stat import OUTPUT_COLUMNS, QUARANTINE_COLUMNS, extract_commit
+from analyze_extracted import clean_null, get_lines_modified, get_time_delta
+from agg_cube import cube_path, update_cube
+from pipeline import LABEL_COLUMNS
+import quantile_sketch
+
+STATE_NAME = 'watch_state.json'
+EXTRACTED_NAME = 'watch_extracted.csv'
+QUARANTINE_NAME = 'watch_quarantine.csv'
+AGGREGATED_NAME = 'aggregated_result.csv'
+SKETCH_NAME = 'sketches.json'
+DEFAULT_INTERVAL = 3600
+# gerrit dates carry nanoseconds, the analysis expects "%Y-%m-%d %H:%M:%S"
+TIME_COLUMNS = ['time_uploaded', 'time_pushed', 'time_plus2']
+TIME_LEN = 19
+
+
+def git(repo, args):
+    cp = subprocess.run(['git'] + args, cwd=repo, capture_output=True, universal_newlines=True,
+                        errors='replace')
+    if cp.returncode != 0:
+        print('Warning: git %s failed in %s: %s' % (' '.join(args), repo, cp.stderr.strip()))
+        return None
+    return cp.stdout
+
+
+def next_row(aggregated_path):
+    """ First free row index of aggregated_result.csv, whose index has gaps where rows were dropped """
+    if not os.path.exists(aggregated_path):
+        return 0
+    index = pd.read_csv(aggregated_path, usecols=[0]).iloc[:, 0]
+    return 0 if len(index) == 0 else int(index.max()) + 1
+
+
+def load_state(path, aggregated_path):
+    if not os.path.exists(path):
+        # new rows continue the index of an existing analysis
+        return {'repos': {}, 'rows': next_row(aggregated_path), 'pending': []}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def new_commits(repo, last, fetch=False):
+    """
+    Commits after `last` that commit_select would pick (date, bug and review)
+
+    Returns:
+        (list of commit_select.Commit, new head), or (None, None) if git failed
+    """
+    if fetch and git(repo, ['pull', '--ff-only', '--quiet']) is None:
+        return None, None
+    head = git(repo, ['rev-parse', 'HEAD'])
+    if head is None:
+        return None, None
+    head = head.strip()
+    if head == last:
+        return [], head
+    if git(repo, ['cat-file', '-e', last + '^{commit}']) is None:
+        # rewritten and garbage collected, nothing left to diff against
+        print('Warning: %s: last processed commit %s is gone, watching from %s' % (repo, last, head))
+        return [], head
+    log = git(repo, ['log', '--pretty=medium', '--date=short', '%s..%s' % (last, head)])
+    if log is None:
+        return None, None
+    return list(parse_commits(log.splitlines(keepends=True))), head
+
+
+def extract_new(repo, commits, labels=None, quarantine=None):
+    """ Extraction results of `commits`, in the column layout of the extracted csv """
+    rows = []
+    for c in commits:
+        stats = extract_commit(repo, c.row()[0], quarantine=quarantine)
+        if stats is None:
+            continue
+        rows.append(c.row() + [stats[col] for col in OUTPUT_COLUMNS])
+    df = pd.DataFrame(rows, columns=FIELDS + OUTPUT_COLUMNS)
+    for col in TIME_COLUMNS:
+        df[col] = df[col].astype(str).str[:TIME_LEN]
+    if labels is not None:
+        df = df.merge(labels, on='hash', how='left')
+    return df
+
+
+def append_csv(path, df, index=False):
+    """ Append `df` in the column order of the existing file """
+    if os.path.exists(path):
+        columns = pd.read_csv(path, nrows=0, index_col=0 if index else None).columns
+        df = df.reindex(columns=columns)
+        df.to_csv(path, mode='a', header=False, index=index, na_rep='NA' if index else '')
+    else:
+        df.to_csv(path, index=index, na_rep='NA' if index else '')
+
+
+def unlabeled_hashes(df):
+    """ Hashes clean_null would drop, they may be labeled later """
+    if 'final_category' not in df.columns or 'assigned_category' not in df.columns:
+        return df['hash'].tolist()
+    return df.loc[df['final_category'].isnull() | df['assigned_category'].isnull(), 'hash'].tolist()
+
+
+def prepare_rows(df, first_row):
+    """ What analyze_extracted.preprocess does, for the new rows only """
+    if 'final_category' not in df.columns or 'assigned_category' not in df.columns:
+        return df.iloc[0:0]
+    df = df[df['final_category'] != 'OTHER']
+    df = clean_null(df).copy()
+    if len(df) == 0:
+        return df
+    df['lines_modified'] = get_lines_modified(df)
+    df['upload_push_timediff'] = get_time_delta(df['time_uploaded'].astype(str), df['time_pushed'].astype(str))
+    df.index = pd.RangeIndex(first_row, first_row + len(df))
+    return df
+
+
+def refresh_aggregates(res_dir, prepared, freq, plots):
+    """
+    Fold new preprocessed rows into the cube and the sketches, redraw the sketch plots
+
+    `prepared` must already be appended to aggregated_result.csv. A missing
+    cube or sketch file is built from that whole file, so results from an
+    earlier full analysis are not replaced by the new rows alone.
+    """
+    aggregated_path = os.path.join(res_dir, AGGREGATED_NAME)
+    if not os.path.exists(cube_path(res_dir)):
+        print('no cube in %s yet, building it from %s' % (res_dir, AGGREGATED_NAME))
+        # the cube skips hashes it has seen, folding the new rows again below is harmless
+        update_cube(res_dir, pd.read_csv(aggregated_path, index_col=0), freq)
+    _, num_new = update_cube(res_dir, prepared, freq)
+
+    sketch_path = os.path.join(res_dir, SKETCH_NAME)
+    if os.path.exists(sketch_path):
+        sketches = quantile_sketch.load_sketches(sketch_path)
+        metrics = quantile_sketch.METRICS
+        quantile_sketch.update_group_sketches(sketches['final_category'], prepared, 'final_category', metrics)
+        quantile_sketch.update_group_sketches(sketches['utest_group'], quantile_sketch.unittest_groups(prepared),
+                                              'utest_group', metrics)
+    else:
+        print('no sketches in %s yet, building them from %s' % (res_dir, AGGREGATED_NAME))
+        sketches = quantile_sketch.stream_sketches(aggregated_path)
+    quantile_sketch.save_sketches(sketch_path, sketches)
+    if plots:
+        quantile_sketch.plot_sketches(res_dir, sketches)
+    return num_new
+
+
+def add_rows(extracted, state, args):
+    """ Preprocess extracted rows and fold the usable ones into the results, returns them """
+    prepared = prepare_rows(extracted, state['rows'])
+    if len(prepared) > 0:
+        append_csv(os.path.join(args.res_dir, AGGREGATED_NAME), prepared, index=True)
+        refresh_aggregates(args.res_dir, prepared, args.freq, not args.no_plots)
+        state['rows'] += len(prepared)
+    return prepared
+
+
+def process_pending(state, args, labels):
+    """ Fold in commits that were unlabeled when extracted and have labels now """
+    pending = state.get('pending', [])
+    if len(pending) == 0 or labels is None:
+        return 0
+    labeled = labels[labels['hash'].isin(pending)]
+    labeled = labeled[~labeled['hash'].isin(unlabeled_hashes(labeled))]
+    if len(labeled) == 0:
+        return 0
+    extracted = pd.read_csv(os.path.join(args.res_dir, EXTRACTED_NAME), dtype={'hash': str})
+    extracted = extracted[extracted['hash'].isin(labeled['hash'])].drop_duplicates('hash', keep='last')
+    extracted = extracted.drop(columns=[c for c in labels.columns if c != 'hash' and c in extracted.columns])
+    extracted = extracted.merge(labels, on='hash', how='left')
+    prepared = add_rows(extracted, state, args)
+    # hashes missing from the extracted csv can't be folded in either
+    done = set(labeled['hash'])
+    state['pending'] = [h for h in pending if h not in done]
+    print('%d commits labeled since their extraction, %d added to the aggregates' % (len(done), len(prepared)))
+    return len(done)
+
+
+def process_repo(repo, state, args, labels):
+    """ Returns the number of new commits extracted from `repo` """
+    last = state['repos'].get(repo)
+    if last is None:
+        # first sight of the repo, start from --start or from now on
+        last = args.start or git(repo, ['rev-parse', 'HEAD']).strip()
+        state['repos'][repo] = last
+        if args.start is None:
+            print('%s: watching from %s' % (repo, last))
+            return 0
+
+    commits, head = new_commits(repo, last, args.fetch)
+    if commits is None:
+        return 0
+    if len(commits) > 0:
+        quarantine = []
+        extracted = extract_new(repo, commits, labels, quarantine)
+        append_csv(os.path.join(args.res_dir, EXTRACTED_NAME), extracted)
+        if len(quarantine) > 0:
+            append_csv(os.path.join(args.res_dir, QUARANTINE_NAME),
+                       pd.DataFrame(quarantine, columns=QUARANTINE_COLUMNS))
+
+        prepared = add_rows(extracted, state, args)
+        # re-checked against the labels on every poll
+        unlabeled = unlabeled_hashes(extracted)
+        state['pending'] = state.get('pending', []) + unlabeled
+        print('%s: %d new commits, %d added to the aggregates' % (repo, len(commits), len(prepared)))
+        if len(prepared) < len(extracted):
+            print('Warning: %d commits are unlabeled or OTHER, they are only in %s (%d unlabeled are retried'
+                  ' every poll)' % (len(extracted) - len(prepared), EXTRACTED_NAME, len(unlabeled)))
+    state['repos'][repo] = head
+    return len(commits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Poll repos and fold new commits into the results')
+    parser.add_argument('res_dir', type=str, help='result directory, updated in place')
+    parser.add_argument('repos', type=str, nargs='+', help='paths to the git repos')
+    parser.add_argument('--interval', type=int, default=DEFAULT_INTERVAL, help='seconds between polls')
+    parser.add_argument('--once', action='store_true', help='poll once and exit (e.g. from a git hook)')
+    parser.add_argument('--fetch', action='store_true', help='git pull --ff-only before every poll')
+    parser.add_argument('--start', type=str, default=None,
+                        help='for repos seen the first time, process commits after this revision')
+    parser.add_argument('--labels', type=str, default=None, help='csv with manual labels by hash')
+    parser.add_argument('--freq', type=str, default='Q', help='date bucket of a new aggregate cube')
+    parser.add_argument('--no-plots', action='store_true', help='do not redraw the box plots')
+    args = parser.parse_args()
+
+    os.makedirs(args.res_dir, exist_ok=True)
+    repos = [os.path.abspath(r) for r in args.repos]
+    state_path = os.path.join(args.res_dir, STATE_NAME)
+    while True:
+        labels = None
+        if args.labels is not None:
+            label_df = pd.read_csv(args.labels)
+            cols = ['hash'] + [c for c in LABEL_COLUMNS if c in label_df.columns]
+            labels = label_df[cols].drop_duplicates('hash')
+        state = load_state(state_path, os.path.join(args.res_dir, AGGREGATED_NAME))
+        if process_pending(state, args, labels) > 0:
+            save_state(state_path, state)
+        for repo in repos:
+            process_repo(repo, state, args, labels)
+            # a crash in the next repo must not redo this one
+            save_state(state_path, state)
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/bin/env python
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+import pandas as pd
+from get_stat import (DEFAULT_LIMITS, OUTPUT_COLUMNS, add_limit_args, extract_commit, limits_from_args,
+                      parse_cmit_list, placeholder_stats, write_quarantine)
+
+DEFAULT_UNIT_SIZE = 50
+# seconds a claimed unit stays with a worker without a renewal
+DEFAULT_LEASE = 600
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 5
+PARTIAL_DIR = 'partial'
+# reason a commit of a partial csv was quarantined, empty otherwise
+QUARANTINE_COL = 'quarantine'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    hashes TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+'''
+
+
+def connect(db_path):
+    # every write happens in a short explicit transaction
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout = 60000')
+    return conn
+
+
+def partial_path(db_path, unit_id):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), PARTIAL_DIR, 'unit_%06d.csv' % unit_id)
+
+
+def init_queue(db_path, infile, unit_size=DEFAULT_UNIT_SIZE):
+    """ Split the hashes of `infile` into units of `unit_size` commits """
+    if os.path.exists(db_path):
+        print('Error: queue %s already exists' % db_path)
+        raise FileExistsError(db_path)
+    cmit_list, _ = parse_cmit_list(infile)
+    hashes = list(dict.fromkeys(cmit_list))
+    conn = connect(db_path)
+    conn.executescript(SCHEMA)
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('INSERT INTO meta VALUES (?, ?)', ('infile', os.path.abspath(infile)))
+    for start in range(0, len(hashes), unit_size):
+        conn.execute('INSERT INTO units (hashes) VALUES (?)', (json.dumps(hashes[start:start + unit_size]),))
+    conn.execute('COMMIT')
+    conn.close()
+    os.makedirs(os.path.dirname(partial_path(db_path, 0)), exist_ok=True)
+    print('%d commits in %d units' % (len(hashes), (len(hashes) + unit_size - 1) // unit_size))
+
+
+def claim_unit(conn, owner, lease):
+    """
+    Lease one pending unit, or one whose lease expired (its worker died)
+
+    Returns:
+        (unit id, list of hashes), or None if nothing is left to claim
+    """
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # units whose workers keep dying are not handed out again
+        conn.execute("UPDATE units SET status = 'failed', error = 'lease expired too often' "
+                     "WHERE status = 'leased' AND expires < ? AND attempts >= ?", (now, MAX_ATTEMPTS))
+        row = conn.execute("SELECT id, hashes FROM units WHERE status = 'pending' "
+                           "OR (status = 'leased' AND expires < ?) ORDER BY id LIMIT 1", (now,)).fetchone()
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+        conn.execute("UPDATE units SET status = 'leased', owner = ?, expires = ?, attempts = attempts + 1 "
+                     "WHERE id = ?", (owner, now + lease, row[0]))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return row[0], json.loads(row[1])
+
+
+def renew_lease(conn, unit_id, owner, lease):
+    """ Returns False if the unit was given to another worker meanwhile """
+    cur = conn.execute("UPDATE units SET expires = ? WHERE id = ? AND owner = ? AND status = 'leased'",
+                       (time.time() + lease, unit_id, owner))
+    return cur.rowcount == 1
+
+
+def finish_unit(conn, unit_id, owner):
+    cur = conn.execute("UPDATE units SET status = 'done', expires = NULL WHERE id = ? AND owner = ?",
+                       (unit_id, owner))
+    return cur.rowcount == 1
+
+
+def fail_unit(conn, unit_id, owner, error):
+    # back to the queue, unless it failed too often
+    conn.execute("UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                 "owner = NULL, expires = NULL, error = ? WHERE id = ? AND owner = ?",
+                 (MAX_ATTEMPTS, error, unit_id, owner))
+
+
+def pending_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM units WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+
+def write_partial(path, rows):
+    """ Write to a temporary file first, so a partial csv is either complete or missing """
+    df = pd.DataFrame(rows, columns=['hash'] + OUTPUT_COLUMNS + [QUARANTINE_COL])
+    tmp_path = '%s.%s.%d.tmp' % (path, socket.gethostname(), os.getpid())
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def run_unit(conn, db_path, repo, unit_id, hashes, owner, lease, limits):
+    rows = []
+    for cmit in hashes:
+        quarantine = []
+        stats = extract_commit(repo, cmit, limits=limits, quarantine=quarantine)
+        if stats is None:
+            stats = placeholder_stats()
+        reason = quarantine[0][1] if quarantine else None
+        rows.append([cmit] + [stats[col] for col in OUTPUT_COLUMNS] + [reason])
+        if not renew_lease(conn, unit_id, owner, lease):
+            print('Warning: lost the lease on unit %d, leaving it to its new owner' % unit_id)
+            return False
+    write_partial(partial_path(db_path, unit_id), rows)
+    return finish_unit(conn, unit_id, owner)
+
+
+def run_worker(db_path, repo, lease=DEFAULT_LEASE, owner=None, wait=True, limits=DEFAULT_LIMITS):
+    """ Claim and extract units until the queue is drained, returns the number of units done """
+    owner = owner or '%s:%d' % (socket.gethostname(), os.getpid())
+    conn = connect(db_path)
+    num_done = 0
+    while True:
+        claimed = claim_unit(conn, owner, lease)
+        if claimed is None:
+            # units leased by others may still come back if their worker dies
+            if not wait or pending_count(conn) == 0:
+                break
+            time.sleep(POLL_SECONDS)
+            continue
+        unit_id, hashes = claimed
+        print('[%s] unit %d: %d commits' % (owner, unit_id, len(hashes)))
+        try:
+            if run_unit(conn, db_path, repo, unit_id, hashes, owner, lease, limits):
+                num_done += 1
+        except Exception as e:
+            print('Warning: unit %d failed: %r' % (unit_id, e))
+            fail_unit(conn, unit_id, owner, repr(e))
+    conn.close()
+    return num_done
+
+
+def queue_status(db_path):
+    conn = connect(db_path)
+    counts = dict(conn.execute('SELECT status, COUNT(*) FROM units GROUP BY status').fetchall())
+    failed = conn.execute("SELECT id, error FROM units WHERE status = 'failed'").fetchall()
+    conn.close()
+    return counts, failed
+
+
+def retry_failed(db_path):
+    conn = connect(db_path)
+    cur = conn.execute("UPDATE units SET status = 'pending', attempts = 0, owner = NULL, expires = NULL "
+                       "WHERE status = 'failed'")
+    conn.close()
+    return cur.rowcount
+
+
+def merge_results(db_path, outfile, allow_partial=False):
+    """ Combine the partial csvs with the input list, in the same format as get_stat.py """
+    conn = connect(db_path)
+    infile = conn.execute("SELECT value FROM meta WHERE key = 'infile'").fetchone()[0]
+    units = conn.execute("SELECT id, status FROM units ORDER BY id").fetchall()
+    conn.close()
+    not_done = [u for u, status in units if status != 'done']
+    if len(not_done) > 0 and not allow_partial:
+        print('Error: %d units are not done yet' % len(not_done))
+        return False
+
+    parts = [pd.read_csv(partial_path(db_path, u)) for u, status in units if status == 'done']
+    stats = pd.concat(parts, ignore_index=True).drop_duplicates('hash')
+    quarantined = stats[stats[QUARANTINE_COL].notna()]
+    if len(quarantined) > 0:
+        write_quarantine(outfile + '.quarantine.csv', quarantined[['hash', QUARANTINE_COL]].values.tolist())
+    stats = stats.drop(columns=[QUARANTINE_COL])
+    _, df = parse_cmit_list(infile)
+    df = df.drop(columns=[c for c in OUTPUT_COLUMNS if c in df.columns])
+    merged = df.merge(stats, on='hash', how='left')
+    merged.to_csv(outfile)
+    print('merged %d units (%d commits) into %s' % (len(parts), len(stats), outfile))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distribute get_stat extraction over workers on many hosts')
+    sub = parser.add_subparsers(dest='cmd')
+
+    p = sub.add_parser('init', help='split the input commits into work units')
+    p.add_argument('queue', type=str, help='queue database (sqlite) on a shared filesystem')
+    p.add_argument('infile', type=str, help='input file path containing the list of commits sha')
+    p.add_argument('--unit-size', type=int, default=DEFAULT_UNIT_SIZE, help='commits per unit')
+
+    p = sub.add_parser('worker', help='claim and extract units until none are left')
+    p.add_argument('queue', type=str)
+    p.add_argument('repo', type=str, help='path to the git repo on this host')
+    p.add_argument('--lease', type=int, default=DEFAULT_LEASE,
+                   help='seconds before an unrenewed unit goes to another worker')
+    p.add_argument('--no-wait', action='store_true',
+                   help='exit when nothing is claimable instead of waiting for leased units')
+    add_limit_args(p)
+
+    p = sub.add_parser('status', help='units per status')
+    p.add_argument('queue', type=str)
+
+    p = sub.add_parser('retry', help='put the failed units back into the queue')
+    p.add_argument('queue', type=str)
+
+    p = sub.add_parser('merge', help='combine the partial results into one csv')
+    p.add_argument('queue', type=str)
+    p.add_argument('outfile', type=str, help='output filename')
+    p.add_argument('--allow-partial', action='store_true', help='merge even if some units are not done')
+    args = parser.parse_args()
+
+    if args.cmd == 'init':
+        init_queue(args.queue, args.infile, args.unit_size)
+    elif args.cmd == 'worker':
+        num_done = run_worker(args.queue, args.repo, args.lease, wait=not args.no_wait,
+                              limits=limits_from_args(args))
+        print('finished %d units' % num_done)
+    elif args.cmd == 'status':
+        counts, failed = queue_status(args.queue)
+        for status in ['pending', 'leased', 'done', 'failed']:
+            print('%-8s %d' % (status, counts.get(status, 0)))
+        for unit_id, error in failed:
+            print('unit %d: %s' % (unit_id, error))
+    elif args.cmd == 'retry':
+        print('%d units back in the queue' % retry_failed(args.queue))
+    elif args.cmd == 'merge':
+        if not merge_results(args.queue, args.outfile, args.allow_partial):
+            sys.exit(1)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()